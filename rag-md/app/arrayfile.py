@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import json
+import os
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Tuple, Union
+
+import numpy as np
+
+# Single-file container for a JSON header plus flat numpy arrays that are
+# memory-mapped on load: magic, header length, header (with array offsets),
+# then every array padded to 8 bytes. Used by the BM25 index, the local
+# vector store and the content / ColBERT stores.
+
+
+@dataclass
+class Chunked:
+    """An array written part by part (row blocks in order), for arrays too big to assemble in memory."""
+
+    dtype: np.dtype
+    shape: Tuple[int, ...]
+    parts: Iterable[np.ndarray]
+
+    @property
+    def nbytes(self) -> int:
+        return int(np.prod(self.shape)) * np.dtype(self.dtype).itemsize
+
+
+def save_arrays(path: Path, magic: bytes, header: Dict[str, Any],
+                arrays: Dict[str, Union[np.ndarray, Chunked]]) -> None:
+    """Write atomically, so a running service never maps a half-written file."""
+    specs: Dict[str, Tuple[int, str, Tuple[int, ...]]] = {}
+    pos = 0
+    for name, arr in arrays.items():
+        specs[name] = (pos, np.dtype(arr.dtype).str, tuple(int(n) for n in arr.shape))
+        pos += -(-arr.nbytes // 8) * 8
+    raw = json.dumps({**header, "arrays": specs}, ensure_ascii=False).encode("utf-8")
+    raw += b" " * (-(len(magic) + 8 + len(raw)) % 8)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("wb") as f:
+        f.write(magic + struct.pack("<Q", len(raw)) + raw)
+        for arr in arrays.values():
+            parts = arr.parts if isinstance(arr, Chunked) else [arr]
+            written = 0
+            for part in parts:
+                data = np.ascontiguousarray(part, dtype=arr.dtype).tobytes()
+                f.write(data)
+                written += len(data)
+            if written != arr.nbytes:
+                raise ValueError(f"Array of {arr.nbytes} bytes got {written}")
+            f.write(b"\0" * (-written % 8))
+    os.replace(tmp, path)
+
+
+def load_arrays(path: Path, magic: bytes) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    """Header and read-only memory-mapped arrays of a file written by :func:`save_arrays`."""
+    with path.open("rb") as f:
+        if f.read(len(magic)) != magic:
+            raise ValueError(f"Unexpected file format: {path}")
+        (size,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(size))
+    base = len(magic) + 8 + size
+    arrays: Dict[str, np.ndarray] = {}
+    for name, (offset, dtype, shape) in header.pop("arrays").items():
+        shape = tuple(shape) if isinstance(shape, list) else (shape,)
+        if 0 in shape:
+            arrays[name] = np.empty(shape, dtype=np.dtype(dtype))
+        else:
+            arrays[name] = np.memmap(path, dtype=np.dtype(dtype), mode="r", offset=base + offset, shape=shape)
+    return header, arrays
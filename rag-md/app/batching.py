@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, Generic, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """Coalesce concurrent single-item calls into one batched call on a worker thread.
+
+    Items submitted within ``max_wait_ms`` of the first queued item (or until
+    ``max_batch_size`` items are collected) are passed to ``fn`` together; each
+    caller gets back the result at its own position.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[List[T]], Sequence[R]],
+        *,
+        max_batch_size: int = 16,
+        max_wait_ms: float = 10.0,
+        executor: Optional[Executor] = None,
+    ) -> None:
+        self._fn = fn
+        self._max_batch_size = max(1, max_batch_size)
+        self._max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._executor = executor
+        self._queue: Optional[asyncio.Queue[Tuple[T, asyncio.Future[R]]]] = None
+        self._task: Optional[asyncio.Task[None]] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # counters
+        self._batches = 0
+        self._items = 0
+        self._wait_s = 0.0
+        self._run_s = 0.0
+
+    def _ensure_worker(self) -> asyncio.Queue[Tuple[T, asyncio.Future[R]]]:
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+        return self._queue
+
+    async def submit(self, item: T) -> R:
+        queue = self._ensure_worker()
+        fut: asyncio.Future[R] = asyncio.get_running_loop().create_future()
+        await queue.put((item, fut))
+        return await fut
+
+    async def _run(self) -> None:
+        assert self._queue is not None
+        queue = self._queue
+        loop = asyncio.get_running_loop()
+        while True:
+            first = await queue.get()
+            batch = [first]
+            t_first = time.perf_counter()
+            deadline = loop.time() + self._max_wait
+            while len(batch) < self._max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    # drain whatever is already queued without waiting
+                    try:
+                        batch.append(queue.get_nowait())
+                        continue
+                    except asyncio.QueueEmpty:
+                        break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            batch = [(item, fut) for item, fut in batch if not fut.cancelled()]
+            if not batch:
+                continue
+            t_start = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self._executor, self._fn, [i for i, _ in batch])
+            except Exception as e:  # noqa: BLE001
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            finally:
+                self._batches += 1
+                self._items += len(batch)
+                self._wait_s += t_start - t_first
+                self._run_s += time.perf_counter() - t_start
+            for (_, fut), res in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(res)
+
+    def stats(self) -> Dict[str, Any]:
+        batches = self._batches
+        return {
+            "batches": batches,
+            "items": self._items,
+            "max_batch_size": self._max_batch_size,
+            "max_wait_ms": self._max_wait * 1000.0,
+            "avg_batch_size": (self._items / batches) if batches else 0.0,
+            "fill_ratio": (self._items / (batches * self._max_batch_size)) if batches else 0.0,
+            "avg_wait_ms": (self._wait_s / batches * 1000.0) if batches else 0.0,
+            "avg_run_ms": (self._run_s / batches * 1000.0) if batches else 0.0,
+        }
@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .config import get_settings
+from .metrics import CACHE_LOOKUPS
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def make_key(kind: str, **parts: Any) -> str:
+    """Stable cache key for a request; ``query`` is normalized before hashing."""
+    if "query" in parts:
+        parts["query"] = normalize_query(parts["query"])
+    raw = json.dumps({"kind": kind, **parts}, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# Collection version markers: ingest bumps the marker after writing to a collection,
+# which invalidates every cache entry stored under the previous version.
+
+def _version_path(collection: str) -> Path:
+    return Path(get_settings().data_dir) / "versions" / collection
+
+
+_VERSIONS: Dict[str, Tuple[Tuple[int, int], str]] = {}
+
+
+def collection_version(collection: str) -> str:
+    path = _version_path(collection)
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return "0"
+    # bumps replace the file, so inode + mtime identify its content without reading it
+    stamp = (st.st_ino, st.st_mtime_ns)
+    cached = _VERSIONS.get(collection)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    version = path.read_text(encoding="utf-8").strip() or "0"
+    _VERSIONS[collection] = (stamp, version)
+    return version
+
+
+def bump_collection_version(collection: str) -> str:
+    path = _version_path(collection)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    version = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(version, encoding="utf-8")
+    tmp.replace(path)
+    return version
+
+
+class QueryCache:
+    """In-process LRU with TTL, optionally backed by a SQLite tier that survives restarts.
+
+    Entries are stored together with the collection version they were computed
+    against and are treated as misses once the version changes.
+    """
+
+    def __init__(self, *, max_entries: int = 1024, ttl_s: float = 3600.0,
+                 sqlite_path: Optional[str] = None) -> None:
+        self._max_entries = max_entries
+        self._ttl_s = ttl_s
+        self._mem: "OrderedDict[str, Tuple[float, str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if sqlite_path:
+            Path(sqlite_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, version TEXT NOT NULL, expires_at REAL NOT NULL, "
+                "value TEXT NOT NULL)"
+            )
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "sets": 0, "evictions": 0}
+
+    def get(self, key: str, version: str) -> Tuple[Optional[Any], Optional[str]]:
+        """Return ``(value, tier)``; ``tier`` is ``"memory"``/``"disk"`` or None on a miss."""
+        now = time.time()
+        with self._lock:
+            item = self._mem.get(key)
+            if item is not None:
+                expires_at, ver, value = item
+                if expires_at > now and ver == version:
+                    self._mem.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    CACHE_LOOKUPS.labels("query", "memory").inc()
+                    return value, "memory"
+                del self._mem[key]
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT version, expires_at, value FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    ver, expires_at, raw = row
+                    if expires_at > now and ver == version:
+                        value = json.loads(raw)
+                        self._put_mem(key, (expires_at, ver, value))
+                        self._counters["disk_hits"] += 1
+                        CACHE_LOOKUPS.labels("query", "disk").inc()
+                        return value, "disk"
+                    self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._counters["misses"] += 1
+            CACHE_LOOKUPS.labels("query", "miss").inc()
+            return None, None
+
+    def set(self, key: str, version: str, value: Any) -> None:
+        expires_at = time.time() + self._ttl_s
+        with self._lock:
+            self._put_mem(key, (expires_at, version, value))
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO entries (key, version, expires_at, value) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, version, expires_at, json.dumps(value, ensure_ascii=False, default=str)),
+                )
+            self._counters["sets"] += 1
+
+    def _put_mem(self, key: str, item: Tuple[float, str, Any]) -> None:
+        self._mem[key] = item
+        self._mem.move_to_end(key)
+        while len(self._mem) > self._max_entries:
+            self._mem.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._mem.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM entries")
+
+    def stats(self) -> Dict[str, Any]:
+        c = dict(self._counters)
+        hits = c["memory_hits"] + c["disk_hits"]
+        lookups = hits + c["misses"]
+        return {
+            **c,
+            "hits": hits,
+            "lookups": lookups,
+            "hit_rate": (hits / lookups) if lookups else 0.0,
+            "entries": len(self._mem),
+            "disk_tier": self._db is not None,
+        }
+
+
+@lru_cache(maxsize=1)
+def get_query_cache() -> QueryCache:
+    cfg = get_settings()
+    return QueryCache(
+        max_entries=cfg.cache_max_entries,
+        ttl_s=cfg.cache_ttl_s,
+        sqlite_path=cfg.cache_sqlite_path,
+    )
+
+
+class SemanticCache:
+    """Answers keyed by query embedding: a paraphrase of a cached question is a hit.
+
+    Embeddings (L2-normalized) live in one preallocated float32 matrix, so a
+    lookup is a single matrix-vector product. A hit needs cosine similarity of
+    at least ``threshold`` and the same ``scope`` (everything in the request
+    except the query text: filters, top_k, collection, ...). Entries computed
+    against an older collection version are dropped; the least recently used
+    entry makes room for a new one.
+    """
+
+    def __init__(self, *, max_entries: int = 2048, threshold: float = 0.92) -> None:
+        self._max_entries = max(1, max_entries)
+        self.threshold = threshold
+        self._matrix: Optional[np.ndarray] = None
+        self._used = np.zeros(self._max_entries, dtype=np.int64)  # 0 = free slot
+        self._scopes: List[Optional[str]] = [None] * self._max_entries
+        self._versions: List[Optional[str]] = [None] * self._max_entries
+        self._values: List[Any] = [None] * self._max_entries
+        self._llm_ms = np.zeros(self._max_entries, dtype=np.float64)
+        self._tick = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "sets": 0, "evictions": 0, "invalidated": 0}
+        self._saved_llm_ms = 0.0
+
+    def _invalidate(self, version: str) -> None:
+        for i in np.flatnonzero(self._used):
+            if self._versions[i] != version:
+                self._free(int(i))
+                self._counters["invalidated"] += 1
+
+    def _free(self, i: int) -> None:
+        self._used[i] = 0
+        self._scopes[i] = self._versions[i] = self._values[i] = None
+
+    def get(self, vector: Sequence[float], scope: str, version: str) -> Tuple[Optional[Any], float]:
+        """Return ``(value, similarity)`` of the closest entry in ``scope``; value is None on a miss."""
+        with self._lock:
+            if self._matrix is None or not self._used.any():
+                self._counters["misses"] += 1
+                CACHE_LOOKUPS.labels("semantic", "miss").inc()
+                return None, 0.0
+            self._invalidate(version)
+            sims = self._matrix @ np.asarray(vector, dtype=np.float32)
+            live = (self._used > 0) & np.array([s == scope for s in self._scopes])
+            sims = np.where(live, sims, -np.inf)
+            i = int(np.argmax(sims))
+            best = float(sims[i])
+            if best < self.threshold:
+                self._counters["misses"] += 1
+                CACHE_LOOKUPS.labels("semantic", "miss").inc()
+                return None, max(best, 0.0)
+            self._tick += 1
+            self._used[i] = self._tick
+            self._counters["hits"] += 1
+            CACHE_LOOKUPS.labels("semantic", "hit").inc()
+            self._saved_llm_ms += float(self._llm_ms[i])
+            return self._values[i], best
+
+    def set(self, vector: Sequence[float], scope: str, version: str, value: Any, *, llm_ms: float = 0.0) -> None:
+        vec = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != vec.shape[0]:
+                self._matrix = np.zeros((self._max_entries, vec.shape[0]), dtype=np.float32)
+                self._used[:] = 0
+            self._invalidate(version)
+            free = np.flatnonzero(self._used == 0)
+            if free.size:
+                i = int(free[0])
+            else:
+                i = int(np.argmin(self._used))
+                self._counters["evictions"] += 1
+            self._tick += 1
+            self._matrix[i] = vec
+            self._used[i] = self._tick
+            self._scopes[i], self._versions[i], self._values[i] = scope, version, value
+            self._llm_ms[i] = llm_ms
+            self._counters["sets"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            for i in range(self._max_entries):
+                self._free(i)
+
+    def stats(self) -> Dict[str, Any]:
+        c = dict(self._counters)
+        lookups = c["hits"] + c["misses"]
+        return {
+            **c,
+            "lookups": lookups,
+            "hit_rate": (c["hits"] / lookups) if lookups else 0.0,
+            "entries": int(np.count_nonzero(self._used)),
+            "threshold": self.threshold,
+            "saved_llm_ms": round(self._saved_llm_ms, 1),
+        }
+
+
+@lru_cache(maxsize=1)
+def get_semantic_cache() -> SemanticCache:
+    cfg = get_settings()
+    return SemanticCache(max_entries=cfg.semantic_cache_max_entries, threshold=cfg.semantic_cache_threshold)
@@ -1,20 +1,111 @@
 from __future__ import annotations
 
 import re
-from typing import Dict, Iterable, List, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import tiktoken
 
 from .md_loader import MDSection
-from .utils import count_tokens, trim_text_tokens
+from .utils import get_tokenizer
 
 
 _SENT_SPLIT_RE = re.compile(r"(?<=[.!?])\s+")
+_SEP = "\n\n"
+
+
+class _TokenCounter:
+    """Exact token ids/counts for chunking, tokenizing every paragraph only once.
+
+    A chunk is ``"\n\n".join(parts)``. With the tiktoken pre-tokenizer the separator can
+    only merge with the tail of the part before it, never with the head of the part
+    after it, so the ids of a chunk are the memoized ids of its parts with only the
+    last few characters of each part re-encoded together with the separator. Sizing,
+    overlap and trimming therefore never re-tokenize a whole chunk.
+    """
+
+    def __init__(self, enc: Optional[tiktoken.Encoding] = None) -> None:
+        self._enc = enc or get_tokenizer()
+        self._ids: Dict[str, List[int]] = {}
+        self._tails: Dict[str, Tuple[int, List[int]]] = {}
+
+    def ids(self, text: str) -> List[int]:
+        ids = self._ids.get(text)
+        if ids is None:
+            ids = self._enc.encode(text)
+            self._ids[text] = ids
+        return ids
+
+    def count(self, text: str) -> int:
+        return len(self.ids(text))
+
+    def _tail(self, text: str) -> Tuple[int, List[int]]:
+        """``(n, ids)``: ``text`` ends with ``n`` tokens that re-encode as ``ids`` when the
+        separator is appended."""
+        tail = self._tails.get(text)
+        if tail is None:
+            s = text[_tail_start(text):]
+            tail = (len(self._enc.encode_ordinary(s)), self._enc.encode_ordinary(s + _SEP))
+            self._tails[text] = tail
+        return tail
+
+    def _composable(self, parts: List[str]) -> bool:
+        # leading/trailing whitespace would be stripped or merge across the separator
+        return all(p and not p[0].isspace() and not p[-1].isspace() for p in parts)
+
+    def count_joined(self, parts: List[str]) -> int:
+        """Token count of ``"\n\n".join(parts).strip()``."""
+        if not self._composable(parts):
+            return self.count(_SEP.join(parts).strip())
+        total = sum(self.count(p) for p in parts)
+        for p in parts[:-1]:
+            n, joined = self._tail(p)
+            total += len(joined) - n
+        return total
+
+    def joined_ids(self, parts: List[str]) -> List[int]:
+        """Token ids of ``"\n\n".join(parts).strip()``."""
+        if not self._composable(parts):
+            return self.ids(_SEP.join(parts).strip())
+        out: List[int] = []
+        for p in parts[:-1]:
+            ids = self.ids(p)
+            n, joined = self._tail(p)
+            out.extend(ids[: len(ids) - n])
+            out.extend(joined)
+        out.extend(self.ids(parts[-1]))
+        return out
+
+    def decode(self, ids: List[int]) -> str:
+        return self._enc.decode(ids)
+
+
+def _tail_start(text: str) -> int:
+    """Index of a pre-token boundary near the end of ``text`` (no trailing whitespace).
+
+    A boundary always follows the last newline (the text continues with a non-space
+    char) and always precedes a space whose left neighbour is not whitespace.
+    """
+    start = max(text.rfind("\n"), text.rfind("\r")) + 1
+    sp = text.rfind(" ", start)
+    while sp > start:
+        if not text[sp - 1].isspace():
+            return sp
+        sp = text.rfind(" ", start, sp)
+    return start
 
 
 def chunk_sections(
     sections: Iterable[MDSection], *, target_tokens_min: int = 500, target_tokens_max: int = 800,
     overlap_tokens: int = 100,
-) -> List[Tuple[str, Dict[str, str]]]:
-    chunks: List[Tuple[str, Dict[str, str]]] = []
+) -> List[Tuple[str, Dict[str, Any]]]:
+    """Split sections into ~``target_tokens_min``..``target_tokens_max`` token chunks.
+
+    Each chunk's meta carries its exact ``token_count``, so the context packer
+    never has to tokenize chunks at request time.
+    """
+    chunks: List[Tuple[str, Dict[str, Any]]] = []
+    counter = _TokenCounter()
+    count_tokens = counter.count
     for sec in sections:
         text = sec.text
         paragraphs = _split_preserving_blocks(text)
@@ -25,9 +116,11 @@ def chunk_sections(
             nonlocal current, current_tokens
             if not current:
                 return
-            content = "\n\n".join(current).strip()
-            if count_tokens(content) > target_tokens_max:
-                content = trim_text_tokens(content, target_tokens_max)
+            content = _SEP.join(current).strip()
+            n_tokens = counter.count_joined(current)
+            if n_tokens > target_tokens_max:
+                content = counter.decode(counter.joined_ids(current)[:target_tokens_max])
+                n_tokens = counter.count(content)
             if not content:
                 current = []
                 current_tokens = 0
@@ -38,6 +131,7 @@ def chunk_sections(
                 "section": sec.section or "",
                 "anchor": sec.anchor or "",
                 **sec.meta,
+                "token_count": n_tokens,
             }
             chunks.append((content, meta))
 
@@ -50,7 +144,7 @@ def chunk_sections(
                     back.append(para)
                     t += n
                 current = list(reversed(back))
-                current_tokens = sum(count_tokens(p) for p in current)
+                current_tokens = t
             else:
                 current = []
                 current_tokens = 0
@@ -66,7 +160,7 @@ def chunk_sections(
                     current_tokens = n
                     push_chunk()
                     continue
-                pieces = _split_text_to_max_tokens(para, target_tokens_max)
+                pieces = _split_text_to_max_tokens(para, target_tokens_max, counter)
                 for piece in pieces:
                     pn = count_tokens(piece)
                     while current and current_tokens + pn > target_tokens_max:
@@ -104,7 +198,7 @@ def _is_code_or_table_block(block: str) -> bool:
     return leading_pipes >= max(2, len(lines) // 2)
 
 
-def _split_text_to_max_tokens(text: str, max_tokens: int) -> List[str]:
+def _split_text_to_max_tokens(text: str, max_tokens: int, counter: _TokenCounter) -> List[str]:
     sentences = _SENT_SPLIT_RE.split(text)
     out: List[str] = []
     buf: List[str] = []
@@ -113,7 +207,7 @@ def _split_text_to_max_tokens(text: str, max_tokens: int) -> List[str]:
         s = s.strip()
         if not s:
             continue
-        n = count_tokens(s)
+        n = counter.count(s)
         if n >= max_tokens:
             parts = _hard_wrap_by_tokens(s, max_tokens)
             for p in parts:
@@ -8,32 +8,126 @@ class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
 
     log_level: str = "INFO"
+    # Load and warm the models, Qdrant and LLM connections at startup; /ready reports
+    # 503 until that has finished. Off: nothing is preloaded and /ready is always 200.
+    warmup_enabled: bool = True
+    # Period of the event-loop lag probe behind rag_event_loop_lag_seconds (0: off)
+    loop_lag_interval_ms: float = 100.0
 
     # Qdrant
     qdrant_url: str = "http://localhost:6333"
     qdrant_api_key: str | None = None
     qdrant_collection: str = "api_docs"
+    qdrant_pool_size: int = 32
+    # Vector store: "qdrant", or "local" for in-process exact search over a file per
+    # collection under DATA_DIR/vectors (written by ingest; for corpora up to ~100k chunks)
+    vector_store: str = "qdrant"
+    # On-disk vector precision of the local store: float16 | int8
+    local_vector_dtype: str = "float16"
+    # Ingest keeps chunk texts out of the vector store: points carry only a text_hash
+    # and filterable fields, texts go to a zstd content store under DATA_DIR/content
+    # and are read back only for the chunks a response uses (needs the `slim` extra)
+    slim_payloads: bool = False
 
     # Embeddings
     embedding_model: str = "BAAI/bge-m3"
     embedding_device: str = "cpu"
+    # Query embedding micro-batching: queries arriving within the wait window
+    # (or until the batch is full) share one encode call
+    embed_batch_enabled: bool = True
+    embed_batch_max_size: int = 16
+    embed_batch_max_wait_ms: float = 10.0
+
+    # Retrieval: "dense" (Qdrant only, the default) or "hybrid" (dense + local BM25 index
+    # built by ingest, fused with reciprocal rank fusion; falls back to dense if no index
+    # exists), or "m3": dense + bge-m3 learned sparse vectors (stored by ingest --m3), RRF-fused
+    retrieval_mode: str = "dense"
+    hybrid_rrf_k: int = 60
+    # m3 mode: with_rerank rescores the best M3_CANDIDATES fused hits by ColBERT late
+    # interaction over the token vectors ingest --m3 keeps under DATA_DIR/m3, instead of
+    # running the cross-encoder over the head of the list
+    m3_colbert_rerank: bool = True
+    m3_candidates: int = 100
 
     # Reranker
     reranker_model: str | None = "BAAI/bge-reranker-large"
     reranker_device: str = "cpu"
     enable_rerank: bool = True
+    # Only the leading RERANK_TOP_N candidates are reranked; past RERANK_MIN_N the list is
+    # cut where the retrieval score drops more than RERANK_SCORE_GAP below the best one
+    rerank_top_n: int = 16
+    rerank_min_n: int = 6
+    rerank_score_gap: float = 0.25
+    # (query, passage) pairs are truncated to this many model tokens
+    rerank_max_tokens: int = 320
+    rerank_batch_max_size: int = 32
+    rerank_batch_max_wait_ms: float = 5.0
+    rerank_cache_entries: int = 4096
+
+    # Worker threads for model inference off the event loop
+    inference_workers: int = 2
+    # Embedder/reranker runtime: "torch", "onnx" or "onnx-int8" (ONNX Runtime with dynamic
+    # int8 quantization; needs the `onnx` extra). Exports are cached under DATA_DIR/onnx.
+    inference_backend: str = "torch"
+    # ONNX Runtime int8 kernels to target: arm64 | avx2 | avx512 | avx512_vnni
+    onnx_quantization: str = "avx2"
 
     # LLM (OpenAI-like first)
     openai_base_url: str | None = None
     openai_api_key: str | None = None
     openai_model: str | None = "mistralai/Mistral-7B-Instruct-v0.2"
+    # Max concurrent requests to the backend; further calls wait in line
+    openai_max_concurrency: int = 8
 
     # llama.cpp server
     llama_base_url: str | None = None
     llama_model: str | None = "mistral"
+    # Keep at or below the server's --parallel slots
+    llama_max_concurrency: int = 2
+    llama_pool_size: int = 8
+    llama_http2: bool = False
+    llama_timeout_s: float = 600.0
+    # Keep each slot's KV cache between requests so the shared system prompt is reused;
+    # with slot affinity requests are also pinned to idle slots via id_slot
+    llama_cache_prompt: bool = True
+    llama_slot_affinity: bool = False
+    # More llama.cpp servers (comma-separated URLs) to balance over together with LLAMA_BASE_URL
+    llama_base_urls: str | None = None
+    # Routing across several servers: "least_outstanding" or "ewma" (latency EWMA x queue length);
+    # a server failing LLM_BREAKER_FAILURES times in a row or its /health check is skipped
+    # for LLM_BREAKER_COOLDOWN_S, then gets one trial request
+    llm_routing: str = "least_outstanding"
+    llm_health_interval_s: float = 10.0
+    llm_breaker_failures: int = 3
+    llm_breaker_cooldown_s: float = 30.0
+
+    # Query result cache for /search and /answer (memory LRU + optional SQLite tier)
+    cache_enabled: bool = True
+    cache_max_entries: int = 1024
+    cache_ttl_s: float = 3600.0
+    cache_sqlite_path: str | None = None
+    # Semantic /answer cache: a question whose embedding has cosine similarity >= the
+    # threshold with a cached one (same filters/options) gets that answer without
+    # retrieval or LLM. Cleared when the collection is re-ingested.
+    semantic_cache_enabled: bool = False
+    semantic_cache_threshold: float = 0.92
+    semantic_cache_max_entries: int = 2048
+
+    # /answer_async job queue: JOBS_WORKERS coroutines drain a priority queue capped at
+    # JOBS_MAX_PENDING waiting jobs (more get HTTP 429); finished jobs are kept JOBS_TTL_S.
+    # With JOBS_SQLITE_PATH jobs survive restarts and are shared by all uvicorn workers;
+    # a running job whose worker died is retried after JOBS_LEASE_S.
+    jobs_workers: int = 4
+    jobs_max_pending: int = 100
+    jobs_ttl_s: float = 3600.0
+    jobs_sqlite_path: str | None = None
+    jobs_lease_s: float = 900.0
+    jobs_poll_interval_s: float = 0.5
 
     # General
     default_language: str = "ru"
+    # Local state (collection version markers, caches)
+    data_dir: str = "data"
 
 
 @lru_cache(maxsize=1)
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .arrayfile import load_arrays, save_arrays
+from .config import get_settings
+
+# Chunk texts kept out of the vector store (SLIM_PAYLOADS): each text is stored once
+# under the hash of its content, zstd-compressed with a dictionary trained on the
+# collection's own chunks, in one memory-mapped file per collection. Points carry
+# only ``text_hash``; the API decompresses the texts of the chunks it actually uses.
+# Needs the `slim` extra (zstandard).
+
+_MAGIC = b"RAGTXT01"
+_DICT_SIZE = 64 * 1024
+# below this many texts a trained dictionary does not pay for its own size
+_DICT_MIN_TEXTS = 64
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def content_path(collection: str) -> Path:
+    return Path(get_settings().data_dir) / "content" / f"{collection}.zst"
+
+
+class ContentStore:
+    """Read side: decompresses texts by hash from a memory-mapped file."""
+
+    def __init__(self, header: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> None:
+        import zstandard as zstd
+
+        self.keys: List[str] = header["keys"]
+        self._pos = {k: i for i, k in enumerate(self.keys)}
+        self._offsets = np.asarray(arrays["offsets"])
+        self._blob = np.asarray(arrays["blob"])
+        zdict = np.asarray(arrays["zdict"]).tobytes()
+        self._dctx = zstd.ZstdDecompressor(dict_data=zstd.ZstdCompressionDict(zdict) if zdict else None)
+        self._lock = threading.Lock()  # a ZstdDecompressor is not thread-safe
+
+    @classmethod
+    def load(cls, path: Path) -> "ContentStore":
+        return cls(*load_arrays(path, _MAGIC))
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def get_many(self, hashes: Iterable[str]) -> Dict[str, str]:
+        out: Dict[str, str] = {}
+        with self._lock:
+            for h in hashes:
+                i = self._pos.get(h)
+                if i is not None and h not in out:
+                    frame = self._blob[self._offsets[i] : self._offsets[i + 1]].tobytes()
+                    out[h] = self._dctx.decompress(frame).decode("utf-8")
+        return out
+
+
+class ContentWriter:
+    """Write side used by ingest: collects texts, then rewrites the file with only the live ones."""
+
+    def __init__(self, path: Path, *, level: int = 9, fresh: bool = False) -> None:
+        self.path = path
+        self.level = level
+        self._texts: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        if not fresh and path.exists():
+            old = ContentStore.load(path)
+            self._texts = old.get_many(old.keys)
+
+    def put(self, text: str) -> str:
+        h = text_hash(text)
+        with self._lock:
+            self._texts.setdefault(h, text)
+        return h
+
+    def slim(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """``payload`` with its text replaced by the hash it is stored under."""
+        if "text" not in payload:
+            return payload
+        slim = {k: v for k, v in payload.items() if k != "text"}
+        slim["text_hash"] = self.put(payload["text"])
+        return slim
+
+    def save(self, live: Optional[Iterable[str]] = None) -> Tuple[int, int]:
+        """Write the texts whose hash is in ``live`` (all if None) atomically.
+
+        Returns (texts, compressed bytes).
+        """
+        import zstandard as zstd
+
+        with self._lock:
+            if live is not None:
+                keep = set(live)
+                self._texts = {h: t for h, t in self._texts.items() if h in keep}
+            keys = sorted(self._texts)
+            raw = [self._texts[h].encode("utf-8") for h in keys]
+        zdict = zstd.train_dictionary(_DICT_SIZE, raw, level=self.level) if len(raw) >= _DICT_MIN_TEXTS else None
+        cctx = zstd.ZstdCompressor(level=self.level, dict_data=zdict, write_content_size=True,
+                                   write_dict_id=False, write_checksum=False)
+        frames = [cctx.compress(r) for r in raw]
+        offsets = np.zeros(len(frames) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(f) for f in frames])
+        arrays = {
+            "offsets": offsets,
+            "blob": np.frombuffer(b"".join(frames), dtype=np.uint8),
+            "zdict": np.frombuffer(zdict.as_bytes() if zdict else b"", dtype=np.uint8),
+        }
+        save_arrays(self.path, _MAGIC, {"keys": keys}, arrays)
+        return len(keys), int(offsets[-1])
+
+
+_STORES: Dict[str, Tuple[Tuple[int, int], ContentStore]] = {}
+_LOCK = threading.Lock()
+
+
+def get_content_store(collection: str) -> Optional[ContentStore]:
+    """The collection's texts, reloaded when ingest replaces the file; None if there are none."""
+    path = content_path(collection)
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    stamp = (st.st_ino, st.st_mtime_ns)
+    cached = _STORES.get(collection)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    with _LOCK:
+        cached = _STORES.get(collection)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        store = ContentStore.load(path)
+        _STORES[collection] = (stamp, store)
+        return store
+
+
+def hydrate_texts(results: Sequence[Dict[str, Any]], collection: str) -> None:
+    """Fill in ``text`` of results from slim points from the content store, in place."""
+    pending = [r for r in results if r.get("text") is None and r.get("text_hash")]
+    store = get_content_store(collection) if pending else None
+    if store is None:
+        return
+    texts = store.get_many(r["text_hash"] for r in pending)
+    for r in pending:
+        if r["text_hash"] in texts:
+            r["text"] = texts[r["text_hash"]]
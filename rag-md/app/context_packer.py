@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+from .utils import count_tokens
+
+_SEP = "\n\n"
+
+
+@dataclass
+class PackedContext:
+    text: str
+    tokens: int
+    # chunks that made it into the context, grouped per (source, anchor) section
+    groups: List[List[Dict[str, Any]]] = field(default_factory=list)
+
+
+def chunk_tokens(chunk: Dict[str, Any]) -> int:
+    """Token count stored at ingest; chunks ingested before it existed are counted here."""
+    n = chunk.get("token_count")
+    return int(n) if n is not None else count_tokens(chunk["text"])
+
+
+def _title(chunk: Dict[str, Any]) -> str:
+    return chunk.get("section") or chunk.get("title") or ""
+
+
+@lru_cache(maxsize=4096)
+def _header_tokens(title: str) -> int:
+    # "## title" plus the separator before the chunk text; titles repeat, so this is cached
+    return count_tokens(f"## {title}{_SEP}") if title else 0
+
+
+def _words(text: str) -> FrozenSet[str]:
+    # whitespace tokens: punctuation stays attached, which is fine for spotting copies
+    return frozenset(text.lower().split())
+
+
+def _drop_near_duplicates(chunks: Sequence[Dict[str, Any]], threshold: float) -> List[int]:
+    """Indices of chunks to keep: a chunk whose words are mostly (``threshold``) contained
+    in a better-ranked chunk is dropped."""
+    kept: List[Tuple[int, FrozenSet[str]]] = []
+    for i, c in enumerate(chunks):
+        words = _words(c["text"])
+        dup = any(
+            words and other and len(words & other) / min(len(words), len(other)) >= threshold
+            for _, other in kept
+        )
+        if not dup:
+            kept.append((i, words))
+    return [i for i, _ in kept]
+
+
+def _select(costs: Sequence[int], scores: Sequence[float], budget: int) -> List[int]:
+    """Greedy 0/1 knapsack by score per token, checked against the best single chunk.
+
+    The better of the two is at least half the optimum, and with a handful of
+    candidates it is almost always the optimum itself.
+    """
+    order = sorted(range(len(costs)), key=lambda i: scores[i] / max(costs[i], 1), reverse=True)
+    chosen: List[int] = []
+    used = 0
+    for i in order:
+        if used + costs[i] <= budget:
+            chosen.append(i)
+            used += costs[i]
+    fitting = [i for i in range(len(costs)) if costs[i] <= budget]
+    if fitting:
+        best = max(fitting, key=lambda i: scores[i])
+        if scores[best] > sum(scores[i] for i in chosen):
+            chosen = [best]
+    return sorted(chosen)
+
+
+def _overlap_paragraphs(head: List[str], tail: List[str]) -> int:
+    """Paragraphs at the start of ``tail`` that repeat the end of ``head`` (chunk overlap)."""
+    for k in range(min(len(head), len(tail)) - 1, 0, -1):
+        if head[-k:] == tail[:k]:
+            return k
+    return 0
+
+
+def _merge_section(chunks: List[Dict[str, Any]]) -> Tuple[str, int]:
+    """Join chunks of one section, dropping the paragraphs adjacent chunks share.
+
+    Returns the text and the estimated tokens saved (the dropped share of each
+    chunk's stored count).
+    """
+    paras = chunks[0]["text"].split(_SEP)
+    saved = 0
+    for c in chunks[1:]:
+        nxt = c["text"].split(_SEP)
+        k = _overlap_paragraphs(paras, nxt)
+        if not k:
+            k_rev = _overlap_paragraphs(nxt, paras)
+            if k_rev:  # ``c`` comes before what we have
+                dropped = _SEP.join(nxt[-k_rev:])
+                paras = nxt + paras[k_rev:]
+                saved += chunk_tokens(c) * len(dropped) // max(len(c["text"]), 1)
+                continue
+        dropped = _SEP.join(nxt[:k])
+        saved += chunk_tokens(c) * len(dropped) // max(len(c["text"]), 1)
+        paras.extend(nxt[k:])
+    return _SEP.join(paras), saved
+
+
+def pack_context(
+    results: Sequence[Dict[str, Any]],
+    max_tokens: int,
+    *,
+    dup_threshold: float = 0.9,
+) -> PackedContext:
+    """Fit the most relevant chunks into ``max_tokens`` using their stored token counts.
+
+    Near-duplicates are dropped, the remaining chunks are chosen by score per
+    token, and chunks of the same section are merged under one heading with
+    their overlap removed. Sections appear in the order of their best-ranked
+    chunk. Nothing is tokenized except (cached) section titles and chunks
+    without a stored count.
+    """
+    keep = _drop_near_duplicates(results, dup_threshold)
+    cands = [results[i] for i in keep]
+    costs = [chunk_tokens(c) + _header_tokens(_title(c)) for c in cands]
+    scores = [max(float(c.get("score") or 0.0), 1e-6) for c in cands]
+    chosen = [cands[i] for i in _select(costs, scores, max_tokens)]
+
+    groups: Dict[Tuple[str, Optional[str]], List[Dict[str, Any]]] = {}
+    for c in chosen:
+        groups.setdefault((c["source"], c.get("anchor")), []).append(c)
+
+    parts: List[str] = []
+    tokens = 0
+    for members in groups.values():
+        title = _title(members[0])
+        body, saved = _merge_section(members)
+        header = f"## {title}" if title else ""
+        parts.append(_SEP.join([header, body]).strip())
+        tokens += _header_tokens(title) + sum(chunk_tokens(c) for c in members) - saved
+    return PackedContext(text=_SEP.join(parts), tokens=tokens, groups=list(groups.values()))
@@ -1,16 +1,31 @@
 from __future__ import annotations
 
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
-from typing import Optional
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, List, Optional, Type, TypeVar
 
-from qdrant_client import QdrantClient
+import httpx
+from qdrant_client import AsyncQdrantClient, QdrantClient
 from qdrant_client.models import Distance, VectorParams
-from sentence_transformers import CrossEncoder, SentenceTransformer
 
 from .config import get_settings
 from .llm_client.base import LLMClient
+from .llm_client.limited import ConcurrencyLimitedClient
 from .llm_client.llama_cpp import LlamaCppClient
 from .llm_client.openai_like import OpenAILikeClient
+from .llm_client.router import Backend, LLMRouter
+from .m3 import M3Heads
+from .vectorstore.base import VectorStore
+from .vectorstore.local import LocalVectorStore
+from .vectorstore.qdrant import QdrantStore
+
+if TYPE_CHECKING:
+    # sentence_transformers pulls in torch (seconds to import); it is imported
+    # where a model is actually loaded, so CLI tools and tests start fast
+    from sentence_transformers import CrossEncoder, SentenceTransformer
 
 
 @lru_cache(maxsize=1)
@@ -19,30 +34,165 @@ def get_qdrant() -> QdrantClient:
     return QdrantClient(url=cfg.qdrant_url, api_key=cfg.qdrant_api_key)
 
 
+@lru_cache(maxsize=1)
+def get_async_qdrant() -> AsyncQdrantClient:
+    cfg = get_settings()
+    return AsyncQdrantClient(
+        url=cfg.qdrant_url,
+        api_key=cfg.qdrant_api_key,
+        limits=httpx.Limits(max_connections=cfg.qdrant_pool_size),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_vector_store() -> VectorStore:
+    cfg = get_settings()
+    if cfg.vector_store == "local":
+        return LocalVectorStore(Path(cfg.data_dir) / "vectors", dtype=cfg.local_vector_dtype)
+    if cfg.vector_store != "qdrant":
+        raise ValueError(f"Unknown vector store: {cfg.vector_store}")
+    return QdrantStore(get_qdrant(), get_async_qdrant())
+
+
+@lru_cache(maxsize=1)
+def get_inference_executor() -> ThreadPoolExecutor:
+    # Bounded pool for CPU model inference (embedding, rerank) so it never runs
+    # on the event loop thread; torch releases the GIL inside forward passes.
+    cfg = get_settings()
+    return ThreadPoolExecutor(max_workers=cfg.inference_workers, thread_name_prefix="inference")
+
+
+M = TypeVar("M", "SentenceTransformer", "CrossEncoder")
+
+INFERENCE_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def _onnx_dir(model_name: str, backend: str) -> Path:
+    # one export per backend: switching between onnx and onnx-int8 keeps both
+    return Path(get_settings().data_dir) / "onnx" / model_name.replace("/", "--") / backend
+
+
+def _onnx_file(backend: str) -> str:
+    if backend == "onnx-int8":
+        return f"onnx/model_qint8_{get_settings().onnx_quantization}.onnx"
+    return "onnx/model.onnx"
+
+
+def _export_onnx(cls: Type[M], model_name: str, target: Path, backend: str, **kwargs: Any) -> None:
+    """Export ``model_name`` to ONNX (and int8-quantize it) into ``target``.
+
+    The export is written to a scratch directory and renamed into place, so
+    workers starting together never load a half-written model.
+    """
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    tmp = target.with_name(f"{target.name}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    model = cls(model_name, backend="onnx", **kwargs)
+    model.save(str(tmp))
+    if backend == "onnx-int8":
+        export_dynamic_quantized_onnx_model(model, get_settings().onnx_quantization, str(tmp))
+    try:
+        tmp.replace(target)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)  # another worker finished first
+        if not target.exists():
+            raise
+
+
+def load_model(cls: Type[M], model_name: str, *, backend: Optional[str] = None, **kwargs: Any) -> M:
+    """Load a SentenceTransformer/CrossEncoder on the configured inference backend.
+
+    ``torch`` loads the checkpoint as is. ``onnx`` and ``onnx-int8`` run it through
+    ONNX Runtime (the latter with dynamic int8 quantization); the exported model is
+    cached under ``<data_dir>/onnx/<model>/<backend>/`` and reused on later starts. Either way the
+    returned object has the usual ``encode``/``predict`` API.
+    """
+    backend = backend or get_settings().inference_backend
+    if backend not in INFERENCE_BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend}")
+    if backend == "torch":
+        return cls(model_name, **kwargs)
+    target = _onnx_dir(model_name, backend)
+    file_name = _onnx_file(backend)
+    if not (target / file_name).exists():
+        if target.exists():
+            shutil.rmtree(target)  # cached int8 export has another ONNX_QUANTIZATION: redo it
+        target.parent.mkdir(parents=True, exist_ok=True)
+        _export_onnx(cls, model_name, target, backend, **kwargs)
+    return cls(str(target), backend="onnx", model_kwargs={"file_name": file_name}, **kwargs)
+
+
 @lru_cache(maxsize=1)
 def get_embedder() -> SentenceTransformer:
+    from sentence_transformers import SentenceTransformer
+
     cfg = get_settings()
-    model = SentenceTransformer(cfg.embedding_model, device=cfg.embedding_device)
+    model = load_model(SentenceTransformer, cfg.embedding_model, device=cfg.embedding_device)
     # important for bge-m3: normalize embeddings on encode
     return model
 
 
+@lru_cache(maxsize=1)
+def get_m3_heads() -> M3Heads:
+    """bge-m3's sparse and ColBERT heads, applied on top of :func:`get_embedder`."""
+    return M3Heads.load(get_settings().embedding_model, get_embedder().tokenizer)
+
+
 @lru_cache(maxsize=1)
 def get_reranker() -> Optional[CrossEncoder]:
     cfg = get_settings()
     if not cfg.enable_rerank or not cfg.reranker_model:
         return None
-    return CrossEncoder(cfg.reranker_model, device=cfg.reranker_device)
+    from sentence_transformers import CrossEncoder
+
+    return load_model(
+        CrossEncoder, cfg.reranker_model, device=cfg.reranker_device, max_length=cfg.rerank_max_tokens
+    )
 
 
 @lru_cache(maxsize=1)
 def get_llm() -> LLMClient:
     cfg = get_settings()
     if cfg.openai_base_url and cfg.openai_api_key:
-        return OpenAILikeClient(cfg.openai_base_url, cfg.openai_api_key, cfg.openai_model or "")
-    if cfg.llama_base_url:
-        return LlamaCppClient(cfg.llama_base_url, cfg.llama_model or "mistral")
-    raise RuntimeError("No LLM backend configured. Set OPENAI_* or LLAMA_* env vars.")
+        return ConcurrencyLimitedClient(
+            OpenAILikeClient(cfg.openai_base_url, cfg.openai_api_key, cfg.openai_model or ""),
+            cfg.openai_max_concurrency,
+        )
+    urls = _llama_urls()
+    if not urls:
+        raise RuntimeError("No LLM backend configured. Set OPENAI_* or LLAMA_* env vars.")
+    clients = [
+        LlamaCppClient(
+            url,
+            cfg.llama_model or "mistral",
+            pool_size=cfg.llama_pool_size,
+            http2=cfg.llama_http2,
+            timeout_s=cfg.llama_timeout_s,
+            cache_prompt=cfg.llama_cache_prompt,
+            slot_affinity=cfg.llama_slot_affinity,
+            slots=cfg.llama_max_concurrency,
+        )
+        for url in urls
+    ]
+    if len(clients) == 1:
+        return ConcurrencyLimitedClient(clients[0], cfg.llama_max_concurrency)
+    return LLMRouter(
+        [
+            Backend(url, client, max_concurrency=cfg.llama_max_concurrency, health_url=f"{url}/health")
+            for url, client in zip(urls, clients)
+        ],
+        strategy=cfg.llm_routing,
+        failure_threshold=cfg.llm_breaker_failures,
+        cooldown_s=cfg.llm_breaker_cooldown_s,
+        health_interval_s=cfg.llm_health_interval_s,
+    )
+
+
+def _llama_urls() -> List[str]:
+    cfg = get_settings()
+    urls = [cfg.llama_base_url or ""] + (cfg.llama_base_urls or "").split(",")
+    return list(dict.fromkeys(u.strip().rstrip("/") for u in urls if u.strip()))
 
 
 def ensure_collection(collection: str, vector_size: int = 1024) -> None:
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+
+def point_id(text: str, source: str, anchor: str | None) -> str:
+    """Deterministic Qdrant point id for a chunk, so re-ingesting it overwrites the same point."""
+    h = hashlib.sha256("\0".join([source, anchor or "", text]).encode("utf-8")).hexdigest()
+    return str(uuid.UUID(hex=h[:32]))
+
+
+def embedding_key(model: str, text: str) -> str:
+    """Cache key for an embedding: it depends only on the model and the chunk text."""
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite store of float32 embeddings keyed by :func:`embedding_key`."""
+
+    def __init__(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vec BLOB NOT NULL)"
+        )
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        out: Dict[str, np.ndarray] = {}
+        uniq = list(dict.fromkeys(keys))
+        with self._lock:
+            # stay well below SQLite's bound-parameter limit
+            for i in range(0, len(uniq), 500):
+                part = uniq[i : i + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._db.execute(
+                    f"SELECT key, vec FROM embeddings WHERE key IN ({marks})", part
+                ).fetchall()
+                for key, blob in rows:
+                    out[key] = np.frombuffer(blob, dtype=np.float32)
+        self.hits += sum(1 for k in keys if k in out)
+        self.misses += sum(1 for k in keys if k not in out)
+        return out
+
+    def put_many(self, items: Iterable[Tuple[str, np.ndarray]]) -> None:
+        rows: List[Tuple[str, bytes]] = [
+            (k, np.asarray(v, dtype=np.float32).tobytes()) for k, v in items
+        ]
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO embeddings (key, vec) VALUES (?, ?)", rows)
+            self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from .chunking import chunk_sections
+from .embed_cache import EmbeddingCache, embedding_key, point_id
+from .md_loader import iter_sections
+from .metrics import INGEST_ITEMS, INGEST_STAGE_SECONDS
+from .vectorstore.base import Point
+
+Chunk = Tuple[str, Dict[str, Any]]
+
+
+def parse_and_chunk(path: str) -> Tuple[str, List[Chunk], float]:
+    """Parse stage worker: runs in a separate process, so it must stay a top-level function."""
+    t0 = time.perf_counter()
+    chunks = chunk_sections(iter_sections(Path(path)))
+    return Path(path).as_posix(), chunks, time.perf_counter() - t0
+
+
+def length_sorted_batches(texts: Sequence[str], batch_size: int) -> List[List[int]]:
+    """Group indices of ``texts`` into batches of similar length, longest first.
+
+    Every batch is padded to its longest member, so sorting the whole window first
+    keeps padding minimal. Character length is the proxy for token length, as in
+    ``SentenceTransformer.encode``.
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+    return [order[i : i + batch_size] for i in range(0, len(order), max(1, batch_size))]
+
+
+def encode_length_sorted(
+    encode: Callable[[List[str]], np.ndarray], texts: Sequence[str], batch_size: int
+) -> np.ndarray:
+    """Encode ``texts`` in length-sorted batches and scatter vectors back to input order."""
+    out: Optional[np.ndarray] = None
+    for idx in length_sorted_batches(texts, batch_size):
+        vecs = np.asarray(encode([texts[i] for i in idx]), dtype=np.float32)
+        if out is None:
+            out = np.empty((len(texts), vecs.shape[1]), dtype=np.float32)
+        out[idx] = vecs
+    return out if out is not None else np.empty((0, 0), dtype=np.float32)
+
+
+@dataclass
+class StageStats:
+    name: str
+    items: int = 0
+    busy_s: float = 0.0
+    extra: Dict[str, int] = field(default_factory=dict)
+
+    def line(self, unit: str) -> str:
+        rate = self.items / self.busy_s if self.busy_s > 0 else 0.0
+        extra = "".join(f", {k} {v}" for k, v in self.extra.items())
+        return f"{self.name:<7} {self.items:>6} {unit:<6} busy {self.busy_s:7.2f}s  {rate:8.1f} {unit}/s{extra}"
+
+
+class IngestPipeline:
+    """Streaming parse -> embed -> upsert pipeline with overlapping stages.
+
+    Files are parsed and chunked in a process pool; the calling thread gathers chunks
+    from all files into a window of ``embed_batch_size`` chunks, skips cached
+    embeddings and encodes the rest in length-sorted batches of ``encode_batch_size``,
+    while a small thread pool uploads finished points with at most ``max_inflight``
+    requests outstanding.
+    """
+
+    def __init__(
+        self,
+        *,
+        encode: Callable[[List[str]], np.ndarray],
+        upsert: Callable[[List[Point]], None],
+        model_name: str,
+        cache: Optional[EmbeddingCache] = None,
+        parse_workers: int = 1,
+        embed_batch_size: int = 256,
+        encode_batch_size: int = 16,
+        upsert_batch_size: int = 128,
+        max_inflight: int = 4,
+        on_file: Optional[Callable[[str, int], None]] = None,
+    ) -> None:
+        self._encode = encode
+        self._upsert = upsert
+        self._model_name = model_name
+        self._cache = cache
+        self._parse_workers = max(1, parse_workers)
+        self._embed_batch_size = max(1, embed_batch_size)
+        self._encode_batch_size = max(1, encode_batch_size)
+        self._upsert_batch_size = max(1, upsert_batch_size)
+        self._max_inflight = max(1, max_inflight)
+        self._on_file = on_file
+        self.parse = StageStats("parse")
+        self.embed = StageStats("embed", extra={"cached": 0, "encoded": 0, "batches": 0})
+        self.upload = StageStats("upsert", extra={"requests": 0})
+        self.wall_s = 0.0
+        self._lock = threading.Lock()
+
+    def _parsed(self, paths: Sequence[Path]) -> Iterator[Tuple[str, List[Chunk], float]]:
+        if self._parse_workers == 1 or len(paths) == 1:
+            for p in paths:
+                yield parse_and_chunk(str(p))
+            return
+        with ProcessPoolExecutor(max_workers=self._parse_workers) as pool:
+            futures = [pool.submit(parse_and_chunk, str(p)) for p in paths]
+            for fut in as_completed(futures):
+                yield fut.result()
+
+    def run(self, paths: Sequence[Path]) -> Dict[str, Set[str]]:
+        """Ingest ``paths`` and return the point ids written for each source."""
+        t_start = time.perf_counter()
+        ids: Dict[str, Set[str]] = {Path(p).as_posix(): set() for p in paths}
+        pending: List[Chunk] = []
+        points: List[Point] = []
+        inflight: List[Future[None]] = []
+        slots = threading.BoundedSemaphore(self._max_inflight)
+        uploader: Executor = ThreadPoolExecutor(max_workers=self._max_inflight, thread_name_prefix="upsert")
+
+        def upload(batch: List[Point]) -> None:
+            try:
+                t0 = time.perf_counter()
+                self._upsert(batch)
+                dt = time.perf_counter() - t0
+                INGEST_STAGE_SECONDS.labels("upsert").observe(dt)
+                INGEST_ITEMS.labels("upsert").inc(len(batch))
+                with self._lock:
+                    self.upload.busy_s += dt
+                    self.upload.items += len(batch)
+                    self.upload.extra["requests"] += 1
+            finally:
+                slots.release()
+
+        def submit_upload(batch: List[Point]) -> None:
+            slots.acquire()  # backpressure: wait while max_inflight uploads are running
+            inflight.append(uploader.submit(upload, batch))
+
+        def flush_embed(batch: List[Chunk]) -> None:
+            t0 = time.perf_counter()
+            keys = [embedding_key(self._model_name, text) for text, _ in batch]
+            vectors: Dict[str, np.ndarray] = self._cache.get_many(keys) if self._cache else {}
+            missing = [i for i, k in enumerate(keys) if k not in vectors]
+            if missing:
+                texts = [batch[i][0] for i in missing]
+                encoded = encode_length_sorted(self._encode, texts, self._encode_batch_size)
+                self.embed.extra["batches"] += -(-len(texts) // self._encode_batch_size)
+                fresh = [(keys[i], vec) for i, vec in zip(missing, encoded)]
+                vectors.update(fresh)
+                if self._cache:
+                    self._cache.put_many(fresh)
+            dt = time.perf_counter() - t0
+            INGEST_STAGE_SECONDS.labels("embed").observe(dt)
+            INGEST_ITEMS.labels("embed").inc(len(batch))
+            self.embed.busy_s += dt
+            self.embed.items += len(batch)
+            self.embed.extra["encoded"] += len(missing)
+            self.embed.extra["cached"] += len(batch) - len(missing)
+            for key, (text, meta) in zip(keys, batch):
+                pid = point_id(text, meta["source"], meta.get("anchor"))
+                ids.setdefault(meta["source"], set()).add(pid)
+                points.append(Point(id=pid, vector=vectors[key], payload={"text": text, **meta}))
+            while len(points) >= self._upsert_batch_size:
+                submit_upload(points[: self._upsert_batch_size])
+                del points[: self._upsert_batch_size]
+
+        try:
+            for source, chunks, parse_s in self._parsed(paths):
+                self.parse.items += 1
+                self.parse.busy_s += parse_s
+                INGEST_STAGE_SECONDS.labels("parse").observe(parse_s)
+                INGEST_ITEMS.labels("parse").inc()
+                self.parse.extra["chunks"] = self.parse.extra.get("chunks", 0) + len(chunks)
+                if self._on_file:
+                    self._on_file(source, len(chunks))
+                pending.extend(chunks)
+                while len(pending) >= self._embed_batch_size:
+                    flush_embed(pending[: self._embed_batch_size])
+                    del pending[: self._embed_batch_size]
+            if pending:
+                flush_embed(pending)
+            if points:
+                submit_upload(list(points))
+            for fut in inflight:
+                fut.result()
+        finally:
+            uploader.shutdown(wait=True)
+        self.wall_s = time.perf_counter() - t_start
+        return ids
+
+    def report(self) -> str:
+        return "\n".join(
+            [
+                self.parse.line("files"),
+                self.embed.line("chunks"),
+                self.upload.line("points"),
+                f"wall    {self.wall_s:.2f}s",
+            ]
+        )
@@ -0,0 +1,402 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import json
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Protocol, Tuple
+
+from .metrics import record_stage
+
+Runner = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+@dataclass
+class Job:
+    id: str
+    payload: Dict[str, Any]
+    priority: int = 0
+    status: str = "pending"  # pending | running | done | error
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    expires_at: Optional[float] = None
+
+
+class QueueFull(Exception):
+    def __init__(self, depth: int) -> None:
+        super().__init__(f"job queue is full ({depth} pending)")
+        self.depth = depth
+
+
+class JobStore(Protocol):
+    def add(self, job: Job) -> None: ...
+    def claim(self, lease_s: float) -> Optional[Job]: ...
+    def finish(self, job: Job) -> None: ...
+    def renew(self, job_id: str, lease_s: float) -> None: ...
+    def release(self, job: Job) -> None: ...
+    def get(self, job_id: str) -> Optional[Job]: ...
+    def position(self, job_id: str) -> Optional[int]: ...
+    def depth(self) -> int: ...
+    def running(self) -> int: ...
+    def evict(self, now: float) -> int: ...
+
+
+class MemoryJobStore:
+    """Per-process store: a priority heap of pending ids plus a dict of all live jobs."""
+
+    def __init__(self) -> None:
+        self._jobs: Dict[str, Job] = {}
+        self._heap: List[Tuple[int, int, str]] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def add(self, job: Job) -> None:
+        with self._lock:
+            self._jobs[job.id] = job
+            heapq.heappush(self._heap, (-job.priority, next(self._seq), job.id))
+
+    def claim(self, lease_s: float) -> Optional[Job]:
+        with self._lock:
+            while self._heap:
+                _, _, job_id = heapq.heappop(self._heap)
+                job = self._jobs.get(job_id)
+                if job is not None and job.status == "pending":
+                    job.status, job.started_at = "running", time.time()
+                    return job
+            return None
+
+    def finish(self, job: Job) -> None:
+        with self._lock:
+            self._jobs[job.id] = job
+
+    def renew(self, job_id: str, lease_s: float) -> None:
+        pass  # no leases: a job cannot outlive this process
+
+    def release(self, job: Job) -> None:
+        with self._lock:
+            job.status, job.started_at = "pending", None
+            self._jobs[job.id] = job
+            heapq.heappush(self._heap, (-job.priority, next(self._seq), job.id))
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def position(self, job_id: str) -> Optional[int]:
+        with self._lock:
+            mine = next((e for e in self._heap if e[2] == job_id), None)
+            if mine is None:
+                return None
+            return 1 + sum(1 for e in self._heap if e < mine)
+
+    def depth(self) -> int:
+        return len(self._heap)
+
+    def running(self) -> int:
+        return sum(1 for j in self._jobs.values() if j.status == "running")
+
+    def evict(self, now: float) -> int:
+        with self._lock:
+            dead = [k for k, j in self._jobs.items() if j.expires_at is not None and j.expires_at <= now]
+            for k in dead:
+                del self._jobs[k]
+            return len(dead)
+
+
+class SQLiteJobStore:
+    """Jobs in SQLite, so they survive restarts and every uvicorn worker can serve them.
+
+    A worker claims a job by leasing it and renews the lease while the job runs;
+    a job whose lease ran out (its worker died mid-run) goes back to the queue.
+    """
+
+    _COLUMNS = ("id", "payload", "priority", "status", "result", "error",
+                "created_at", "started_at", "finished_at", "expires_at")
+
+    def __init__(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT UNIQUE NOT NULL, payload TEXT NOT NULL, "
+            "priority INTEGER NOT NULL, status TEXT NOT NULL, result TEXT, error TEXT, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL, expires_at REAL, "
+            "lease_until REAL, owner TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, priority DESC, seq)")
+        self._owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+
+    def _row_to_job(self, row: Tuple[Any, ...]) -> Job:
+        d = dict(zip(self._COLUMNS, row))
+        d["payload"] = json.loads(d["payload"])
+        d["result"] = json.loads(d["result"]) if d["result"] else None
+        return Job(**d)
+
+    def add(self, job: Job) -> None:
+        d = asdict(job)
+        d["payload"] = json.dumps(job.payload, ensure_ascii=False)
+        d["result"] = None
+        with self._lock:
+            self._db.execute(
+                f"INSERT INTO jobs ({', '.join(self._COLUMNS)}) VALUES ({', '.join('?' * len(self._COLUMNS))})",
+                [d[c] for c in self._COLUMNS],
+            )
+
+    def claim(self, lease_s: float) -> Optional[Job]:
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "UPDATE jobs SET status = 'pending', owner = NULL WHERE status = 'running' AND lease_until < ?",
+                    (now,),
+                )
+                row = self._db.execute(
+                    "SELECT id FROM jobs WHERE status = 'pending' ORDER BY priority DESC, seq LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    self._db.execute("COMMIT")
+                    return None
+                self._db.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, lease_until = ?, owner = ? WHERE id = ?",
+                    (now, now + lease_s, self._owner, row[0]),
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return self.get(row[0])
+
+    def finish(self, job: Job) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, expires_at = ?, "
+                "lease_until = NULL WHERE id = ?",
+                (job.status, json.dumps(job.result, ensure_ascii=False, default=str) if job.result is not None else None,
+                 job.error, job.finished_at, job.expires_at, job.id),
+            )
+
+    def renew(self, job_id: str, lease_s: float) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'running' AND owner = ?",
+                (time.time() + lease_s, job_id, self._owner),
+            )
+
+    def release(self, job: Job) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'pending', started_at = NULL, lease_until = NULL, owner = NULL "
+                "WHERE id = ? AND status = 'running' AND owner = ?",
+                (job.id, self._owner),
+            )
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(self._COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def position(self, job_id: str) -> Optional[int]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT priority, seq FROM jobs WHERE id = ? AND status = 'pending'", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            (ahead,) = self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'pending' AND (priority > ? OR (priority = ? AND seq < ?))",
+                (row[0], row[0], row[1]),
+            ).fetchone()
+        return int(ahead) + 1
+
+    def depth(self) -> int:
+        with self._lock:
+            return int(self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'pending'").fetchone()[0])
+
+    def running(self) -> int:
+        with self._lock:
+            return int(self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'running'").fetchone()[0])
+
+    def evict(self, now: float) -> int:
+        with self._lock:
+            return self._db.execute("DELETE FROM jobs WHERE expires_at <= ?", (now,)).rowcount
+
+
+class JobQueue:
+    """Bounded priority queue of jobs served by ``workers`` coroutines.
+
+    ``submit`` raises :class:`QueueFull` once ``max_pending`` jobs wait; finished
+    jobs are kept for ``ttl_s`` and then evicted. Workers start lazily on the
+    running event loop and, with a shared store, also pick up jobs submitted by
+    other processes (polling every ``poll_interval_s``). Store calls that can
+    block (SQLite waits up to 30 s for a lock) run in a worker thread; ``stats``
+    reports the depth and running counts the workers last read from the store.
+    """
+
+    def __init__(
+        self,
+        runner: Runner,
+        store: JobStore,
+        *,
+        workers: int = 4,
+        max_pending: int = 100,
+        ttl_s: float = 3600.0,
+        lease_s: float = 900.0,
+        poll_interval_s: float = 0.5,
+    ) -> None:
+        self._runner = runner
+        self._store = store
+        self._workers = max(1, workers)
+        self._max_pending = max(1, max_pending)
+        self._ttl_s = ttl_s
+        self._lease_s = lease_s
+        self._poll_s = poll_interval_s
+        self._tasks: List[asyncio.Task[None]] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._last_evict = 0.0
+        # metrics
+        self._counters = {"submitted": 0, "rejected": 0, "done": 0, "failed": 0, "evicted": 0}
+        self._wait_s = 0.0
+        self._run_s = 0.0
+        self._recent_waits: deque[float] = deque(maxlen=1024)
+        self._depth = 0
+        self._running = 0
+
+    def _ensure_workers(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # tasks of another (finished) loop cannot run here
+            self._loop, self._wakeup, self._tasks = loop, asyncio.Event(), []
+        alive = [t for t in self._tasks if not t.done()]
+        if len(alive) < self._workers:
+            self._tasks = alive + [loop.create_task(self._work()) for _ in range(self._workers - len(alive))]
+
+    async def submit(self, payload: Dict[str, Any], *, priority: int = 0) -> Job:
+        self._ensure_workers()
+        depth = await asyncio.to_thread(self._store.depth)
+        if depth >= self._max_pending:
+            self._counters["rejected"] += 1
+            raise QueueFull(depth)
+        job = Job(id=str(uuid.uuid4()), payload=payload, priority=priority)
+        await asyncio.to_thread(self._store.add, job)
+        self._depth = depth + 1
+        self._counters["submitted"] += 1
+        assert self._wakeup is not None
+        self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        self._ensure_workers()
+        job = await asyncio.to_thread(self._store.get, job_id)
+        if job is not None and job.expires_at is not None and job.expires_at <= time.time():
+            return None
+        return job
+
+    async def position(self, job_id: str) -> Optional[int]:
+        return await asyncio.to_thread(self._store.position, job_id)
+
+    async def _work(self) -> None:
+        assert self._wakeup is not None
+        wakeup = self._wakeup
+        while True:
+            await self._maybe_evict()
+            job = await self._claim()
+            await self._refresh_counts()
+            if job is None:
+                wakeup.clear()
+                try:
+                    # not wait_for: on 3.11 it can swallow a cancel that lands as the event is set
+                    async with asyncio.timeout(self._poll_s):
+                        await wakeup.wait()
+                except TimeoutError:
+                    pass
+                continue
+            assert job.started_at is not None
+            self._wait_s += job.started_at - job.created_at
+            self._recent_waits.append(job.started_at - job.created_at)
+            record_stage("job_wait", job.started_at - job.created_at)
+            heartbeat = asyncio.get_running_loop().create_task(self._heartbeat(job.id))
+            try:
+                job.result = await self._runner(job.payload)
+                job.status = "done"
+                self._counters["done"] += 1
+            except asyncio.CancelledError:
+                # shutting down: hand the job back for another worker (called directly,
+                # an await here could be cancelled again)
+                self._store.release(job)
+                raise
+            except Exception as e:  # noqa: BLE001
+                job.status, job.error = "error", str(e)
+                self._counters["failed"] += 1
+            finally:
+                heartbeat.cancel()
+            job.finished_at = time.time()
+            job.expires_at = job.finished_at + self._ttl_s
+            self._run_s += job.finished_at - job.started_at
+            await asyncio.to_thread(self._store.finish, job)
+            await self._refresh_counts()
+
+    async def _claim(self) -> Optional[Job]:
+        claim = asyncio.ensure_future(asyncio.to_thread(self._store.claim, self._lease_s))
+        try:
+            return await asyncio.shield(claim)
+        except asyncio.CancelledError:
+            # the claim still completes in its thread: hand back whatever it took
+            def release(f: "asyncio.Future[Optional[Job]]") -> None:
+                if not f.cancelled() and f.exception() is None and f.result() is not None:
+                    self._store.release(f.result())  # type: ignore[arg-type]
+
+            claim.add_done_callback(release)
+            raise
+
+    async def _refresh_counts(self) -> None:
+        self._depth, self._running = await asyncio.to_thread(lambda: (self._store.depth(), self._store.running()))
+
+    async def _heartbeat(self, job_id: str) -> None:
+        """Keep extending the lease of a running job, so a long one is not claimed twice."""
+        while True:
+            await asyncio.sleep(self._lease_s / 3)
+            await asyncio.to_thread(self._store.renew, job_id, self._lease_s)
+
+    async def _maybe_evict(self) -> None:
+        now = time.time()
+        if now - self._last_evict >= min(60.0, self._ttl_s):
+            self._last_evict = now
+            self._counters["evicted"] += await asyncio.to_thread(self._store.evict, now)
+
+    def retry_after_s(self) -> int:
+        """Rough seconds until a queue slot frees up, for the Retry-After header."""
+        finished = self._counters["done"] + self._counters["failed"]
+        avg_run = self._run_s / finished if finished else 1.0
+        return max(1, math.ceil(avg_run / self._workers))
+
+    def stats(self) -> Dict[str, Any]:
+        finished = self._counters["done"] + self._counters["failed"]
+        waits = sorted(self._recent_waits)
+        return {
+            "depth": self._depth,
+            "running": self._running,
+            "workers": self._workers,
+            "max_pending": self._max_pending,
+            **self._counters,
+            "avg_wait_ms": (self._wait_s / finished * 1000.0) if finished else 0.0,
+            "p95_wait_ms": waits[int(0.95 * (len(waits) - 1))] * 1000.0 if waits else 0.0,
+            "avg_run_ms": (self._run_s / finished * 1000.0) if finished else 0.0,
+        }
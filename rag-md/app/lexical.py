@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import json
+import math
+import re
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .arrayfile import load_arrays, save_arrays
+from .config import get_settings
+from .content_store import get_content_store
+
+_MAGIC = b"BM25IDX1"
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_CYRILLIC_RE = re.compile(r"[а-я]+")
+# Light Russian normalization: inflected forms of one word mostly share their first
+# letters, so long Cyrillic words are truncated to a fixed-length stem.
+_RU_STEM_LEN = 6
+# payload fields with at most this many distinct values keep a cached mask per value,
+# as the local vector store does; masks on other fields are rebuilt per query
+_MASK_MAX_VALUES = 256
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens for BM25; identifiers such as ``customerorder`` or
+    ``expand=`` / ``/entity/demand`` reduce to their word parts."""
+    out: List[str] = []
+    for w in _WORD_RE.findall(text.lower().replace("ё", "е")):
+        if len(w) > _RU_STEM_LEN and _CYRILLIC_RE.fullmatch(w):
+            w = w[:_RU_STEM_LEN]
+        out.append(w)
+    return out
+
+
+def rrf_fuse(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """Reciprocal rank fusion of several ranked id lists, best first.
+
+    Scores are scaled to ``(0, 1]``: 1.0 means ranked first by every list.
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, pid in enumerate(ranking):
+            scores[pid] = scores.get(pid, 0.0) + 1.0 / (k + rank + 1)
+    best = len(rankings) / (k + 1)
+    return sorted(((pid, s / best) for pid, s in scores.items()), key=lambda kv: kv[1], reverse=True)
+
+
+class LexicalIndex:
+    """BM25 inverted index in a single file whose posting arrays are memory-mapped.
+
+    Layout: magic, header length, JSON header (vocabulary, point ids, filterable
+    payload fields, array offsets) and then the arrays. Per-posting BM25 term
+    weights are precomputed at build time, so a query only sums ``idf * weight``
+    over the postings of its terms.
+    """
+
+    def __init__(self, header: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> None:
+        self.vocab: Dict[str, int] = header["vocab"]
+        self.ids: List[str] = header["ids"]
+        self._meta: List[Dict[str, Any]] = header["meta"]
+        self._offsets = arrays["offsets"]
+        self._docs = arrays["docs"]
+        self._weights = arrays["weights"]
+        self._idf = arrays["idf"]
+        self._masks: Dict[str, np.ndarray] = {}
+        self._cardinality: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(
+        cls,
+        docs: Iterable[Tuple[str, str, Dict[str, Any]]],
+        *,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ) -> "LexicalIndex":
+        """Build from ``(point_id, text, payload)`` triples; ``text`` is not stored."""
+        ids: List[str] = []
+        meta: List[Dict[str, Any]] = []
+        tfs: List[Counter[str]] = []
+        lengths: List[int] = []
+        for pid, text, payload in docs:
+            toks = tokenize(text)
+            ids.append(str(pid))
+            meta.append({k: v for k, v in payload.items() if k not in {"text", "text_hash"}})
+            tfs.append(Counter(toks))
+            lengths.append(len(toks))
+        n = len(ids)
+        avgdl = (sum(lengths) / n) if n else 0.0
+        postings: Dict[str, List[Tuple[int, float]]] = {}
+        for d, (tf, dl) in enumerate(zip(tfs, lengths)):
+            norm = k1 * (1 - b + b * dl / avgdl) if avgdl else k1
+            for term, f in tf.items():
+                postings.setdefault(term, []).append((d, f * (k1 + 1) / (f + norm)))
+        terms = sorted(postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        docs_arr: List[int] = []
+        weights: List[float] = []
+        idf = np.empty(len(terms), dtype=np.float32)
+        for i, term in enumerate(terms):
+            plist = postings[term]
+            docs_arr.extend(d for d, _ in plist)
+            weights.extend(w for _, w in plist)
+            offsets[i + 1] = len(docs_arr)
+            idf[i] = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+        header = {"vocab": {t: i for i, t in enumerate(terms)}, "ids": ids, "meta": meta}
+        arrays = {
+            "offsets": offsets,
+            "docs": np.asarray(docs_arr, dtype=np.int32),
+            "weights": np.asarray(weights, dtype=np.float32),
+            "idf": idf,
+        }
+        return cls(header, arrays)
+
+    def save(self, path: Path) -> None:
+        arrays = {"offsets": self._offsets, "docs": self._docs, "weights": self._weights, "idf": self._idf}
+        save_arrays(path, _MAGIC, {"vocab": self.vocab, "ids": self.ids, "meta": self._meta}, arrays)
+
+    @classmethod
+    def load(cls, path: Path) -> "LexicalIndex":
+        return cls(*load_arrays(path, _MAGIC))
+
+    def _mask(self, filters: Dict[str, Any]) -> np.ndarray:
+        """Documents matching every ``key == value`` filter, as for Qdrant ``MatchValue``."""
+        mask = np.ones(len(self.ids), dtype=bool)
+        for k, v in filters.items():
+            key = json.dumps([k, v], sort_keys=True, default=str)
+            m = self._masks.get(key)
+            if m is None:
+                m = np.fromiter((d.get(k) == v for d in self._meta), dtype=bool, count=len(self._meta))
+                if self._distinct(k) <= _MASK_MAX_VALUES:
+                    self._masks[key] = m
+            mask &= m
+        return mask
+
+    def _distinct(self, field: str) -> int:
+        n = self._cardinality.get(field)
+        if n is None:
+            n = len({json.dumps(d.get(field), sort_keys=True, default=str) for d in self._meta})
+            self._cardinality[field] = n
+        return n
+
+    def search(self, query: str, *, top_k: int = 20, filters: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """Top ``top_k`` ``(point_id, bm25_score)`` pairs for ``query``."""
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        hit = False
+        for term in set(tokenize(query)):
+            t = self.vocab.get(term)
+            if t is None:
+                continue
+            lo, hi = int(self._offsets[t]), int(self._offsets[t + 1])
+            scores[self._docs[lo:hi]] += self._idf[t] * self._weights[lo:hi]
+            hit = True
+        if not hit:
+            return []
+        if filters:
+            scores[~self._mask(filters)] = 0.0
+        k = min(top_k, int(np.count_nonzero(scores)))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.ids[i], float(scores[i])) for i in top]
+
+
+def index_path(collection: str) -> Path:
+    return Path(get_settings().data_dir) / "lexical" / f"{collection}.bm25"
+
+
+def build_from_collection(store, collection: str, path: Optional[Path] = None) -> LexicalIndex:
+    """Rebuild the BM25 index of ``collection`` from the chunk texts in the vector store
+    (or in the content store for slim points)."""
+    hits = list(store.scroll(collection))
+    slim = [h.payload["text_hash"] for h in hits if "text" not in h.payload and "text_hash" in h.payload]
+    content = get_content_store(collection) if slim else None
+    texts = content.get_many(slim) if content else {}
+    index = LexicalIndex.build(
+        (h.id, h.payload.get("text", texts.get(h.payload.get("text_hash"), "")), h.payload) for h in hits
+    )
+    index.save(path or index_path(collection))
+    return index
+
+
+_INDEXES: Dict[str, Tuple[Tuple[int, int], LexicalIndex]] = {}
+_LOCK = threading.Lock()
+
+
+def get_lexical_index(collection: str) -> Optional[LexicalIndex]:
+    """The collection's index, reloaded when ingest replaces the file; None if not built."""
+    path = index_path(collection)
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    stamp = (st.st_ino, st.st_mtime_ns)
+    cached = _INDEXES.get(collection)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    with _LOCK:
+        cached = _INDEXES.get(collection)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        index = LexicalIndex.load(path)
+        _INDEXES[collection] = (stamp, index)
+        return index
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import AsyncIterator, List, Optional
 
 
 class ChatMessage(dict):
@@ -18,4 +18,12 @@ class LLMClient(ABC):
     @abstractmethod
     async def acomplete(self, messages: List[ChatMessage], *, temperature: float = 0.2,
                         max_tokens: int = 512) -> str:
-        raise NotImplementedError 
\ No newline at end of file
+        raise NotImplementedError
+
+    async def astream(self, messages: List[ChatMessage], *, temperature: float = 0.2,
+                      max_tokens: int = 512) -> AsyncIterator[str]:
+        """Yield the completion in pieces as it is generated.
+
+        Clients without streaming support yield the whole completion at once.
+        """
+        yield await self.acomplete(messages, temperature=temperature, max_tokens=max_tokens)
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import asyncio
+from typing import AsyncIterator, List, Optional
+
+from .base import ChatMessage, LLMClient
+
+
+class ConcurrencyLimitedClient(LLMClient):
+    """Caps in-flight requests to a backend; extra callers wait their turn.
+
+    A single llama.cpp server decodes a handful of sequences at a time, so
+    letting every queued job hit it at once only makes each one slower.
+    """
+
+    def __init__(self, inner: LLMClient, max_concurrency: int) -> None:
+        self.inner = inner
+        self.max_concurrency = max(1, max_concurrency)
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.in_flight = 0
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._sem is None or self._loop is not loop:
+            self._loop, self._sem = loop, asyncio.Semaphore(self.max_concurrency)
+        return self._sem
+
+    async def acomplete(self, messages: List[ChatMessage], *, temperature: float = 0.2,
+                        max_tokens: int = 512) -> str:
+        async with self._semaphore():
+            self.in_flight += 1
+            try:
+                return await self.inner.acomplete(messages, temperature=temperature, max_tokens=max_tokens)
+            finally:
+                self.in_flight -= 1
+
+    async def astream(self, messages: List[ChatMessage], *, temperature: float = 0.2,
+                      max_tokens: int = 512) -> AsyncIterator[str]:
+        async with self._semaphore():
+            self.in_flight += 1
+            try:
+                async for piece in self.inner.astream(messages, temperature=temperature, max_tokens=max_tokens):
+                    yield piece
+            finally:
+                self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {"backend": type(self.inner).__name__, "max_concurrency": self.max_concurrency,
+                "in_flight": self.in_flight}
@@ -1,46 +1,216 @@
 from __future__ import annotations
 
-from typing import List
 import asyncio
+import hashlib
+import json
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
 import httpx
 
 from .base import ChatMessage, LLMClient
 
 
 class LlamaCppClient(LLMClient):
-    def __init__(self, base_url: str, model: str) -> None:
+    """Client for a llama.cpp ``server``.
+
+    What the server supports is probed once (``probe``) and cached, so a build
+    without the OpenAI-compatible route goes straight to ``/completion``.
+    Identical prompts already in flight share one upstream call. With
+    ``cache_prompt`` the server keeps each slot's KV cache between requests,
+    so the shared system prompt is not re-evaluated; ``slot_affinity`` also
+    pins every request to an idle slot (``id_slot``) so it lands on one that
+    already holds that prefix.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        model: str,
+        *,
+        pool_size: int = 8,
+        http2: bool = False,
+        timeout_s: float = 600.0,
+        cache_prompt: bool = True,
+        slot_affinity: bool = False,
+        slots: int = 1,
+    ) -> None:
         self._base_url = base_url.rstrip("/")
         self._model = model
-        # Increase timeouts for large local models; allow long generation
-        self._client = httpx.AsyncClient(timeout=httpx.Timeout(6000.0, connect=300.0))
+        self._client = httpx.AsyncClient(
+            base_url=self._base_url,
+            http2=http2,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            # generation can legitimately take minutes on CPU; connecting should not
+            timeout=httpx.Timeout(timeout_s, connect=10.0),
+        )
+        self._cache_prompt = cache_prompt
+        self._slot_affinity = slot_affinity
+        self._slots = max(1, slots)
+        self._busy_slots: Set[int] = set()
+        self._slot_freed: Optional[asyncio.Condition] = None
+        self._probe_lock: Optional[asyncio.Lock] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._inflight: Dict[str, asyncio.Task[str]] = {}
+        self.chat_api: Optional[bool] = None  # None until probed
+        self.dedup_hits = 0
 
-    async def acomplete(self, messages: List[ChatMessage], *, temperature: float = 0.2,
-                        max_tokens: int = 512) -> str:
-        # Try OpenAI-compatible path first
-        url = f"{self._base_url}/v1/chat/completions"
-        payload = {
+    def _bind_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._probe_lock = asyncio.Lock()
+            self._slot_freed = asyncio.Condition()
+            self._busy_slots = set()
+
+    async def probe(self) -> bool:
+        """Detect the OpenAI-compatible route and the server's slot count (once)."""
+        self._bind_loop()
+        assert self._probe_lock is not None
+        async with self._probe_lock:
+            if self.chat_api is not None:
+                return self.chat_api
+            try:
+                r = await self._client.get("/v1/models")
+                chat_api = r.status_code == 200
+            except httpx.HTTPError:
+                chat_api = False
+            try:
+                r = await self._client.get("/props")
+                if r.status_code == 200:
+                    self._slots = int(r.json().get("total_slots") or self._slots)
+            except (httpx.HTTPError, ValueError):
+                pass
+            self.chat_api = chat_api
+            return chat_api
+
+    @asynccontextmanager
+    async def _slot(self) -> AsyncIterator[Dict[str, Any]]:
+        """Extra request fields for prompt caching; holds an idle slot if pinning."""
+        extra: Dict[str, Any] = {"cache_prompt": self._cache_prompt}
+        if not self._slot_affinity:
+            yield extra
+            return
+        assert self._slot_freed is not None
+        async with self._slot_freed:
+            await self._slot_freed.wait_for(lambda: len(self._busy_slots) < self._slots)
+            # lowest idle id: under light load the same few slots stay warm
+            slot = min(set(range(self._slots)) - self._busy_slots)
+            self._busy_slots.add(slot)
+        try:
+            yield {**extra, "id_slot": slot}
+        finally:
+            async with self._slot_freed:
+                self._busy_slots.discard(slot)
+                self._slot_freed.notify()
+
+    def _chat_payload(self, messages: List[ChatMessage], temperature: float, max_tokens: int,
+                      extra: Dict[str, Any]) -> Dict[str, Any]:
+        return {
             "model": self._model,
             "messages": messages,  # type: ignore[arg-type]
             "temperature": temperature,
             "max_tokens": max_tokens,
+            **extra,
         }
-        try:
-            r = await self._client.post(url, json=payload)
-            if r.status_code == 200:
-                data = r.json()
-                return data["choices"][0]["message"].get("content", "")
-        except Exception:
-            # Fall through to native endpoint on any client error/timeout
-            pass
-
-        # Fallback to llama.cpp native /completion
-        url2 = f"{self._base_url}/completion"
-        prompt = "\n".join([m["content"] for m in messages if m["role"] in {"system", "user"}])
-        r2 = await self._client.post(url2, json={
-            "prompt": prompt,
+
+    def _native_payload(self, messages: List[ChatMessage], temperature: float, max_tokens: int,
+                        extra: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "prompt": _native_prompt(messages),
             "n_predict": max_tokens,
             "temperature": temperature,
-        })
-        r2.raise_for_status()
-        data2 = r2.json()
-        return data2.get("content", data2.get("completion", "")) 
\ No newline at end of file
+            **extra,
+        }
+
+    async def acomplete(self, messages: List[ChatMessage], *, temperature: float = 0.2,
+                        max_tokens: int = 512) -> str:
+        key = _request_key(messages, temperature, max_tokens)
+        task = self._inflight.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.get_running_loop().create_task(self._complete(messages, temperature, max_tokens))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self.dedup_hits += 1
+        # one caller going away must not cancel the call the others are waiting on
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task[str]) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    async def _complete(self, messages: List[ChatMessage], temperature: float, max_tokens: int) -> str:
+        chat_api = await self.probe()
+        async with self._slot() as extra:
+            if chat_api:
+                r = await self._client.post(
+                    "/v1/chat/completions", json=self._chat_payload(messages, temperature, max_tokens, extra)
+                )
+                if r.status_code != 404:
+                    r.raise_for_status()
+                    return r.json()["choices"][0]["message"].get("content") or ""
+                self.chat_api = False  # route went away (server swapped): stop trying it
+            r = await self._client.post(
+                "/completion", json=self._native_payload(messages, temperature, max_tokens, extra)
+            )
+            r.raise_for_status()
+            data = r.json()
+            return data.get("content", data.get("completion", ""))
+
+    async def astream(self, messages: List[ChatMessage], *, temperature: float = 0.2,
+                      max_tokens: int = 512) -> AsyncIterator[str]:
+        chat_api = await self.probe()
+        async with self._slot() as extra:
+            if chat_api:
+                payload = {**self._chat_payload(messages, temperature, max_tokens, extra), "stream": True}
+                async with self._client.stream("POST", "/v1/chat/completions", json=payload) as r:
+                    if r.status_code != 404:
+                        r.raise_for_status()
+                        async for data in _sse_data(r):
+                            choices = data.get("choices") or [{}]
+                            piece = (choices[0].get("delta") or {}).get("content")
+                            if piece:
+                                yield piece
+                        return
+                self.chat_api = False
+
+            native = {**self._native_payload(messages, temperature, max_tokens, extra), "stream": True}
+            async with self._client.stream("POST", "/completion", json=native) as r:
+                r.raise_for_status()
+                async for data in _sse_data(r):
+                    if data.get("content"):
+                        yield data["content"]
+                    if data.get("stop"):
+                        break
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "chat_api": self.chat_api,
+            "slots": self._slots,
+            "busy_slots": len(self._busy_slots),
+            "inflight": len(self._inflight),
+            "dedup_hits": self.dedup_hits,
+        }
+
+
+def _request_key(messages: List[ChatMessage], temperature: float, max_tokens: int) -> str:
+    raw = json.dumps([messages, temperature, max_tokens], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _native_prompt(messages: List[ChatMessage]) -> str:
+    return "\n".join([m["content"] for m in messages if m["role"] in {"system", "user"}])
+
+
+async def _sse_data(response: httpx.Response) -> AsyncIterator[dict]:
+    """JSON payloads of the ``data:`` lines of a server-sent event stream."""
+    async for line in response.aiter_lines():
+        if not line.startswith("data:"):
+            continue
+        raw = line[5:].strip()
+        if not raw:
+            continue
+        if raw == "[DONE]":
+            break
+        yield json.loads(raw)
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import List
+from typing import AsyncIterator, List
 from openai import AsyncOpenAI
 
 from .base import ChatMessage, LLMClient
@@ -19,4 +19,17 @@ class OpenAILikeClient(LLMClient):
             temperature=temperature,
             max_tokens=max_tokens,
         )
-        return resp.choices[0].message.content or "" 
\ No newline at end of file
+        return resp.choices[0].message.content or ""
+
+    async def astream(self, messages: List[ChatMessage], *, temperature: float = 0.2,
+                      max_tokens: int = 512) -> AsyncIterator[str]:
+        stream = await self._client.chat.completions.create(
+            model=self._model,
+            messages=messages,  # type: ignore[arg-type]
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
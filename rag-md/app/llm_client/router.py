@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from .base import ChatMessage, LLMClient
+from .limited import ConcurrencyLimitedClient
+
+ROUTING_STRATEGIES = ("least_outstanding", "ewma")
+
+
+class NoBackendAvailable(RuntimeError):
+    pass
+
+
+@dataclass
+class Backend:
+    """One upstream LLM server as seen by :class:`LLMRouter`."""
+
+    name: str
+    client: LLMClient
+    max_concurrency: int = 2
+    health_url: Optional[str] = None
+    # live state
+    outstanding: int = 0
+    healthy: bool = True
+    failures: int = 0  # consecutive
+    open_until: float = 0.0  # circuit open (skipped) until this time
+    trial: bool = False  # half-open: one request is probing the backend
+    ewma_ms: Optional[float] = None
+    completed: int = 0
+    errors: int = 0
+    busy_s: float = 0.0
+    out_chars: int = 0
+    limited: LLMClient = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.limited = ConcurrencyLimitedClient(self.client, self.max_concurrency)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "healthy": self.healthy,
+            "circuit": "open" if self.open_until > time.monotonic() else ("half-open" if self.trial else "closed"),
+            "outstanding": self.outstanding,
+            "max_concurrency": self.max_concurrency,
+            "completed": self.completed,
+            "errors": self.errors,
+            "ewma_latency_ms": self.ewma_ms,
+            "chars_per_s": self.out_chars / self.busy_s if self.busy_s else 0.0,
+        }
+
+
+class LLMRouter(LLMClient):
+    """Spreads completions over several backends.
+
+    ``least_outstanding`` sends a request to the backend with the fewest
+    requests in flight relative to its concurrency cap; ``ewma`` to the one
+    with the lowest expected wait (latency EWMA times queue length). A backend
+    failing ``failure_threshold`` times in a row, or its ``/health`` check, is
+    skipped for ``cooldown_s`` and then gets a single trial request. Failed
+    calls fail over to the next backend (streams only before their first piece).
+    """
+
+    def __init__(
+        self,
+        backends: List[Backend],
+        *,
+        strategy: str = "least_outstanding",
+        failure_threshold: int = 3,
+        cooldown_s: float = 30.0,
+        health_interval_s: float = 10.0,
+        ewma_alpha: float = 0.3,
+        http: Optional[httpx.AsyncClient] = None,
+    ) -> None:
+        if not backends:
+            raise ValueError("LLMRouter needs at least one backend")
+        if strategy not in ROUTING_STRATEGIES:
+            raise ValueError(f"Unknown routing strategy: {strategy}")
+        self.backends = backends
+        self._strategy = strategy
+        self._failure_threshold = max(1, failure_threshold)
+        self._cooldown_s = cooldown_s
+        self._health_interval_s = health_interval_s
+        self._alpha = ewma_alpha
+        self._http = http or httpx.AsyncClient(timeout=httpx.Timeout(2.0))
+        self._health_task: Optional[asyncio.Task[None]] = None
+
+    # -- selection -----------------------------------------------------------
+
+    def _available(self, b: Backend, now: float) -> bool:
+        if not b.healthy:
+            return False
+        if b.open_until > now:
+            return False
+        return not b.trial  # half-open: wait for the trial request to come back
+
+    def _cost(self, b: Backend) -> float:
+        if self._strategy == "ewma":
+            # unmeasured backends look fast so they get traffic and a measurement
+            return (b.ewma_ms or 0.0) * (b.outstanding + 1)
+        return b.outstanding / b.max_concurrency
+
+    def pick(self, exclude: Optional[List[Backend]] = None) -> Backend:
+        now = time.monotonic()
+        skip = exclude or []
+        candidates = [b for b in self.backends if b not in skip and self._available(b, now)]
+        if not candidates:
+            raise NoBackendAvailable("no healthy LLM backend available")
+        best = min(candidates, key=self._cost)
+        if best.failures >= self._failure_threshold:
+            best.trial = True  # cooldown over: this request decides whether it closes
+        return best
+
+    # -- bookkeeping ---------------------------------------------------------
+
+    def _record(self, b: Backend, started: float, chars: int, error: bool) -> None:
+        elapsed = time.monotonic() - started
+        b.trial = False
+        if error:
+            b.errors += 1
+            b.failures += 1
+            if b.failures >= self._failure_threshold:
+                b.open_until = time.monotonic() + self._cooldown_s
+            return
+        b.failures = 0
+        b.open_until = 0.0
+        b.completed += 1
+        b.busy_s += elapsed
+        b.out_chars += chars
+        ms = elapsed * 1000.0
+        b.ewma_ms = ms if b.ewma_ms is None else self._alpha * ms + (1 - self._alpha) * b.ewma_ms
+
+    # -- LLMClient -----------------------------------------------------------
+
+    async def acomplete(self, messages: List[ChatMessage], *, temperature: float = 0.2,
+                        max_tokens: int = 512) -> str:
+        self._ensure_health_checks()
+        tried: List[Backend] = []
+        last_error: Optional[Exception] = None
+        while len(tried) < len(self.backends):
+            try:
+                b = self.pick(exclude=tried)
+            except NoBackendAvailable:
+                break
+            tried.append(b)
+            b.outstanding += 1
+            started = time.monotonic()
+            try:
+                text = await b.limited.acomplete(messages, temperature=temperature, max_tokens=max_tokens)
+            except Exception as e:  # noqa: BLE001
+                self._record(b, started, 0, error=True)
+                last_error = e
+                continue
+            finally:
+                b.outstanding -= 1
+                # a cancelled or abandoned trial is inconclusive: let the next request probe
+                b.trial = False
+            self._record(b, started, len(text), error=False)
+            return text
+        raise NoBackendAvailable(f"all LLM backends failed: {last_error}") from last_error
+
+    async def astream(self, messages: List[ChatMessage], *, temperature: float = 0.2,
+                      max_tokens: int = 512) -> AsyncIterator[str]:
+        self._ensure_health_checks()
+        tried: List[Backend] = []
+        last_error: Optional[Exception] = None
+        while len(tried) < len(self.backends):
+            try:
+                b = self.pick(exclude=tried)
+            except NoBackendAvailable:
+                break
+            tried.append(b)
+            b.outstanding += 1
+            started = time.monotonic()
+            chars = 0
+            try:
+                async for piece in b.limited.astream(messages, temperature=temperature, max_tokens=max_tokens):
+                    chars += len(piece)
+                    yield piece
+            except Exception as e:  # noqa: BLE001
+                self._record(b, started, chars, error=True)
+                if chars:
+                    raise  # the caller already has part of this answer
+                last_error = e
+                continue
+            finally:
+                b.outstanding -= 1
+                # a cancelled or abandoned trial is inconclusive: let the next request probe
+                b.trial = False
+            self._record(b, started, chars, error=False)
+            return
+        raise NoBackendAvailable(f"all LLM backends failed: {last_error}") from last_error
+
+    # -- health --------------------------------------------------------------
+
+    def _ensure_health_checks(self) -> None:
+        if self._health_interval_s <= 0 or not any(b.health_url for b in self.backends):
+            return
+        if self._health_task is None or self._health_task.done() \
+                or self._health_task.get_loop() is not asyncio.get_running_loop():
+            self._health_task = asyncio.get_running_loop().create_task(self._health_loop())
+
+    async def check_health(self) -> None:
+        async def one(b: Backend) -> None:
+            if not b.health_url:
+                return
+            try:
+                r = await self._http.get(b.health_url)
+                b.healthy = r.status_code == 200
+            except httpx.HTTPError:
+                b.healthy = False
+
+        await asyncio.gather(*(one(b) for b in self.backends))
+
+    async def _health_loop(self) -> None:
+        while True:
+            await self.check_health()
+            await asyncio.sleep(self._health_interval_s)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"strategy": self._strategy, "backends": {b.name: b.stats() for b in self.backends}}
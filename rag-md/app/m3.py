@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, List, Optional
+
+import numpy as np
+
+# bge-m3 produces three representations in one forward pass: the dense CLS
+# embedding (all SentenceTransformer returns), lexical weights per token
+# (relu(sparse_linear(h))) and ColBERT vectors per token
+# (normalize(colbert_linear(h)), CLS dropped). Both heads are single linear
+# layers shipped next to the checkpoint as sparse_linear.pt / colbert_linear.pt;
+# here they are applied in NumPy to the token embeddings SentenceTransformer
+# already computes, so any inference backend works and no second model is loaded.
+
+
+@dataclass
+class M3Output:
+    dense: np.ndarray  # (dim,), unit length
+    sparse: Dict[int, float]  # token id -> weight, special tokens dropped
+    colbert: np.ndarray  # (tokens, dim) float32, unit rows
+
+
+def _numpy(x: Any) -> np.ndarray:
+    if hasattr(x, "detach"):
+        x = x.detach().float().cpu().numpy()
+    return np.asarray(x)
+
+
+def _unit_rows(m: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(m, axis=-1, keepdims=True)
+    return m / np.where(norms > 0, norms, 1.0)
+
+
+def _head_file(model_name: str, filename: str) -> Path:
+    local = Path(model_name) / filename
+    if local.exists():
+        return local
+    from huggingface_hub import hf_hub_download
+
+    return Path(hf_hub_download(model_name, filename))
+
+
+def _linear(model_name: str, filename: str) -> tuple[np.ndarray, np.ndarray]:
+    import torch
+
+    state = torch.load(_head_file(model_name, filename), map_location="cpu", weights_only=True)
+    return state["weight"].float().numpy(), state["bias"].float().numpy()
+
+
+@dataclass
+class M3Heads:
+    sparse_weight: np.ndarray  # (hidden,)
+    sparse_bias: float
+    colbert_weight: np.ndarray  # (dim, hidden)
+    colbert_bias: np.ndarray  # (dim,)
+    special_ids: FrozenSet[int]
+
+    @classmethod
+    def load(cls, model_name: str, tokenizer: Any) -> "M3Heads":
+        sparse_w, sparse_b = _linear(model_name, "sparse_linear.pt")
+        colbert_w, colbert_b = _linear(model_name, "colbert_linear.pt")
+        special = {getattr(tokenizer, f"{t}_token_id", None) for t in ("cls", "eos", "pad", "unk")}
+        return cls(sparse_w.reshape(-1), float(sparse_b.reshape(-1)[0]), colbert_w, colbert_b,
+                   frozenset(i for i in special if i is not None))
+
+    def apply(self, features: Dict[str, Any]) -> M3Output:
+        """All three outputs from one text's ``encode(output_value=None)`` features."""
+        mask = _numpy(features["attention_mask"]).astype(bool)
+        hidden = _numpy(features["token_embeddings"])[mask].astype(np.float32)
+        ids = _numpy(features["input_ids"])[mask].tolist()
+        weights = np.maximum(hidden @ self.sparse_weight + self.sparse_bias, 0.0).tolist()
+        sparse: Dict[int, float] = {}
+        for tok, w in zip(ids, weights):
+            if w > 0 and tok not in self.special_ids and w > sparse.get(tok, 0.0):
+                sparse[tok] = w
+        colbert = _unit_rows(hidden[1:] @ self.colbert_weight.T + self.colbert_bias)
+        return M3Output(_unit_rows(_numpy(features["sentence_embedding"]).astype(np.float32)), sparse, colbert)
+
+
+def encode_m3(model: Any, heads: M3Heads, texts: List[str], *, batch_size: int,
+              prompt_name: Optional[str] = None) -> List[M3Output]:
+    kwargs = {"prompt_name": prompt_name} if prompt_name else {}
+    features = model.encode(texts, output_value=None, batch_size=batch_size, **kwargs)
+    return [heads.apply(f) for f in features]
+
+
+def sparse_score(query: Dict[int, float], doc: Dict[int, float]) -> float:
+    return sum(w * doc.get(tok, 0.0) for tok, w in query.items())
+
+
+def colbert_score(query: np.ndarray, doc: np.ndarray) -> float:
+    """Late interaction: each query token's best match in the document, averaged."""
+    if not len(query) or not len(doc):
+        return 0.0
+    return float((query @ doc.T).max(axis=1).mean())
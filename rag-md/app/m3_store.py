@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .arrayfile import Chunked, load_arrays, save_arrays
+from .config import get_settings
+from .m3 import M3Output
+
+# Per-point bge-m3 token outputs for ingest --m3: ColBERT vectors as int8 with a
+# scale per token (~1 KB per token at 1024 dims, so they stay on disk, memory-
+# mapped; a rescoring pass touches only its candidates' rows) and the sparse
+# weights, kept so unchanged chunks can be re-upserted without re-encoding.
+
+_MAGIC = b"RAGM3V01"
+# token rows scored per matrix product when rescoring candidates
+_SCORE_BLOCK_ROWS = 16384
+
+
+def m3_path(collection: str) -> Path:
+    return Path(get_settings().data_dir) / "m3" / f"{collection}.m3"
+
+
+def quantize(colbert: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """int8 rows and their float32 scales."""
+    scales = np.abs(colbert).max(axis=1) / 127.0 if len(colbert) else np.zeros(0, dtype=np.float32)
+    scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    return np.round(colbert / scales[:, None]).astype(np.int8), scales
+
+
+class M3Store:
+    """Read side: memory-mapped ColBERT token vectors and sparse weights by point id."""
+
+    def __init__(self, header: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> None:
+        self.dim: int = header["dim"]
+        self.ids: List[str] = header["ids"]
+        self._pos = {pid: i for i, pid in enumerate(self.ids)}
+        self._offsets = np.asarray(arrays["offsets"])
+        self._colbert = np.asarray(arrays["colbert"])
+        self._scales = np.asarray(arrays["scales"])
+        self._sp_ptr = np.asarray(arrays["sparse_ptr"])
+        self._sp_terms = np.asarray(arrays["sparse_terms"])
+        self._sp_weights = np.asarray(arrays["sparse_weights"])
+
+    @classmethod
+    def load(cls, path: Path) -> "M3Store":
+        return cls(*load_arrays(path, _MAGIC))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, pid: str) -> bool:
+        return pid in self._pos
+
+    def sparse(self, pid: str) -> Optional[Dict[int, float]]:
+        i = self._pos.get(pid)
+        if i is None:
+            return None
+        a, b = self._sp_ptr[i], self._sp_ptr[i + 1]
+        return dict(zip(self._sp_terms[a:b].tolist(), self._sp_weights[a:b].tolist()))
+
+    def tokens(self, pid: str) -> Tuple[np.ndarray, np.ndarray]:
+        i = self._pos[pid]
+        a, b = self._offsets[i], self._offsets[i + 1]
+        return self._colbert[a:b], self._scales[a:b]
+
+    def colbert_scores(self, query: np.ndarray, ids: Sequence[str]) -> List[Optional[float]]:
+        """Late-interaction score of each point in ``ids`` (None if it has no vectors).
+
+        Candidates' token rows are scored a block at a time: one int8 -> float32
+        conversion and one matrix product per block, then a per-point max over
+        its rows, averaged over the query tokens.
+        """
+        q = np.asarray(query, dtype=np.float32)
+        out: List[Optional[float]] = [None] * len(ids)
+        spans = []  # (position in ids, first row, end row)
+        for j, pid in enumerate(ids):
+            i = self._pos.get(pid)
+            if i is not None and self._offsets[i + 1] > self._offsets[i]:
+                spans.append((j, int(self._offsets[i]), int(self._offsets[i + 1])))
+        start = 0
+        while start < len(spans):
+            end, rows = start, 0
+            while end < len(spans) and (end == start or rows + spans[end][2] - spans[end][1] <= _SCORE_BLOCK_ROWS):
+                rows += spans[end][2] - spans[end][1]
+                end += 1
+            block = spans[start:end]
+            idx = np.concatenate([np.arange(a, b) for _, a, b in block])
+            sims = (self._colbert[idx].astype(np.float32) @ q.T) * self._scales[idx, None]
+            starts = np.cumsum([0] + [b - a for _, a, b in block[:-1]])
+            best = np.maximum.reduceat(sims, starts, axis=0).mean(axis=1)
+            for (j, _, _), s in zip(block, best.tolist()):
+                out[j] = s
+            start = end
+        return out
+
+
+class M3Writer:
+    """Write side used by ingest.
+
+    Token vectors of new chunks are appended to a spool file next to the
+    output as they are encoded (a corpus' worth does not fit in memory
+    comfortably), keyed by text hash until the chunk's point id is known;
+    :meth:`save` merges them with the previous file's live points.
+    """
+
+    def __init__(self, path: Path, *, fresh: bool = False) -> None:
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._old = M3Store.load(path) if not fresh and path.exists() else None
+        self.dim: Optional[int] = self._old.dim if self._old is not None else None
+        self._spool_path = path.with_suffix(".spool")
+        self._spool = self._spool_path.open("w+b")
+        self._spool_rows = 0
+        # text hash -> (first spool row, rows, scales, sparse)
+        self._entries: Dict[str, Tuple[int, int, np.ndarray, Dict[int, float]]] = {}
+        self._links: Dict[str, str] = {}  # point id -> text hash
+        self._lock = threading.Lock()
+
+    def put(self, key: str, out: M3Output) -> None:
+        q, scales = quantize(out.colbert.astype(np.float32))
+        with self._lock:
+            if key in self._entries:
+                return
+            if self.dim is None:
+                self.dim = q.shape[1]
+            self._spool.write(q.tobytes())
+            self._entries[key] = (self._spool_rows, len(q), scales, out.sparse)
+            self._spool_rows += len(q)
+
+    def link(self, pid: str, key: str) -> Optional[Dict[int, float]]:
+        """Attach the outputs stored under ``key`` to point ``pid``; their sparse weights, or None if absent."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._links[pid] = key
+            return entry[3]
+
+    def sparse(self, pid: str) -> Optional[Dict[int, float]]:
+        """Sparse weights already stored for ``pid``, in this run or the previous file."""
+        with self._lock:
+            key = self._links.get(pid)
+            if key is not None:
+                return self._entries[key][3]
+        return self._old.sparse(pid) if self._old is not None else None
+
+    def save(self, live: Iterable[str]) -> Tuple[int, int]:
+        """Write the live points' outputs atomically. Returns (points, token rows)."""
+        with self._lock:
+            self._spool.flush()
+            dim = self.dim or 0
+            spool = (np.memmap(self._spool_path, dtype=np.int8, mode="r", shape=(self._spool_rows, dim))
+                     if self._spool_rows else None)
+            old = self._old
+            ids = [pid for pid in sorted(set(live)) if pid in self._links or (old is not None and pid in old)]
+
+            def source(pid: str) -> Tuple[np.ndarray, np.ndarray, Dict[int, float]]:
+                key = self._links.get(pid)
+                if key is not None:
+                    start, n, scales, sparse = self._entries[key]
+                    rows = spool[start : start + n] if n else np.zeros((0, dim), dtype=np.int8)
+                    return rows, scales, sparse
+                rows, scales = old.tokens(pid)
+                return rows, scales, old.sparse(pid) or {}
+
+            counts, scales, sparse = [], [], []
+            for pid in ids:
+                _, s, sp = source(pid)
+                counts.append(len(s))
+                scales.append(s)
+                sparse.append(sp)
+
+            def parts() -> Iterator[np.ndarray]:
+                for pid in ids:
+                    yield source(pid)[0]
+
+            offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum(counts)
+            sp_ptr = np.zeros(len(ids) + 1, dtype=np.int64)
+            sp_ptr[1:] = np.cumsum([len(s) for s in sparse])
+            arrays = {
+                "offsets": offsets,
+                "colbert": Chunked(np.dtype(np.int8), (int(offsets[-1]), dim), parts()),
+                "scales": np.concatenate(scales) if scales else np.zeros(0, dtype=np.float32),
+                "sparse_ptr": sp_ptr,
+                "sparse_terms": np.fromiter((t for s in sparse for t in s), dtype=np.int32, count=int(sp_ptr[-1])),
+                "sparse_weights": np.fromiter((w for s in sparse for w in s.values()), dtype=np.float32,
+                                              count=int(sp_ptr[-1])),
+            }
+            save_arrays(self.path, _MAGIC, {"dim": dim, "ids": ids}, arrays)
+            spool = None  # drop the memmap before the spool file is truncated
+            self._old = M3Store.load(self.path)
+            self._entries.clear()
+            self._links.clear()
+            self._spool.seek(0)
+            self._spool.truncate()
+            self._spool_rows = 0
+            return len(ids), int(offsets[-1])
+
+    def close(self) -> None:
+        self._spool.close()
+        self._spool_path.unlink(missing_ok=True)
+
+
+_STORES: Dict[str, Tuple[Tuple[int, int], M3Store]] = {}
+_LOCK = threading.Lock()
+
+
+def get_m3_store(collection: str) -> Optional[M3Store]:
+    """The collection's token vectors, reloaded when ingest replaces the file; None if there are none."""
+    path = m3_path(collection)
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    stamp = (st.st_ino, st.st_mtime_ns)
+    cached = _STORES.get(collection)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    with _LOCK:
+        cached = _STORES.get(collection)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        store = M3Store.load(path)
+        _STORES[collection] = (stamp, store)
+        return store
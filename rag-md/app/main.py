@@ -1,23 +1,57 @@
 from __future__ import annotations
 
 import asyncio
+import json
+import logging
 import time
-import uuid
-from typing import Any, Dict, List, Optional
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
 from fastapi import Depends, FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, Gauge, generate_latest
 
+from .cache import collection_version, get_query_cache, get_semantic_cache, make_key
 from .config import get_settings
+from .context_packer import pack_context
 from .deps import get_llm
+from .jobs import JobQueue, JobStore, MemoryJobStore, QueueFull, SQLiteJobStore
+from .metrics import REGISTRY, monitor_event_loop, record_stage, stage, track_stages
 from .models import AnswerRequest, AnswerResponse, Citation, SearchRequest, SearchResponse, AnswerAsyncStartResponse, AnswerJobStatus
 from .prompts import ANSWER_TEMPLATE, SYSTEM_PROMPT
-from .retriever import search
-from .utils import all_json_fences_valid, trim_context
+from .rerank import get_rerank_batcher, get_rerank_cache
+from .retriever import aembed_query, ahydrate, asearch, get_query_batcher
+from .utils import JsonFenceChecker, all_json_fences_valid
+from .warmup import READINESS, warm_up
 
-app = FastAPI(title="RAG over Markdown")
 
-# In-memory async jobs store
-_JOBS: Dict[str, Dict[str, Any]] = {}
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    settings = get_settings()
+    logging.basicConfig(level=settings.log_level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    tasks = []
+    if settings.loop_lag_interval_ms > 0:
+        tasks.append(asyncio.create_task(monitor_event_loop(settings.loop_lag_interval_ms / 1000.0)))
+    if settings.warmup_enabled:
+        # warm up in the background: /health answers at once, /ready once models are loaded
+        tasks.append(asyncio.create_task(warm_up()))
+    else:
+        READINESS.ready = True
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+app = FastAPI(title="RAG over Markdown", lifespan=lifespan)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
 
 
 @app.get("/health")
@@ -25,27 +59,105 @@ async def health() -> Dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/ready")
+async def ready() -> JSONResponse:
+    return JSONResponse(READINESS.as_dict(), status_code=200 if READINESS.ready else 503)
+
+
+@app.get("/stats")
+async def stats() -> Dict[str, Any]:
+    return {
+        "embedder": get_query_batcher().stats(),
+        "reranker": {**get_rerank_batcher().stats(), "cache": get_rerank_cache().stats()},
+        "cache": {**get_query_cache().stats(), "semantic": get_semantic_cache().stats()},
+        "jobs": get_job_queue().stats(),
+        "llm": _llm_stats(),
+    }
+
+
+def _llm_stats() -> Dict[str, Any]:
+    try:
+        llm = get_llm()
+    except RuntimeError:
+        return {}
+    return llm.stats() if hasattr(llm, "stats") else {}
+
+
+def _cache_meta(tier: Optional[str]) -> Dict[str, Any]:
+    st = get_query_cache().stats()
+    return {"hit": tier is not None, "tier": tier, "hit_rate": round(st["hit_rate"], 4)}
+
+
 @app.post("/search", response_model=SearchResponse)
 async def post_search(req: SearchRequest) -> SearchResponse:
-    results = search(
-        query=req.query,
-        top_k=req.top_k,
-        filters=req.filters,
-        with_rerank=req.with_rerank,
-        collection=get_settings().qdrant_collection,
-    )
-    return SearchResponse(results=results)  # type: ignore[arg-type]
+    with track_stages() as stages:
+        out = await _search(req)
+    out.meta["stages_ms"] = stages
+    return out
 
 
-async def _build_answer(req: AnswerRequest) -> AnswerResponse:
-    t0 = time.time()
+async def _search(req: SearchRequest) -> SearchResponse:
     settings = get_settings()
-    results = search(
+    collection = settings.qdrant_collection
+    if not settings.cache_enabled:
+        results = await asearch(
+            query=req.query,
+            top_k=req.top_k,
+            filters=req.filters,
+            with_rerank=req.with_rerank,
+            collection=collection,
+            mode=req.mode,
+            with_text=req.with_text,
+        )
+        return SearchResponse(results=results)  # type: ignore[arg-type]
+
+    cache = get_query_cache()
+    key = make_key("search", query=req.query, filters=req.filters, top_k=req.top_k,
+                   with_rerank=req.with_rerank, collection=collection,
+                   mode=req.mode or settings.retrieval_mode, with_text=req.with_text)
+    version = collection_version(collection)
+    results, tier = cache.get(key, version)
+    if results is None:
+        results = await asearch(
+            query=req.query,
+            top_k=req.top_k,
+            filters=req.filters,
+            with_rerank=req.with_rerank,
+            collection=collection,
+            mode=req.mode,
+            with_text=req.with_text,
+        )
+        cache.set(key, version, results)
+    return SearchResponse(results=results, meta={"cache": _cache_meta(tier)})  # type: ignore[arg-type]
+
+
+_INVALID_JSON_NOTE = "\n\nПримечание: Обнаружен невалидный JSON во фрагменте ответа; исправьте синтаксис."
+
+
+@dataclass
+class _AnswerPlan:
+    """Everything needed to generate an answer once retrieval is done."""
+
+    messages: List[Dict[str, str]]
+    citations: List[Citation]
+    related: List[Citation]
+    used_chunks: List[Dict[str, Any]]
+
+
+async def _plan_answer(
+    req: AnswerRequest, t0: float, query_vector: Optional[List[float]] = None
+) -> AnswerResponse | _AnswerPlan:
+    """Retrieve and build the prompt, or return a ready no-answer response."""
+    settings = get_settings()
+    results = await asearch(
         query=req.query,
         top_k=req.top_k,
         filters=req.filters,
         with_rerank=req.with_rerank,
         collection=settings.qdrant_collection,
+        mode=req.mode,
+        query_vector=query_vector,
+        with_text=False,
     )
     # basic no-answer policy: if empty or low scores
     if not results:
@@ -58,8 +170,13 @@ async def _build_answer(req: AnswerRequest) -> AnswerResponse:
             meta={"latency_ms": int((time.time() - t0) * 1000)},
         )
 
-    # Simple relevance threshold: adapt if rerank is enabled (CrossEncoder scores are usually higher)
-    top_score = results[0]["score"]
+    # Simple relevance threshold: adapt if rerank is enabled (CrossEncoder scores are usually higher).
+    # Without rerank, judge by the best dense similarity: fused (hybrid/m3) scores are rank-based
+    # and the top hit always scores at least 0.5, however unrelated the query.
+    if req.with_rerank:
+        top_score = results[0]["score"]
+    else:
+        top_score = max(r.get("dense_score", r["score"]) or 0.0 for r in results)
     threshold = 0.2 if not req.with_rerank else 0.05
     if top_score < threshold:
         related = [
@@ -74,24 +191,17 @@ async def _build_answer(req: AnswerRequest) -> AnswerResponse:
             meta={"latency_ms": int((time.time() - t0) * 1000)},
         )
 
-    # Build context: dedup by source + anchor, keep top 6-8 after rerank
-    top_chunks = results[:8] if req.with_rerank else results[:6]
-    seen: set[tuple[str, str | None]] = set()
-    context_parts: List[str] = []
-    citations: List[Citation] = []
-    used_chunks: List[Dict[str, Any]] = []
-    for r in top_chunks:
-        key = (r["source"], r.get("anchor"))
-        if key in seen:
-            continue
-        seen.add(key)
-        title = r.get("section") or r.get("title") or ""
-        header = f"## {title}" if title else ""
-        context_parts.append("\n\n".join([header, r["text"]]).strip())
-        citations.append(Citation(title=title or None, source=r["source"], anchor=r.get("anchor")))
-        used_chunks.append(r)
-
-    context, used_tokens = trim_context(context_parts, max_tokens=req.max_context_tokens)
+    # Pack the top 6-8 chunks (after rerank) into the token budget
+    top_chunks = await ahydrate(results[:8] if req.with_rerank else results[:6], settings.qdrant_collection)
+    with stage("pack"):
+        packed = pack_context(top_chunks, max_tokens=req.max_context_tokens)
+    context, used_tokens = packed.text, packed.tokens
+    citations = [
+        Citation(title=g[0].get("section") or g[0].get("title") or None, source=g[0]["source"],
+                 anchor=g[0].get("anchor"))
+        for g in packed.groups
+    ]
+    used_chunks = [c for g in packed.groups for c in g]
 
     # If context is too small, return a graceful no-answer
     if used_tokens < 50:
@@ -105,18 +215,11 @@ async def _build_answer(req: AnswerRequest) -> AnswerResponse:
             meta={"latency_ms": int((time.time() - t0) * 1000)},
         )
 
-    llm = get_llm()
     messages = [
         {"role": "system", "content": SYSTEM_PROMPT},
         {"role": "user", "content": ANSWER_TEMPLATE.format(context=context, question=req.query)},
     ]
 
-    answer_text = await llm.acomplete(messages, temperature=0.2, max_tokens=800)
-
-    # Validate JSON fences if any
-    if not all_json_fences_valid(answer_text):
-        answer_text += "\n\nПримечание: Обнаружен невалидный JSON во фрагменте ответа; исправьте синтаксис."
-
     # Ensure we do not cite sources not used
     used_sources = {(c.source, c.anchor) for c in citations}
     related = []
@@ -126,43 +229,243 @@ async def _build_answer(req: AnswerRequest) -> AnswerResponse:
             continue
         related.append(Citation(title=r.get("section") or r.get("title"), source=r["source"], anchor=r.get("anchor")))
 
-    out = AnswerResponse(
+    return _AnswerPlan(messages=messages, citations=citations, related=related, used_chunks=used_chunks)
+
+
+def _finish_answer(plan: _AnswerPlan, answer_text: str, t0: float) -> AnswerResponse:
+    return AnswerResponse(
         answer=answer_text.strip(),
-        citations=citations,
-        related=related,
-        used_chunks=used_chunks,  # type: ignore[arg-type]
+        citations=plan.citations,
+        related=plan.related,
+        used_chunks=plan.used_chunks,  # type: ignore[arg-type]
         meta={"latency_ms": int((time.time() - t0) * 1000)},
     )
+
+
+async def _build_answer(req: AnswerRequest, query_vector: Optional[List[float]] = None) -> AnswerResponse:
+    t0 = time.time()
+    plan = await _plan_answer(req, t0, query_vector)
+    if isinstance(plan, AnswerResponse):
+        return plan
+
+    llm = get_llm()
+    t_llm = time.time()
+    answer_text = await llm.acomplete(plan.messages, temperature=0.2, max_tokens=800)
+    record_stage("llm_total", time.time() - t_llm)
+    llm_ms = int((time.time() - t_llm) * 1000)
+
+    # Validate JSON fences if any
+    with stage("json_validation"):
+        valid = all_json_fences_valid(answer_text)
+    if not valid:
+        answer_text += _INVALID_JSON_NOTE
+    out = _finish_answer(plan, answer_text, t0)
+    out.meta["llm_ms"] = llm_ms
+    return out
+
+
+def _answer_cache_key(req: AnswerRequest) -> str:
+    settings = get_settings()
+    return make_key("answer", query=req.query, filters=req.filters, top_k=req.top_k,
+                    with_rerank=req.with_rerank, max_context_tokens=req.max_context_tokens,
+                    collection=settings.qdrant_collection, mode=req.mode or settings.retrieval_mode)
+
+
+def _answer_scope(req: AnswerRequest) -> str:
+    """Everything that shapes an answer except the query text (semantic cache scope)."""
+    settings = get_settings()
+    return make_key("answer-scope", filters=req.filters, top_k=req.top_k, with_rerank=req.with_rerank,
+                    max_context_tokens=req.max_context_tokens, collection=settings.qdrant_collection,
+                    mode=req.mode or settings.retrieval_mode)
+
+
+async def _semantic_lookup(
+    req: AnswerRequest, version: str
+) -> Tuple[Optional[List[float]], Optional[AnswerResponse]]:
+    """Query embedding (reused for retrieval) and a cached answer to a close paraphrase, if any."""
+    if not get_settings().semantic_cache_enabled:
+        return None, None
+    vector = await aembed_query(req.query)
+    cached, similarity = get_semantic_cache().get(vector, _answer_scope(req), version)
+    if cached is None:
+        return vector, None
+    out = AnswerResponse(**cached)
+    out.meta["similarity"] = round(similarity, 4)
+    return vector, out
+
+
+def _semantic_store(req: AnswerRequest, version: str, vector: Optional[List[float]], out: AnswerResponse) -> None:
+    # only LLM answers are worth it; no-answer responses are cheap to recompute
+    if vector is not None and "llm_ms" in out.meta:
+        get_semantic_cache().set(vector, _answer_scope(req), version, out.model_dump(),
+                                 llm_ms=out.meta["llm_ms"])
+
+
+async def _cached_answer(req: AnswerRequest) -> AnswerResponse:
+    with track_stages() as stages:
+        out = await _lookup_or_build_answer(req)
+    out.meta["stages_ms"] = stages
+    return out
+
+
+async def _lookup_or_build_answer(req: AnswerRequest) -> AnswerResponse:
+    settings = get_settings()
+    if not settings.cache_enabled:
+        return await _build_answer(req)
+
+    t0 = time.time()
+    cache = get_query_cache()
+    key = _answer_cache_key(req)
+    version = collection_version(settings.qdrant_collection)
+    cached, tier = cache.get(key, version)
+    if cached is not None:
+        out = AnswerResponse(**cached)
+        out.meta["latency_ms"] = int((time.time() - t0) * 1000)
+    else:
+        vector, out = await _semantic_lookup(req, version)
+        if out is not None:
+            tier = "semantic"
+            out.meta["latency_ms"] = int((time.time() - t0) * 1000)
+        else:
+            out = await _build_answer(req, vector)
+            _semantic_store(req, version, vector, out)
+        cache.set(key, version, out.model_dump())
+    out.meta["cache"] = _cache_meta(tier)
     return out
 
 
 @app.post("/answer", response_model=AnswerResponse)
 async def post_answer(req: AnswerRequest) -> AnswerResponse:
-    return await _build_answer(req)
+    return await _cached_answer(req)
 
 
-@app.post("/answer_async/start", response_model=AnswerAsyncStartResponse)
-async def post_answer_async_start(req: AnswerRequest) -> AnswerAsyncStartResponse:
-    job_id = str(uuid.uuid4())
-    _JOBS[job_id] = {"status": "pending", "result": None, "error": None}
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _citation_event(out: AnswerResponse | _AnswerPlan) -> str:
+    return _sse("citations", {
+        "citations": [c.model_dump() for c in out.citations],
+        "related": [c.model_dump() for c in out.related],
+    })
+
 
-    async def _runner() -> None:
-        _JOBS[job_id]["status"] = "running"
+async def _stream_answer(req: AnswerRequest) -> AsyncIterator[str]:
+    """SSE events: ``citations`` first, then ``token`` pieces, then ``done`` with meta."""
+    t0 = time.time()
+    settings = get_settings()
+    key, version = _answer_cache_key(req), collection_version(settings.qdrant_collection)
+    vector: Optional[List[float]] = None
+    with track_stages() as stages:
         try:
-            result = await _build_answer(req)
-            _JOBS[job_id]["result"] = result
-            _JOBS[job_id]["status"] = "done"
+            if settings.cache_enabled:
+                cached, tier = get_query_cache().get(key, version)
+                hit = None
+                if cached is None:
+                    vector, hit = await _semantic_lookup(req, version)
+                if hit is not None:
+                    cached, tier = hit.model_dump(), "semantic"
+                if cached is not None:
+                    out = AnswerResponse(**cached)
+                    yield _citation_event(out)
+                    yield _sse("token", {"text": out.answer})
+                    meta = {**out.meta, "latency_ms": int((time.time() - t0) * 1000), "cache": _cache_meta(tier),
+                            "stages_ms": stages}
+                    yield _sse("done", {"meta": meta})
+                    return
+
+            plan = await _plan_answer(req, t0, vector)
+            if isinstance(plan, AnswerResponse):
+                out = plan
+                yield _citation_event(out)
+                yield _sse("token", {"text": out.answer})
+            else:
+                yield _citation_event(plan)
+                parts: List[str] = []
+                fences = JsonFenceChecker()
+                ttft_ms: Optional[int] = None
+                validation_s = 0.0
+                t_llm = time.time()
+                async for piece in get_llm().astream(plan.messages, temperature=0.2, max_tokens=800):
+                    if ttft_ms is None:
+                        ttft_ms = int((time.time() - t0) * 1000)
+                        record_stage("llm_ttft", time.time() - t_llm)
+                    parts.append(piece)
+                    t_check = time.perf_counter()
+                    fences.feed(piece)
+                    validation_s += time.perf_counter() - t_check
+                    yield _sse("token", {"text": piece})
+                record_stage("llm_total", time.time() - t_llm)
+                record_stage("json_validation", validation_s)
+                if not fences.valid:
+                    parts.append(_INVALID_JSON_NOTE)
+                    yield _sse("token", {"text": _INVALID_JSON_NOTE})
+                out = _finish_answer(plan, "".join(parts), t0)
+                out.meta["ttft_ms"] = ttft_ms
+                out.meta["llm_ms"] = int((time.time() - t_llm) * 1000)
+            if settings.cache_enabled:
+                _semantic_store(req, version, vector, out)
+                get_query_cache().set(key, version, out.model_dump())
+                out.meta["cache"] = _cache_meta(None)
+            yield _sse("done", {"meta": {**out.meta, "stages_ms": stages}})
         except Exception as e:  # noqa: BLE001
-            _JOBS[job_id]["status"] = "error"
-            _JOBS[job_id]["error"] = str(e)
+            yield _sse("error", {"detail": str(e)})
 
-    asyncio.create_task(_runner())
-    return AnswerAsyncStartResponse(job_id=job_id)
+
+@app.post("/answer/stream")
+async def post_answer_stream(req: AnswerRequest) -> StreamingResponse:
+    return StreamingResponse(
+        _stream_answer(req),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _run_answer_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    out = await _cached_answer(AnswerRequest(**payload))
+    return out.model_dump()
+
+
+@lru_cache(maxsize=1)
+def get_job_queue() -> JobQueue:
+    cfg = get_settings()
+    store: JobStore = SQLiteJobStore(cfg.jobs_sqlite_path) if cfg.jobs_sqlite_path else MemoryJobStore()
+    return JobQueue(
+        _run_answer_job,
+        store,
+        workers=cfg.jobs_workers,
+        max_pending=cfg.jobs_max_pending,
+        ttl_s=cfg.jobs_ttl_s,
+        lease_s=cfg.jobs_lease_s,
+        poll_interval_s=cfg.jobs_poll_interval_s,
+    )
+
+
+Gauge("rag_jobs_pending", "Async answer jobs waiting in the queue", registry=REGISTRY).set_function(
+    lambda: get_job_queue().stats()["depth"])
+Gauge("rag_jobs_running", "Async answer jobs being processed", registry=REGISTRY).set_function(
+    lambda: get_job_queue().stats()["running"])
+
+
+@app.post("/answer_async/start", response_model=AnswerAsyncStartResponse)
+async def post_answer_async_start(req: AnswerRequest, priority: int = 0) -> AnswerAsyncStartResponse:
+    queue = get_job_queue()
+    try:
+        job = await queue.submit(req.model_dump(), priority=priority)
+    except QueueFull as e:
+        raise HTTPException(
+            status_code=429,
+            detail={"error": "job queue is full", "queue_depth": e.depth},
+            headers={"Retry-After": str(queue.retry_after_s())},
+        ) from None
+    return AnswerAsyncStartResponse(job_id=job.id, position=await queue.position(job.id))
 
 
 @app.get("/answer_async/status/{job_id}", response_model=AnswerJobStatus)
 async def get_answer_async_status(job_id: str) -> AnswerJobStatus:
-    data = _JOBS.get(job_id)
-    if not data:
+    queue = get_job_queue()
+    job = await queue.get(job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="job not found")
-    return AnswerJobStatus(status=data["status"], result=data.get("result"), error=data.get("error")) 
\ No newline at end of file
+    position = await queue.position(job_id) if job.status == "pending" else None
+    return AnswerJobStatus(status=job.status, result=job.result, error=job.error, position=position)
@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+
+@dataclass
+class FileState:
+    mtime_ns: int
+    size: int
+    sha256: str
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def is_under(source: str, root: Path) -> bool:
+    """Whether ``source`` (a ``Path.as_posix()`` key) is ``root`` or lies below it."""
+    top = root.as_posix()
+    return source == top or source.startswith(top.rstrip("/") + "/")
+
+
+class Manifest:
+    """Persisted per-file state (mtime, size, content hash) of the last successful ingest.
+
+    Keys are the ``source`` strings stored in chunk payloads (``Path.as_posix()``).
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.files: Dict[str, FileState] = {}
+        if path.exists():
+            raw = json.loads(path.read_text(encoding="utf-8"))
+            self.files = {k: FileState(**v) for k, v in raw.get("files", {}).items()}
+
+    def diff(self, paths: Iterable[Path], *, root: Path) -> Tuple[List[Path], List[str]]:
+        """Return ``(changed, deleted)``: files that are new or modified, and sources that vanished.
+
+        ``paths`` is everything currently under ``root``; only sources under ``root`` can
+        be reported as deleted. Files whose mtime and size match the manifest are skipped
+        without reading them; a touched file with identical content is not reported as changed.
+        """
+        changed: List[Path] = []
+        present = set()
+        for p in paths:
+            key = p.as_posix()
+            present.add(key)
+            st = p.stat()
+            old = self.files.get(key)
+            if old is not None and old.mtime_ns == st.st_mtime_ns and old.size == st.st_size:
+                continue
+            digest = file_sha256(p)
+            if old is not None and old.sha256 == digest:
+                self.files[key] = FileState(st.st_mtime_ns, st.st_size, digest)
+                continue
+            changed.append(p)
+        deleted = sorted(k for k in self.files if k not in present and is_under(k, root))
+        return changed, deleted
+
+    def record(self, path: Path) -> None:
+        st = path.stat()
+        self.files[path.as_posix()] = FileState(st.st_mtime_ns, st.st_size, file_sha256(path))
+
+    def forget(self, source: str) -> None:
+        self.files.pop(source, None)
+
+    def clear(self) -> None:
+        self.files.clear()
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        data = {"files": {k: asdict(v) for k, v in sorted(self.files.items())}}
+        tmp.write_text(json.dumps(data, indent=1), encoding="utf-8")
+        tmp.replace(self.path)
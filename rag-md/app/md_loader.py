@@ -1,13 +1,14 @@
 from __future__ import annotations
 
 import datetime as dt
+import io
+import re
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Tuple
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
 
-import frontmatter
+from frontmatter.default_handlers import YAMLHandler
 from markdown_it import MarkdownIt
-from markdown_it.token import Token
 
 
 @dataclass
@@ -18,6 +19,17 @@ class MDSection:
     anchor: Optional[str]
     text: str
     meta: Dict[str, str]
+    # byte range [start, end) of the section in the source file, heading line included
+    start: int = 0
+    end: int = 0
+
+
+# Only a column-0 ATX h1-h4 line can start a new segment: such a line always closes
+# the open paragraph/list/quote, so parsing segments separately yields the same tokens.
+_SPLIT_RE = re.compile(r"#{1,4}(?:[ \t]|$)")
+_FENCE_RE = re.compile(r"\s*(`{3,}|~{3,})(.*)")
+_FM_BOUNDARY_RE = re.compile(r"-{3,}\s*")
+_HTML_RAW_RE = re.compile(r"\s{0,3}<(script|pre|style|textarea)(?:\s|>|$)", re.IGNORECASE)
 
 
 def _slugify(text: str) -> str:
@@ -25,74 +37,169 @@ def _slugify(text: str) -> str:
     return "#" + "".join(ch for ch in s if ch.isalnum() or ch in {"-", "_", "#"})
 
 
-def parse_markdown(file_path: Path) -> Tuple[List[MDSection], Dict[str, str]]:
-    post = frontmatter.load(file_path)
-    raw = post.content
-    fm = post.metadata or {}
-
+def _md() -> MarkdownIt:
     md = MarkdownIt("commonmark", options_update={"linkify": True, "typographer": False})
-    tokens = md.parse(raw)
-
-    sections: List[MDSection] = []
-    current_title: Optional[str] = None
-    current_section: Optional[str] = None
-    current_anchor: Optional[str] = None
+    # Sections only use the raw ``content`` of block-level tokens, so skip inline parsing.
+    return md.disable(["inline", "text_join"])
+
+
+def _read_front_matter(f: BinaryIO) -> Tuple[Dict[str, object], int]:
+    """Read YAML front matter from the head of ``f``; return it and the body's byte offset."""
+    pos = 0
+    for raw in f:
+        if raw.strip():
+            break
+        pos += len(raw)
+    else:
+        return {}, pos
+    if not _FM_BOUNDARY_RE.fullmatch(raw.decode("utf-8").strip()):
+        return {}, pos
+    fm: List[str] = []
+    end = pos + len(raw)
+    for line in f:
+        end += len(line)
+        text = line.decode("utf-8")
+        if _FM_BOUNDARY_RE.fullmatch(text.rstrip("\r\n")):
+            data = YAMLHandler().load("".join(fm))
+            return (data if isinstance(data, dict) else {}), end
+        fm.append(text)
+    return {}, pos  # unterminated: the whole file is content
+
+
+def _segments(f: BinaryIO, pos: int) -> Iterator[Tuple[str, List[int]]]:
+    """Yield ``(text, offsets)`` for runs of lines that start at an h1-h4 ATX heading.
+
+    ``offsets`` holds the byte offset of every line plus the offset just past the run.
+    Lines inside fenced code, HTML comments and raw HTML blocks are never split points.
+    """
+    first = True
+    lines: List[str] = []
+    offsets: List[int] = []
+    fence: Optional[str] = None
+    html_end: Optional[str] = None
+    for raw in f:
+        line = raw.decode("utf-8")
+        if not lines and not line.strip():
+            pos += len(raw)  # the body is stripped, as frontmatter.load does
+            continue
+        if first:
+            line, first = line.lstrip(), False
+        if fence is not None:
+            m = _FENCE_RE.match(line)
+            if m and m.group(1)[0] == fence[0] and len(m.group(1)) >= len(fence) and not m.group(2).strip():
+                fence = None
+        elif html_end is not None:
+            if html_end in line.lower():
+                html_end = None
+        elif _SPLIT_RE.match(line) and lines:
+            yield "".join(lines), offsets + [pos]
+            lines, offsets = [], []
+        else:
+            m = _FENCE_RE.match(line)
+            if m and not (m.group(1)[0] == "`" and "`" in m.group(2)):
+                fence = m.group(1)
+            elif "<!--" in line and "-->" not in line.split("<!--", 1)[1]:
+                html_end = "-->"
+            else:
+                h = _HTML_RAW_RE.match(line)
+                if h and f"</{h.group(1).lower()}>" not in line.lower():
+                    html_end = f"</{h.group(1).lower()}>"
+        lines.append(line)
+        offsets.append(pos)
+        pos += len(raw)
+    if lines:
+        yield "".join(lines), offsets + [pos]
+
+
+def _iter_body(f: BinaryIO, pos: int, source: str, meta: Dict[str, str]) -> Iterator[MDSection]:
+    md = _md()
+    title: Optional[str] = None
+    section: Optional[str] = None
+    anchor: Optional[str] = None
+    start = pos
     buf: List[str] = []
 
-    def flush() -> None:
-        nonlocal buf, current_section, current_anchor
-        if not buf:
-            return
+    def flush(end: int) -> Optional[MDSection]:
+        nonlocal buf
         text = "".join(buf).strip()
-        if text:
-            sections.append(
-                MDSection(
-                    source=str(file_path.as_posix()),
-                    title=current_title,
-                    section=current_section,
-                    anchor=current_anchor,
-                    text=text,
-                    meta={k: str(v) for k, v in fm.items()},
-                )
-            )
         buf = []
-
-    # Build content grouped by h1-h4
-    i = 0
-    while i < len(tokens):
-        t = tokens[i]
-        if t.type == "heading_open" and t.tag in {"h1", "h2", "h3", "h4"}:
-            # when a new header starts, flush previous buffer
-            flush()
-            # next token is inline with content
-            content_token = tokens[i + 1]
-            heading_text = content_token.content.strip()
-            if t.tag == "h1" and current_title is None:
-                current_title = heading_text
-            current_section = heading_text
-            current_anchor = _slugify(heading_text)
-            i += 3
-            continue
-        # Preserve code blocks and tables by copying token content verbatim
-        if t.type in {"fence", "code_block"}:
-            buf.append(t.content)
+        if not text:
+            return None
+        return MDSection(
+            source=source, title=title, section=section, anchor=anchor, text=text,
+            meta=dict(meta), start=start, end=end,
+        )
+
+    end = pos
+    for text, offsets in _segments(f, pos):
+        tokens = md.parse(text)
+        # Build content grouped by h1-h4
+        i = 0
+        while i < len(tokens):
+            t = tokens[i]
+            if t.type == "heading_open" and t.tag in {"h1", "h2", "h3", "h4"}:
+                # when a new header starts, flush previous buffer
+                at = offsets[t.map[0]] if t.map else offsets[0]
+                done = flush(at)
+                if done is not None:
+                    yield done
+                # next token is inline with content
+                heading_text = tokens[i + 1].content.strip()
+                if t.tag == "h1" and title is None:
+                    title = heading_text
+                section = heading_text
+                anchor = _slugify(heading_text)
+                start = at
+                i += 3
+                continue
+            # Preserve code blocks and tables by copying token content verbatim
+            if t.type in {"fence", "code_block"}:
+                buf.append(t.content)
+            elif t.type == "inline":
+                buf.append(t.content + "\n")
             i += 1
-            continue
-        if t.type == "inline":
-            buf.append(t.content + "\n")
-        i += 1
+        end = offsets[-1]
+    done = flush(end)
+    if done is not None:
+        yield done
+
 
-    flush()
+def iter_sections(file_path: Path) -> Iterator[MDSection]:
+    """Stream the h1-h4 sections of ``file_path`` as each heading closes them.
 
-    # add updated_at
+    The file is read line by line and only one heading-delimited segment is parsed at a
+    time, so memory stays bounded by the largest section rather than the whole file.
+    """
     updated = dt.datetime.fromtimestamp(file_path.stat().st_mtime).isoformat()
-    for s in sections:
-        s.meta.setdefault("updated_at", updated)
+    with file_path.open("rb") as f:
+        fm, pos = _read_front_matter(f)
+        f.seek(pos)
+        meta = {k: str(v) for k, v in fm.items()}
+        meta.setdefault("updated_at", updated)
+        yield from _iter_body(f, pos, str(file_path.as_posix()), meta)
+
+
+def read_front_matter(file_path: Path) -> Dict[str, str]:
+    with file_path.open("rb") as f:
+        fm, _ = _read_front_matter(f)
+    return {k: str(v) for k, v in fm.items()}
 
-    return sections, {k: str(v) for k, v in fm.items()}
+
+def read_section_text(file_path: Path, start: int, end: int) -> str:
+    """Re-read the text of the section stored at ``[start, end)`` without parsing the rest of the file."""
+    with file_path.open("rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    for sec in _iter_body(io.BytesIO(data), start, str(file_path.as_posix()), {}):
+        return sec.text
+    return ""
+
+
+def parse_markdown(file_path: Path) -> Tuple[List[MDSection], Dict[str, str]]:
+    return list(iter_sections(file_path)), read_front_matter(file_path)
 
 
 def load_md_folder(folder: Path) -> Iterable[Tuple[Path, List[MDSection], Dict[str, str]]]:
     for p in folder.rglob("*.md"):
         sections, fm = parse_markdown(p)
-        yield p, sections, fm 
\ No newline at end of file
+        yield p, sections, fm
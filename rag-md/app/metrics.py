@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, disable_created_metrics, write_to_textfile
+
+# Prometheus metrics of this process, kept in their own registry (exposed by /metrics
+# and written by ingest --metrics-file). Per-series *_created samples are left out.
+disable_created_metrics()
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REGISTRY = CollectorRegistry()
+
+
+def write_textfile(path: str, registry: CollectorRegistry = REGISTRY) -> None:
+    """Write the metrics for a Prometheus textfile collector (atomic replace)."""
+    write_to_textfile(path, registry)
+
+
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Time spent per request pipeline stage", ("stage",),
+                          buckets=LATENCY_BUCKETS, registry=REGISTRY)
+CACHE_LOOKUPS = Counter("rag_cache_lookups_total", "Cache lookups by cache and result", ("cache", "result"),
+                        registry=REGISTRY)
+INGEST_STAGE_SECONDS = Histogram(
+    "rag_ingest_stage_seconds", "Time per ingest work unit (file, encode batch, upsert request)", ("stage",),
+    buckets=LATENCY_BUCKETS, registry=REGISTRY)
+INGEST_ITEMS = Counter("rag_ingest_items_total", "Items processed per ingest stage (files, chunks, points)",
+                       ("stage",), registry=REGISTRY)
+EVENT_LOOP_LAG = Histogram(
+    "rag_event_loop_lag_seconds", "How late the event loop woke up a periodic timer",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5), registry=REGISTRY)
+
+
+async def monitor_event_loop(interval_s: float) -> None:
+    """Sleep ``interval_s`` in a loop and record how late each wake-up is: time the
+    loop spent running other callbacks (blocking code in a handler shows up here)."""
+    loop = asyncio.get_running_loop()
+    while True:
+        t0 = loop.time()
+        await asyncio.sleep(interval_s)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - t0 - interval_s))
+
+
+# Per-request stage breakdown: ``track_stages`` installs a dict in a context
+# variable; ``stage`` timers add to it (child tasks share it) and to the histogram.
+_STAGES: ContextVar[Optional[Dict[str, float]]] = ContextVar("rag_stages", default=None)
+
+
+@contextmanager
+def track_stages() -> Iterator[Dict[str, float]]:
+    """Collect stage timings (ms) of the code inside into the yielded dict."""
+    stages: Dict[str, float] = {}
+    token = _STAGES.set(stages)
+    try:
+        yield stages
+    finally:
+        _STAGES.reset(token)
+
+
+def record_stage(name: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(name).observe(seconds)
+    stages = _STAGES.get()
+    if stages is not None:
+        stages[name] = round(stages.get(name, 0.0) + seconds * 1000.0, 2)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - t0)
@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Literal, Optional
 from pydantic import BaseModel, Field
 
 
@@ -9,21 +9,32 @@ class SearchRequest(BaseModel):
     top_k: int = 20
     filters: Optional[Dict[str, Any]] = None
     with_rerank: bool = False
+    # None = RETRIEVAL_MODE setting
+    mode: Optional[Literal["dense", "hybrid", "m3"]] = None
+    # False: metadata and scores only, chunk texts are neither fetched nor returned
+    with_text: bool = True
 
 
 class Chunk(BaseModel):
-    text: str
-    score: float
+    text: Optional[str] = None
+    # dense: cosine similarity; hybrid/m3: fused rank score in (0, 1]; reranked: the reranker's
+    # score, None for candidates below the rerank cutoff (their retrieval score is in retrieval_score)
+    score: Optional[float]
+    retrieval_score: Optional[float] = None
+    # similarity to the query from the dense leg; None if only the lexical/sparse leg found it
+    dense_score: Optional[float] = None
     source: str
     title: Optional[str] = None
     section: Optional[str] = None
     anchor: Optional[str] = None
     updated_at: Optional[str] = None
+    token_count: Optional[int] = None
     tags: Optional[Dict[str, Any]] = None
 
 
 class SearchResponse(BaseModel):
     results: List[Chunk]
+    meta: Dict[str, Any] = Field(default_factory=dict)
 
 
 class AnswerRequest(BaseModel):
@@ -32,6 +43,7 @@ class AnswerRequest(BaseModel):
     max_context_tokens: int = 3500
     with_rerank: bool = True
     filters: Optional[Dict[str, Any]] = None
+    mode: Optional[Literal["dense", "hybrid", "m3"]] = None
 
 
 class Citation(BaseModel):
@@ -51,9 +63,11 @@ class AnswerResponse(BaseModel):
 # Async job models
 class AnswerAsyncStartResponse(BaseModel):
     job_id: str
+    position: Optional[int] = None  # 1-based place in the queue while pending
 
 
 class AnswerJobStatus(BaseModel):
     status: str  # pending | running | done | error
     result: Optional[AnswerResponse] = None
-    error: Optional[str] = None 
\ No newline at end of file
+    error: Optional[str] = None
+    position: Optional[int] = None
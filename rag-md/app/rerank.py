@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .batching import MicroBatcher
+from .cache import normalize_query
+from .config import get_settings
+from .deps import get_inference_executor, get_reranker
+from .embed_cache import point_id
+from .metrics import CACHE_LOOKUPS
+
+Pair = Tuple[str, str]
+
+
+def _sigmoid(x: float) -> float:
+    # numerically stable sigmoid: CrossEncoder logits -> probabilities
+    if x >= 0:
+        return 1.0 / (1.0 + math.exp(-x))
+    z = math.exp(x)
+    return z / (1.0 + z)
+
+
+def rerank_depth(scores: Sequence[Optional[float]], *, top_n: int, min_n: int, max_gap: float) -> int:
+    """How many leading candidates to rerank.
+
+    At most ``top_n``; past the first ``min_n`` the list is cut where a dense
+    similarity falls more than ``max_gap`` below the best one, since such
+    candidates rarely overtake the head after reranking. ``None`` (a hybrid
+    candidate only the lexical leg found) never cuts.
+    """
+    n = min(len(scores), max(top_n, 0))
+    known = [s for s in scores[:n] if s is not None]
+    if n == 0 or max_gap <= 0 or not known:
+        return n
+    floor = max(known) - max_gap
+    for i in range(min(min_n, n), n):
+        s = scores[i]
+        if s is not None and s < floor:
+            return i
+    return n
+
+
+class RerankCache:
+    """Thread-safe LRU of reranker scores keyed by (query hash, chunk id)."""
+
+    def __init__(self, max_entries: int = 4096) -> None:
+        self._max_entries = max_entries
+        self._data: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, str]) -> Optional[float]:
+        with self._lock:
+            score = self._data.get(key)
+            if score is None:
+                self.misses += 1
+                CACHE_LOOKUPS.labels("rerank", "miss").inc()
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            CACHE_LOOKUPS.labels("rerank", "hit").inc()
+            return score
+
+    def set(self, key: Tuple[str, str], score: float) -> None:
+        with self._lock:
+            self._data[key] = score
+            self._data.move_to_end(key)
+            while len(self._data) > self._max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {"entries": len(self._data), "hits": self.hits, "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0}
+
+
+@lru_cache(maxsize=1)
+def get_rerank_cache() -> RerankCache:
+    return RerankCache(get_settings().rerank_cache_entries)
+
+
+def _passage(text: str) -> str:
+    # The model tokenizer truncates pairs to RERANK_MAX_TOKENS; cutting very long
+    # chunks first keeps it from tokenizing text that would be dropped anyway.
+    return text[: get_settings().rerank_max_tokens * 8]
+
+
+def score_pairs(pairs: List[Pair]) -> List[float]:
+    """Reranker scores in (0, 1) for ``(query, passage)`` pairs, one forward pass; blocking."""
+    rr = get_reranker()
+    assert rr is not None
+    scores = rr.predict([[q, _passage(p)] for q, p in pairs], batch_size=max(len(pairs), 1))
+    return [_sigmoid(float(s)) for s in scores]
+
+
+@lru_cache(maxsize=1)
+def get_rerank_batcher() -> MicroBatcher[Pair, float]:
+    cfg = get_settings()
+    return MicroBatcher(
+        score_pairs,
+        max_batch_size=cfg.rerank_batch_max_size,
+        max_wait_ms=cfg.rerank_batch_max_wait_ms,
+        executor=get_inference_executor(),
+    )
+
+
+def _plan(query: str, results: List[Dict[str, Any]]) -> Tuple[int, List[Tuple[str, str]], Dict[int, float]]:
+    """Depth to rerank, cache keys of the head and the scores already cached."""
+    cfg = get_settings()
+    depth = rerank_depth(
+        # fused scores are rank-based, so the gap is measured on the dense similarity
+        [r.get("dense_score", r["score"]) for r in results], top_n=cfg.rerank_top_n, min_n=cfg.rerank_min_n,
+        max_gap=cfg.rerank_score_gap,
+    )
+    qhash = hashlib.sha256(f"{cfg.reranker_model}\0{normalize_query(query)}".encode("utf-8")).hexdigest()
+    keys = [(qhash, point_id(r["text"], r["source"], r.get("anchor"))) for r in results[:depth]]
+    cache = get_rerank_cache()
+    cached = {i: s for i, k in enumerate(keys) if (s := cache.get(k)) is not None}
+    return depth, keys, cached
+
+
+def _merge(results: List[Dict[str, Any]], depth: int, scores: List[float]) -> List[Dict[str, Any]]:
+    head = [{**r, "score": s} for r, s in zip(results[:depth], scores)]
+    head.sort(key=lambda x: x["score"], reverse=True)
+    # candidates below the cutoff follow in retrieval order; their retrieval score is on
+    # another scale than the reranker's, so it moves to retrieval_score and score is unset
+    tail = [{**r, "score": None, "retrieval_score": r["score"]} for r in results[depth:]]
+    return head + tail
+
+
+def rerank(query: str, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    if get_reranker() is None or not results:
+        return results
+    depth, keys, cached = _plan(query, results)
+    todo = [i for i in range(depth) if i not in cached]
+    if todo:
+        fresh = score_pairs([(query, results[i]["text"]) for i in todo])
+        cache = get_rerank_cache()
+        for i, s in zip(todo, fresh):
+            cached[i] = s
+            cache.set(keys[i], s)
+    return _merge(results, depth, [cached[i] for i in range(depth)])
+
+
+async def arerank(query: str, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Async :func:`rerank`: uncached pairs from concurrent requests share predict batches."""
+    # the first call loads the CrossEncoder: resolve it off the event loop
+    if not results or await asyncio.to_thread(get_reranker) is None:
+        return results
+    depth, keys, cached = _plan(query, results)
+    todo = [i for i in range(depth) if i not in cached]
+    if todo:
+        batcher = get_rerank_batcher()
+        fresh = await asyncio.gather(*(batcher.submit((query, results[i]["text"])) for i in todo))
+        cache = get_rerank_cache()
+        for i, s in zip(todo, fresh):
+            cached[i] = s
+            cache.set(keys[i], s)
+    return _merge(results, depth, [cached[i] for i in range(depth)])
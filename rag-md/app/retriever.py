@@ -1,41 +1,278 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional
+import asyncio
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
-from qdrant_client.models import FieldCondition, Filter as QFilter, MatchValue, ScoredPoint
+import numpy as np
 
-from .deps import get_embedder, get_qdrant, get_reranker
+from .batching import MicroBatcher
+from .config import get_settings
+from .content_store import hydrate_texts
+from .deps import get_embedder, get_inference_executor, get_m3_heads, get_vector_store
+from .lexical import get_lexical_index, rrf_fuse
+from .m3 import M3Output, encode_m3
+from .m3_store import get_m3_store
+from .metrics import stage
+from .rerank import arerank, rerank
+from .vectorstore.base import Hit
 
-
-def _to_filter(filters: Optional[Dict[str, Any]]) -> Optional[QFilter]:
-    if not filters:
-        return None
-    conditions = []
-    for k, v in filters.items():
-        conditions.append(FieldCondition(key=k, match=MatchValue(value=v)))
-    return QFilter(must=conditions)
+RETRIEVAL_MODES = ("dense", "hybrid", "m3")
 
 
-def embed_query(query: str) -> List[float]:
-    model = get_embedder()
+def _query_prompt(model: Any) -> Optional[str]:
     # Prefer a query-specific prompt if available; fall back gracefully
     prompts = getattr(model, "prompts", {}) or {}
-    prompt_name: Optional[str] = None
     if isinstance(prompts, dict):
-        if "query" in prompts:
-            prompt_name = "query"
-        elif "passage" in prompts:
-            prompt_name = "passage"
-        elif "document" in prompts:
-            prompt_name = "document"
+        for name in ("query", "passage", "document"):
+            if name in prompts:
+                return name
+    return None
+
+
+def encode_queries(queries: List[str]) -> List[List[float]]:
+    """Normalized query embeddings, one forward pass; blocking."""
+    model = get_embedder()
+    prompt_name = _query_prompt(model)
+    batch_size = max(len(queries), 1)
     try:
         if prompt_name:
-            emb = model.encode([query], normalize_embeddings=True, prompt_name=prompt_name)[0]
+            embs = model.encode(
+                queries, normalize_embeddings=True, batch_size=batch_size, prompt_name=prompt_name
+            )
         else:
             raise TypeError
     except TypeError:
-        emb = model.encode([query], normalize_embeddings=True)[0]
-    return emb.tolist()  # type: ignore[return-value]
+        embs = model.encode(queries, normalize_embeddings=True, batch_size=batch_size)
+    return [e.tolist() for e in embs]  # type: ignore[misc]
+
+
+def embed_query(query: str) -> List[float]:
+    return encode_queries([query])[0]
+
+
+async def aembed_query(query: str) -> List[float]:
+    """Embed a query off the event loop (through the micro-batcher when enabled)."""
+    with stage("embed"):
+        if get_settings().embed_batch_enabled:
+            return await get_query_batcher().submit(query)
+        return await asyncio.get_running_loop().run_in_executor(get_inference_executor(), embed_query, query)
+
+
+@lru_cache(maxsize=1)
+def get_query_batcher() -> MicroBatcher[str, List[float]]:
+    cfg = get_settings()
+    return MicroBatcher(
+        encode_queries,
+        max_batch_size=cfg.embed_batch_max_size,
+        max_wait_ms=cfg.embed_batch_max_wait_ms,
+        executor=get_inference_executor(),
+    )
+
+
+def encode_queries_m3(queries: List[str]) -> List[M3Output]:
+    """Dense, sparse and ColBERT query representations, one bge-m3 pass; blocking."""
+    model = get_embedder()
+    return encode_m3(model, get_m3_heads(), queries, batch_size=max(len(queries), 1),
+                     prompt_name=_query_prompt(model))
+
+
+async def aembed_query_m3(query: str) -> M3Output:
+    """Dense, sparse and ColBERT query representations from one bge-m3 pass."""
+    with stage("embed"):
+        if get_settings().embed_batch_enabled:
+            return await get_m3_query_batcher().submit(query)
+        loop = asyncio.get_running_loop()
+        return (await loop.run_in_executor(get_inference_executor(), encode_queries_m3, [query]))[0]
+
+
+@lru_cache(maxsize=1)
+def get_m3_query_batcher() -> MicroBatcher[str, M3Output]:
+    cfg = get_settings()
+    return MicroBatcher(
+        encode_queries_m3,
+        max_batch_size=cfg.embed_batch_max_size,
+        max_wait_ms=cfg.embed_batch_max_wait_ms,
+        executor=get_inference_executor(),
+    )
+
+
+_FIELDS = {"text", "text_hash", "source", "title", "section", "anchor", "updated_at", "token_count"}
+
+
+def _to_result(h: Hit, score: Optional[float] = None, dense_score: Optional[float] = None) -> Dict[str, Any]:
+    payload = h.payload
+    if score is None:
+        score = dense_score = h.score
+    return {
+        "id": h.id,
+        # None until hydrated when the point is slim or the text was not fetched
+        "text": payload.get("text"),
+        "text_hash": payload.get("text_hash"),
+        "score": float(score or 0.0),
+        # similarity from the dense leg (None if only another leg found the chunk): unlike
+        # a fused RRF score, which is rank-based, comparable across queries
+        "dense_score": None if dense_score is None else float(dense_score),
+        "source": payload.get("source", ""),
+        "title": payload.get("title"),
+        "section": payload.get("section"),
+        "anchor": payload.get("anchor"),
+        "updated_at": payload.get("updated_at"),
+        "token_count": payload.get("token_count"),
+        "tags": {k: v for k, v in payload.items() if k not in _FIELDS},
+    }
+
+
+def _exclude(with_text: bool, with_rerank: bool) -> Tuple[str, ...]:
+    # texts are the bulk of a payload; skip them unless the caller or the reranker needs them
+    return () if with_text or with_rerank else ("text",)
+
+
+def _missing_text(results: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [r for r in results if r.get("text") is None]
+
+
+def _fill(results: Sequence[Dict[str, Any]], points: Sequence[Hit]) -> None:
+    by_id = {p.id: p.payload.get("text", "") for p in points}
+    for r in results:
+        r["text"] = by_id.get(r["id"], "")
+
+
+def hydrate(results: List[Dict[str, Any]], collection: str = "api_docs") -> List[Dict[str, Any]]:
+    """Fill in the text of results fetched without it, in place.
+
+    Slim points are read from the local content store; anything else is fetched
+    from the vector store by id.
+    """
+    if not _missing_text(results):
+        return results
+    hydrate_texts(results, collection)
+    rest = _missing_text(results)
+    if rest:
+        _fill(rest, get_vector_store().retrieve(collection, [r["id"] for r in rest]))
+    return results
+
+
+async def ahydrate(results: List[Dict[str, Any]], collection: str = "api_docs") -> List[Dict[str, Any]]:
+    """Async variant of :func:`hydrate`."""
+    if not _missing_text(results):
+        return results
+    with stage("hydrate"):
+        # decompressing from the content store is CPU work: keep it off the event loop
+        await asyncio.to_thread(hydrate_texts, results, collection)
+        rest = _missing_text(results)
+        if rest:
+            _fill(rest, await get_vector_store().aretrieve(collection, [r["id"] for r in rest]))
+    return results
+
+
+def _mode(mode: Optional[str]) -> str:
+    mode = mode or get_settings().retrieval_mode
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode: {mode}")
+    return mode
+
+
+def _lexical_leg(
+    query: str, top_k: int, filters: Optional[Dict[str, Any]], collection: str, mode: Optional[str]
+) -> Optional[List[Tuple[str, float]]]:
+    """BM25 hits for hybrid mode; None means dense-only (mode off or no index built yet)."""
+    if _mode(mode) != "hybrid":
+        return None
+    index = get_lexical_index(collection)
+    if index is None:
+        return None
+    return index.search(query, top_k=top_k, filters=filters)
+
+
+def _fuse(
+    hits: Sequence[Hit], lexical: List[Tuple[str, float]], top_k: int
+) -> Tuple[List[Tuple[str, float]], List[str]]:
+    """RRF-fused ``(point_id, score)`` list and the ids whose payload is still missing."""
+    fused = rrf_fuse(
+        [[h.id for h in hits], [pid for pid, _ in lexical]], k=get_settings().hybrid_rrf_k
+    )[:top_k]
+    have = {h.id for h in hits}
+    return fused, [pid for pid, _ in fused if pid not in have]
+
+
+def _fused_results(
+    fused: List[Tuple[str, float]], points: Sequence[Hit], dense: Sequence[Hit]
+) -> List[Dict[str, Any]]:
+    by_id = {p.id: p for p in points}
+    similarity = {h.id: h.score for h in dense}
+    return [_to_result(by_id[pid], score, similarity.get(pid)) for pid, score in fused if pid in by_id]
+
+
+def _m3_plan(top_k: int, with_rerank: bool, with_text: bool) -> Tuple[int, bool, Tuple[str, ...]]:
+    """First-stage depth, whether ColBERT rescores it, and the payload fields to skip."""
+    cfg = get_settings()
+    if with_rerank and cfg.m3_colbert_rerank:
+        # late interaction needs no texts: only the final top_k are hydrated
+        return max(top_k, cfg.m3_candidates), True, ("text",)
+    return top_k, False, _exclude(with_text, with_rerank)
+
+
+def _m3_fuse(dense: Sequence[Hit], sparse: Sequence[Hit], depth: int) -> List[Dict[str, Any]]:
+    fused = rrf_fuse([[h.id for h in dense], [h.id for h in sparse]], k=get_settings().hybrid_rrf_k)[:depth]
+    return _fused_results(fused, [*dense, *sparse], dense)
+
+
+def colbert_rerank(query: np.ndarray, results: List[Dict[str, Any]], collection: str) -> List[Dict[str, Any]]:
+    """``results`` reordered by ColBERT late-interaction score against the query's token
+    vectors; points without stored token vectors follow in their original order."""
+    store = get_m3_store(collection)
+    if store is None or not results:
+        return results
+    scores = store.colbert_scores(query, [r["id"] for r in results])
+    scored = sorted(({**r, "score": s} for r, s in zip(results, scores) if s is not None),
+                    key=lambda r: r["score"], reverse=True)
+    return scored + [r for r, s in zip(results, scores) if s is None]
+
+
+def _search_m3(query: str, *, top_k: int, filters: Optional[Dict[str, Any]], with_rerank: bool,
+               collection: str, with_text: bool) -> List[Dict[str, Any]]:
+    store = get_vector_store()
+    depth, colbert, exclude = _m3_plan(top_k, with_rerank, with_text)
+    q = encode_queries_m3([query])[0]
+    dense = store.search(collection, q.dense.tolist(), top_k=depth, filters=filters, exclude=exclude)
+    sparse = store.sparse_search(collection, q.sparse, top_k=depth, filters=filters, exclude=exclude)
+    results = _m3_fuse(dense, sparse, depth)
+    if colbert:
+        results = colbert_rerank(q.colbert, results, collection)[:top_k]
+    elif with_rerank:
+        hydrate(results[: get_settings().rerank_top_n], collection)
+        results = rerank(query, results)
+    if with_text:
+        hydrate(results, collection)
+    return results
+
+
+async def _asearch_m3(query: str, *, top_k: int, filters: Optional[Dict[str, Any]], with_rerank: bool,
+                      collection: str, with_text: bool) -> List[Dict[str, Any]]:
+    store = get_vector_store()
+    depth, colbert, exclude = _m3_plan(top_k, with_rerank, with_text)
+    q = await aembed_query_m3(query)
+    with stage("vector_search"):
+        dense, sparse = await asyncio.gather(
+            store.asearch(collection, q.dense.tolist(), top_k=depth, filters=filters, exclude=exclude),
+            store.asparse_search(collection, q.sparse, top_k=depth, filters=filters, exclude=exclude),
+        )
+    results = _m3_fuse(dense, sparse, depth)
+    if colbert:
+        with stage("colbert"):
+            loop = asyncio.get_running_loop()
+            results = await loop.run_in_executor(
+                get_inference_executor(), colbert_rerank, q.colbert, results, collection
+            )
+        results = results[:top_k]
+    elif with_rerank:
+        await ahydrate(results[: get_settings().rerank_top_n], collection)
+        with stage("rerank"):
+            results = await arerank(query, results)
+    if with_text:
+        await ahydrate(results, collection)
+    return results
 
 
 def search(
@@ -45,61 +282,92 @@ def search(
     filters: Optional[Dict[str, Any]] = None,
     with_rerank: bool = False,
     collection: str = "api_docs",
+    mode: Optional[str] = None,
+    with_text: bool = True,
 ) -> List[Dict[str, Any]]:
-    client = get_qdrant()
+    """Dense search, or dense + BM25 fused with reciprocal rank fusion in ``hybrid`` mode.
+
+    ``m3`` mode fuses dense and bge-m3 sparse hits instead, and reranks with ColBERT
+    late interaction (``M3_COLBERT_RERANK``). With ``with_text=False`` results carry
+    ``text=None`` (except those the reranker needed); :func:`hydrate` fills in the
+    ones actually used.
+    """
+    if _mode(mode) == "m3":
+        return _search_m3(query, top_k=top_k, filters=filters, with_rerank=with_rerank,
+                          collection=collection, with_text=with_text)
+    store = get_vector_store()
+    exclude = _exclude(with_text, with_rerank)
+    lexical = _lexical_leg(query, top_k, filters, collection, mode)
     vector = embed_query(query)
-    flt = _to_filter(filters)
-    hits: List[ScoredPoint] = client.search(
-        collection_name=collection,
-        query_vector=vector,
-        limit=top_k,
-        query_filter=flt,
-        with_payload=True,
-    )
+    hits = store.search(collection, vector, top_k=top_k, filters=filters, exclude=exclude)
 
-    results: List[Dict[str, Any]] = []
-    for h in hits:
-        payload = h.payload or {}
-        results.append(
-            {
-                "text": payload.get("text", ""),
-                "score": float(h.score or 0.0),
-                "source": payload.get("source", ""),
-                "title": payload.get("title"),
-                "section": payload.get("section"),
-                "anchor": payload.get("anchor"),
-                "updated_at": payload.get("updated_at"),
-                "tags": {
-                    k: v
-                    for k, v in payload.items()
-                    if k
-                    not in {"text", "source", "title", "section", "anchor", "updated_at"}
-                },
-            }
-        )
+    if lexical:
+        fused, missing = _fuse(hits, lexical, top_k)
+        fetched = store.retrieve(collection, missing, exclude=exclude) if missing else []
+        results = _fused_results(fused, [*hits, *fetched], hits)
+    else:
+        results = [_to_result(h) for h in hits]
+    if with_rerank:
+        hydrate(results[: get_settings().rerank_top_n], collection)
+        results = rerank(query, results)
+    if with_text:
+        hydrate(results, collection)
+    return results
 
+
+async def asearch(
+    query: str,
+    *,
+    top_k: int = 20,
+    filters: Optional[Dict[str, Any]] = None,
+    with_rerank: bool = False,
+    collection: str = "api_docs",
+    mode: Optional[str] = None,
+    query_vector: Optional[List[float]] = None,
+    with_text: bool = True,
+) -> List[Dict[str, Any]]:
+    """Async variant of :func:`search` that never blocks the event loop.
+
+    Model inference runs on the bounded inference pool and the vector search goes
+    through the store's async API; in hybrid mode the BM25 lookup runs in a worker
+    thread alongside the dense leg. Pass ``query_vector`` if the query is
+    already embedded (ignored in ``m3`` mode, which needs all three representations).
+    """
+    if _mode(mode) == "m3":
+        return await _asearch_m3(query, top_k=top_k, filters=filters, with_rerank=with_rerank,
+                                 collection=collection, with_text=with_text)
+    store = get_vector_store()
+    exclude = _exclude(with_text, with_rerank)
+
+    async def dense() -> List[Hit]:
+        vector = query_vector if query_vector is not None else await aembed_query(query)
+        with stage("vector_search"):
+            return await store.asearch(collection, vector, top_k=top_k, filters=filters, exclude=exclude)
+
+    async def lexical_leg() -> Optional[List[Tuple[str, float]]]:
+        with stage("lexical"):
+            # in a thread: the first call also loads the index, neither should hold up the loop
+            return await asyncio.to_thread(_lexical_leg, query, top_k, filters, collection, mode)
+
+    if _mode(mode) == "hybrid":
+        hits, lexical = await asyncio.gather(dense(), lexical_leg())
+    else:
+        hits, lexical = await dense(), None
+
+    if lexical:
+        fused, missing = _fuse(hits, lexical, top_k)
+        if missing:
+            with stage("vector_search"):
+                fetched = await store.aretrieve(collection, missing, exclude=exclude)
+        else:
+            fetched = []
+        results = _fused_results(fused, [*hits, *fetched], hits)
+    else:
+        results = [_to_result(h) for h in hits]
     if with_rerank:
-        rr = get_reranker()
-        if rr is not None and results:
-            pairs = [[query, r["text"]] for r in results]
-            scores = rr.predict(pairs)  # type: ignore[assignment]
-            # Normalize logits to probabilities if needed using sigmoid
-            try:
-                import math
-
-                def _sigmoid(x: float) -> float:
-                    # numerically stable sigmoid
-                    if x >= 0:
-                        z = math.exp(-x)
-                        return 1.0 / (1.0 + z)
-                    z = math.exp(x)
-                    return z / (1.0 + z)
-
-                norm_scores = [_sigmoid(float(s)) for s in scores]
-            except Exception:
-                norm_scores = [float(s) for s in scores]
-            rescored = [(*r.items(), ("score", float(s))) for r, s in zip(results, norm_scores)]
-            results = [dict(items) for items in rescored]
-            results.sort(key=lambda x: x["score"], reverse=True)
-
-    return results 
\ No newline at end of file
+        await ahydrate(results[: get_settings().rerank_top_n], collection)
+        with stage("rerank"):
+            results = await arerank(query, results)
+    if with_text:
+        await ahydrate(results, collection)
+    return results
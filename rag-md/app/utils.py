@@ -2,11 +2,13 @@ from __future__ import annotations
 
 import json
 import re
+from functools import lru_cache
 from typing import Iterable, List, Tuple
 
 import tiktoken
 
 
+@lru_cache(maxsize=1)
 def get_tokenizer() -> tiktoken.Encoding:
     # Approximate tokenizer for Mistral (cl100k_base)
     return tiktoken.get_encoding("cl100k_base")
@@ -57,4 +59,23 @@ def all_json_fences_valid(text: str) -> bool:
     blocks = extract_json_fences(text)
     if not blocks:
         return True
-    return all(is_valid_json(b) for b in blocks) 
\ No newline at end of file
+    return all(is_valid_json(b) for b in blocks) 
+
+
+class JsonFenceChecker:
+    """Incremental :func:`all_json_fences_valid` for a streamed answer.
+
+    Each ```json fence is validated as soon as its closing backticks arrive, so
+    checking the complete answer at the end costs nothing extra.
+    """
+
+    def __init__(self) -> None:
+        self._buf = ""
+        self._pos = 0
+        self.valid = True
+
+    def feed(self, text: str) -> None:
+        self._buf += text
+        for m in _JSON_FENCE_RE.finditer(self._buf, self._pos):
+            self.valid = self.valid and is_valid_json(m.group(1).strip())
+            self._pos = m.end()
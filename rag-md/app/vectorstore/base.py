@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+
+@dataclass
+class Point:
+    id: str
+    vector: Sequence[float]
+    payload: Dict[str, Any] = field(default_factory=dict)
+    # learned lexical weights (bge-m3 sparse output): token id -> weight
+    sparse: Optional[Dict[int, float]] = None
+
+
+@dataclass
+class Hit:
+    id: str
+    score: float
+    payload: Dict[str, Any] = field(default_factory=dict)
+
+
+class VectorStore(ABC):
+    """Collections of (id, vector, payload) points with cosine top-k search.
+
+    Points may also carry a sparse vector, searched by dot product with
+    :meth:`sparse_search`. ``filters`` are ``{field: value}`` pairs that must all
+    match exactly; ``exclude`` names payload fields to leave out of the returned
+    hits. Writes are guaranteed to be visible to searches only after :meth:`flush`.
+    """
+
+    @abstractmethod
+    def search(self, collection: str, vector: Sequence[float], *, top_k: int,
+               filters: Optional[Dict[str, Any]] = None, exclude: Sequence[str] = ()) -> List[Hit]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def retrieve(self, collection: str, ids: Sequence[str], *, exclude: Sequence[str] = ()) -> List[Hit]:
+        raise NotImplementedError
+
+    def sparse_search(self, collection: str, sparse: Dict[int, float], *, top_k: int,
+                      filters: Optional[Dict[str, Any]] = None, exclude: Sequence[str] = ()) -> List[Hit]:
+        """Top-k points by sparse dot product; points sharing no term with ``sparse`` never match."""
+        raise NotImplementedError(f"{type(self).__name__} has no sparse vectors")
+
+    @abstractmethod
+    def scroll(self, collection: str, *, fields: Optional[List[str]] = None) -> Iterator[Hit]:
+        """Every point of ``collection`` (payload limited to ``fields`` if given)."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def ensure_collection(self, collection: str, dim: int, *, recreate: bool = False) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def upsert(self, collection: str, points: Sequence[Point]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, collection: str, ids: Iterable[str]) -> None:
+        raise NotImplementedError
+
+    def delete_sources(self, collection: str, sources: Sequence[str], keep_ids: Iterable[str] = ()) -> None:
+        """Delete every point whose ``source`` is in ``sources``, except ``keep_ids``."""
+        wanted, keep = set(sources), set(keep_ids)
+        self.delete(collection, [
+            h.id for h in self.scroll(collection, fields=["source"])
+            if h.payload.get("source") in wanted and h.id not in keep
+        ])
+
+    def flush(self, collection: str) -> None:
+        """Make all writes so far visible to searches."""
+
+    # The async variants default to the sync calls: right for in-process stores,
+    # whose searches take well under a millisecond on corpora they are meant for.
+    async def asearch(self, collection: str, vector: Sequence[float], *, top_k: int,
+                      filters: Optional[Dict[str, Any]] = None, exclude: Sequence[str] = ()) -> List[Hit]:
+        return self.search(collection, vector, top_k=top_k, filters=filters, exclude=exclude)
+
+    async def aretrieve(self, collection: str, ids: Sequence[str], *, exclude: Sequence[str] = ()) -> List[Hit]:
+        return self.retrieve(collection, ids, exclude=exclude)
+
+    async def asparse_search(self, collection: str, sparse: Dict[int, float], *, top_k: int,
+                             filters: Optional[Dict[str, Any]] = None, exclude: Sequence[str] = ()) -> List[Hit]:
+        return self.sparse_search(collection, sparse, top_k=top_k, filters=filters, exclude=exclude)
+
+    async def aopen(self, collection: str) -> None:
+        """Connect / load ``collection`` ahead of the first search (used by warm-up)."""
@@ -0,0 +1,354 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+from dataclasses import dataclass, field
+from functools import reduce
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..arrayfile import load_arrays, save_arrays
+from .base import Hit, Point, VectorStore
+
+_MAGIC = b"RAGVEC01"
+VECTOR_DTYPES = ("float16", "int8")
+# payload fields with at most this many distinct values get a bitmask per value at load
+_BITMASK_MAX_VALUES = 256
+
+
+def _key(value: Any) -> str:
+    # "1" and 1 are different values, as in Qdrant
+    return json.dumps(value, sort_keys=True)
+
+
+_Row = Tuple[str, np.ndarray, Dict[str, Any], Optional[Dict[int, float]]]
+
+
+def _encode_sparse(points: Sequence[_Row]) -> Dict[str, np.ndarray]:
+    """Sparse vectors as an inverted index: sorted term ids, and per term the
+    rows containing it (ascending) with their weights."""
+    rows, terms, weights = [], [], []
+    for row, (_, _, _, sparse) in enumerate(points):
+        if sparse:
+            rows.append(np.full(len(sparse), row, dtype=np.int32))
+            terms.append(np.fromiter(sparse.keys(), dtype=np.int32, count=len(sparse)))
+            weights.append(np.fromiter(sparse.values(), dtype=np.float32, count=len(sparse)))
+    if not rows:
+        empty = np.zeros(0, dtype=np.int32)
+        return {"sparse_terms": empty, "sparse_ptr": np.zeros(1, dtype=np.int64),
+                "sparse_rows": empty, "sparse_weights": np.zeros(0, dtype=np.float32)}
+    all_rows, all_terms, all_weights = (np.concatenate(a) for a in (rows, terms, weights))
+    order = np.argsort(all_terms, kind="stable")
+    uniq, counts = np.unique(all_terms[order], return_counts=True)
+    ptr = np.zeros(len(uniq) + 1, dtype=np.int64)
+    ptr[1:] = np.cumsum(counts)
+    return {"sparse_terms": uniq.astype(np.int32), "sparse_ptr": ptr,
+            "sparse_rows": all_rows[order], "sparse_weights": all_weights[order]}
+
+
+def _encode(dim: int, dtype: str, points: Sequence[_Row]) -> Tuple[Dict[str, Any], Dict[str, np.ndarray]]:
+    """File header and arrays for ``points``: quantized unit vectors, the chunk
+    texts as one UTF-8 blob with offsets, every other payload field as a
+    dictionary-encoded column (distinct values in the header, int32 codes, -1 = absent),
+    and the sparse vectors as an inverted index."""
+    n = len(points)
+    matrix = np.zeros((n, dim), dtype=np.float32)
+    for row, (_, vec, _, _) in enumerate(points):
+        matrix[row] = vec
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.where(norms > 0, norms, 1.0)
+    arrays: Dict[str, np.ndarray] = {}
+    if dtype == "int8":
+        scales = np.abs(matrix).max(axis=1) / 127.0 if n else np.zeros(0, dtype=np.float32)
+        scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+        arrays["vectors"] = np.round(matrix / scales[:, None]).astype(np.int8)
+        arrays["scales"] = scales
+    else:
+        arrays["vectors"] = matrix.astype(np.float16)
+
+    texts = [str(p.get("text", "")).encode("utf-8") for _, _, p, _ in points]
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(t) for t in texts])
+    arrays["text_offsets"] = offsets
+    arrays["text"] = np.frombuffer(b"".join(texts), dtype=np.uint8)
+    # slim points (SLIM_PAYLOADS) have no text at all, which is not the same as ""
+    arrays["has_text"] = np.fromiter(("text" in p for _, _, p, _ in points), dtype=bool, count=n)
+    arrays.update(_encode_sparse(points))
+
+    columns: Dict[str, List[Any]] = {}
+    index: Dict[str, Dict[str, int]] = {}
+    codes: Dict[str, np.ndarray] = {}
+    for row, (_, _, payload, _) in enumerate(points):
+        for k, v in payload.items():
+            if k == "text":
+                continue
+            if k not in columns:
+                columns[k], index[k], codes[k] = [], {}, np.full(n, -1, dtype=np.int32)
+            code = index[k].setdefault(_key(v), len(columns[k]))
+            if code == len(columns[k]):
+                columns[k].append(v)
+            codes[k][row] = code
+    for k, c in codes.items():
+        arrays[f"col:{k}"] = c
+    header = {"dim": dim, "dtype": dtype, "ids": [pid for pid, _, _, _ in points], "columns": columns}
+    return header, arrays
+
+
+class LocalCollection:
+    """A collection file, loaded for exact search.
+
+    Vectors are decoded once into a float32 matrix (BLAS has no float16/int8
+    GEMV, so scoring a quantized matrix directly would be far slower); texts and
+    payload columns stay memory-mapped and are read only for returned hits.
+    """
+
+    def __init__(self, header: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> None:
+        self.dim: int = header["dim"]
+        self.dtype: str = header["dtype"]
+        self.ids: List[str] = header["ids"]
+        self._pos = {pid: i for i, pid in enumerate(self.ids)}
+        vectors = arrays["vectors"].reshape(len(self.ids), self.dim)
+        if self.dtype == "int8":
+            self.matrix = vectors.astype(np.float32) * np.asarray(arrays["scales"])[:, None]
+        else:
+            self.matrix = np.asarray(vectors, dtype=np.float32)
+        # plain ndarray views of the maps: indexing a np.memmap is several times slower
+        self._text = np.asarray(arrays["text"])
+        self._text_offsets = np.asarray(arrays["text_offsets"])
+        # files from older versions may lack the has_text column and the sparse index
+        has_text = arrays.get("has_text")
+        self._has_text = np.asarray(has_text) if has_text is not None else np.ones(len(self.ids), dtype=bool)
+        sparse = arrays if "sparse_terms" in arrays else _encode_sparse([])
+        self._sp_terms, self._sp_ptr, self._sp_rows, self._sp_weights = (
+            np.asarray(sparse[k]) for k in ("sparse_terms", "sparse_ptr", "sparse_rows", "sparse_weights")
+        )
+        self._columns: Dict[str, List[Any]] = header["columns"]
+        self._codes = {k: np.asarray(arrays[f"col:{k}"]) for k in self._columns}
+        self._values = {k: {_key(v): i for i, v in enumerate(vals)} for k, vals in self._columns.items()}
+        # filters on low-cardinality fields (source, updated_at, ...) become an AND of
+        # precomputed packed bitmasks; other fields are compared per query
+        self._bitmasks = {
+            k: np.packbits(self._codes[k][None, :] == np.arange(len(vals), dtype=np.int32)[:, None], axis=1)
+            for k, vals in self._columns.items()
+            if len(vals) <= _BITMASK_MAX_VALUES
+        }
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _bits(self, field: str, value: Any) -> np.ndarray:
+        code = self._values.get(field, {}).get(_key(value))
+        if code is None:
+            return np.zeros(-(-len(self.ids) // 8), dtype=np.uint8)
+        table = self._bitmasks.get(field)
+        return table[code] if table is not None else np.packbits(self._codes[field] == code)
+
+    def rows(self, filters: Dict[str, Any]) -> np.ndarray:
+        """Indices of the points matching every ``field == value`` filter."""
+        bits = reduce(np.bitwise_and, (self._bits(k, v) for k, v in filters.items()))
+        return np.flatnonzero(np.unpackbits(bits, count=len(self.ids)))
+
+    def payloads(self, rows: Sequence[int], fields: Optional[List[str]] = None,
+                 exclude: Sequence[str] = ()) -> List[Dict[str, Any]]:
+        """Payloads of ``rows``, reading each column once for all of them."""
+        idx = np.asarray(rows, dtype=np.int64)
+        out: List[Dict[str, Any]] = [{} for _ in range(len(idx))]
+        if (fields is None or "text" in fields) and "text" not in exclude:
+            lo, hi = self._text_offsets[idx].tolist(), self._text_offsets[idx + 1].tolist()
+            for p, a, b, has in zip(out, lo, hi, self._has_text[idx].tolist()):
+                if has:
+                    p["text"] = self._text[a:b].tobytes().decode("utf-8")
+        for k, vals in self._columns.items():
+            if (fields is not None and k not in fields) or k in exclude:
+                continue
+            for p, code in zip(out, self._codes[k][idx].tolist()):
+                if code >= 0:
+                    p[k] = vals[code]
+        return out
+
+    def search(self, vector: Sequence[float], *, top_k: int, filters: Optional[Dict[str, Any]] = None,
+               exclude: Sequence[str] = ()) -> List[Hit]:
+        q = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = float(np.linalg.norm(q))
+        q = q / norm if norm > 0 else q
+        rows: Optional[np.ndarray] = None
+        if filters:
+            rows = self.rows(filters)
+            # a selective filter: gathering its rows is cheaper than scoring them all
+            scores = self.matrix[rows] @ q if len(rows) * 4 < len(self.ids) else (self.matrix @ q)[rows]
+        else:
+            scores = self.matrix @ q
+        return self._top(rows, scores, top_k, exclude)
+
+    def sparse_search(self, sparse: Dict[int, float], *, top_k: int, filters: Optional[Dict[str, Any]] = None,
+                      exclude: Sequence[str] = ()) -> List[Hit]:
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        matched = np.zeros(len(self.ids), dtype=bool)
+        terms = np.fromiter(sparse.keys(), dtype=np.int64, count=len(sparse))
+        found = np.searchsorted(self._sp_terms, terms)
+        for term, weight, i in zip(terms.tolist(), sparse.values(), found.tolist()):
+            if i < len(self._sp_terms) and self._sp_terms[i] == term:
+                a, b = self._sp_ptr[i], self._sp_ptr[i + 1]
+                rows = self._sp_rows[a:b]
+                scores[rows] += weight * self._sp_weights[a:b]
+                matched[rows] = True
+        candidates = np.flatnonzero(matched)
+        if filters:
+            candidates = np.intersect1d(candidates, self.rows(filters), assume_unique=True)
+        return self._top(candidates, scores[candidates], top_k, exclude)
+
+    def _top(self, rows: Optional[np.ndarray], scores: np.ndarray, top_k: int, exclude: Sequence[str]) -> List[Hit]:
+        """Hits for the ``top_k`` best ``scores``, which belong to ``rows`` (or to all rows)."""
+        k = min(top_k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        picked = (rows[top] if rows is not None else top).tolist()
+        payloads = self.payloads(picked, exclude=exclude)
+        return [Hit(self.ids[i], s, p) for i, s, p in zip(picked, scores[top].tolist(), payloads)]
+
+    def sparse_vectors(self) -> List[Optional[Dict[int, float]]]:
+        """Each row's sparse vector (None if it has none), rebuilt from the inverted index."""
+        out: List[Optional[Dict[int, float]]] = [None] * len(self.ids)
+        order = np.argsort(self._sp_rows, kind="stable")
+        rows = self._sp_rows[order]
+        terms = np.repeat(self._sp_terms, np.diff(self._sp_ptr))[order]
+        weights = self._sp_weights[order]
+        bounds = np.flatnonzero(np.diff(rows)) + 1
+        for r, t, w in zip(np.split(rows, bounds), np.split(terms, bounds), np.split(weights, bounds)):
+            if len(r):
+                out[int(r[0])] = dict(zip(t.tolist(), w.tolist()))
+        return out
+
+    def retrieve(self, ids: Sequence[str], *, exclude: Sequence[str] = ()) -> List[Hit]:
+        found = [pid for pid in ids if pid in self._pos]
+        rows = [self._pos[pid] for pid in found]
+        return [Hit(pid, 0.0, p) for pid, p in zip(found, self.payloads(rows, exclude=exclude))]
+
+
+@dataclass
+class _Draft:
+    """A collection being written: all points in memory until :meth:`LocalVectorStore.flush`."""
+
+    dim: int
+    points: Dict[str, Tuple[np.ndarray, Dict[str, Any], Optional[Dict[int, float]]]] = field(default_factory=dict)
+    dirty: bool = False
+
+
+class LocalVectorStore(VectorStore):
+    """In-process vector store: one file per collection under ``root``.
+
+    Search is exact: one matrix-vector product over all points plus
+    ``argpartition``, with payload filters applied as bitmasks. Meant for
+    corpora of up to ~100k chunks, where this takes a few milliseconds at most
+    and saves the round-trip to a Qdrant server. Ingest writes the file
+    atomically on :meth:`flush`; readers reload it when it changes, like the
+    BM25 index.
+    """
+
+    def __init__(self, root: Path, *, dtype: str = "float16") -> None:
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unknown vector dtype: {dtype}")
+        self.root = Path(root)
+        self.dtype = dtype
+        self._loaded: Dict[str, Tuple[Tuple[int, int], LocalCollection]] = {}
+        self._drafts: Dict[str, _Draft] = {}
+        self._lock = threading.Lock()
+
+    def path(self, collection: str) -> Path:
+        return self.root / f"{collection}.vec"
+
+    def collection(self, name: str) -> LocalCollection:
+        """The collection as last flushed, reloaded when the file was replaced."""
+        path = self.path(name)
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            raise ValueError(f"Collection {name!r} not found in {self.root}; run the ingest first") from None
+        stamp = (st.st_ino, st.st_mtime_ns)
+        cached = self._loaded.get(name)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        with self._lock:
+            cached = self._loaded.get(name)
+            if cached and cached[0] == stamp:
+                return cached[1]
+            loaded = LocalCollection(*load_arrays(path, _MAGIC))
+            self._loaded[name] = (stamp, loaded)
+            return loaded
+
+    def search(self, collection: str, vector: Sequence[float], *, top_k: int,
+               filters: Optional[Dict[str, Any]] = None, exclude: Sequence[str] = ()) -> List[Hit]:
+        return self.collection(collection).search(vector, top_k=top_k, filters=filters, exclude=exclude)
+
+    def retrieve(self, collection: str, ids: Sequence[str], *, exclude: Sequence[str] = ()) -> List[Hit]:
+        return self.collection(collection).retrieve(ids, exclude=exclude)
+
+    def sparse_search(self, collection: str, sparse: Dict[int, float], *, top_k: int,
+                      filters: Optional[Dict[str, Any]] = None, exclude: Sequence[str] = ()) -> List[Hit]:
+        return self.collection(collection).sparse_search(sparse, top_k=top_k, filters=filters, exclude=exclude)
+
+    async def aopen(self, collection: str) -> None:
+        await asyncio.to_thread(self.collection, collection)
+
+    def _draft(self, collection: str) -> _Draft:
+        # caller holds the lock
+        draft = self._drafts.get(collection)
+        if draft is None:
+            loaded = LocalCollection(*load_arrays(self.path(collection), _MAGIC))
+            draft = _Draft(loaded.dim)
+            payloads = loaded.payloads(range(len(loaded)))
+            for i, (pid, payload, sparse) in enumerate(zip(loaded.ids, payloads, loaded.sparse_vectors())):
+                draft.points[pid] = (loaded.matrix[i], payload, sparse)
+            self._drafts[collection] = draft
+        return draft
+
+    def scroll(self, collection: str, *, fields: Optional[List[str]] = None) -> Iterator[Hit]:
+        with self._lock:
+            draft = self._drafts.get(collection)
+            items = list(draft.points.items()) if draft is not None else None
+        if items is None:
+            loaded = self.collection(collection)
+            for pid, payload in zip(loaded.ids, loaded.payloads(range(len(loaded)), fields)):
+                yield Hit(pid, 0.0, payload)
+            return
+        for pid, (_, payload, _) in items:
+            yield Hit(pid, 0.0, payload if fields is None else {k: payload[k] for k in fields if k in payload})
+
+    def ensure_collection(self, collection: str, dim: int, *, recreate: bool = False) -> None:
+        with self._lock:
+            if recreate or (collection not in self._drafts and not self.path(collection).exists()):
+                self._drafts[collection] = _Draft(dim, dirty=True)
+                return
+            existing = self._draft(collection).dim
+        if existing != dim:
+            raise ValueError(f"Collection {collection!r} has {existing}-dim vectors, not {dim}")
+
+    def upsert(self, collection: str, points: Sequence[Point]) -> None:
+        with self._lock:
+            draft = self._draft(collection)
+            for p in points:
+                vec = np.asarray(p.vector, dtype=np.float32).reshape(-1)
+                if vec.shape[0] != draft.dim:
+                    raise ValueError(f"Vector of {vec.shape[0]} dims for a {draft.dim}-dim collection")
+                draft.points[str(p.id)] = (vec, dict(p.payload), dict(p.sparse) if p.sparse else None)
+            draft.dirty = True
+
+    def delete(self, collection: str, ids: Iterable[str]) -> None:
+        with self._lock:
+            draft = self._draft(collection)
+            for pid in ids:
+                draft.dirty |= draft.points.pop(str(pid), None) is not None
+
+    def flush(self, collection: str) -> None:
+        with self._lock:
+            draft = self._drafts.get(collection)
+            if draft is None or not draft.dirty:
+                return
+            points = [(pid, *point) for pid, point in draft.points.items()]
+            save_arrays(self.path(collection), _MAGIC, *_encode(draft.dim, self.dtype, points))
+            draft.dirty = False
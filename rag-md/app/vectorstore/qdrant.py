@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.models import (
+    Distance,
+    FieldCondition,
+    Filter,
+    FilterSelector,
+    HasIdCondition,
+    MatchAny,
+    MatchValue,
+    PayloadSchemaType,
+    PayloadSelectorExclude,
+    PointIdsList,
+    PointStruct,
+    Record,
+    ScoredPoint,
+    SparseVector,
+    SparseVectorParams,
+    VectorParams,
+)
+
+from .base import Hit, Point, VectorStore
+
+
+def _to_filter(filters: Optional[Dict[str, Any]]) -> Optional[Filter]:
+    if not filters:
+        return None
+    return Filter(must=[FieldCondition(key=k, match=MatchValue(value=v)) for k, v in filters.items()])
+
+
+# name of the sparse vector next to the unnamed dense one
+SPARSE_VECTOR = "sparse"
+
+
+def _sparse(weights: Dict[int, float]) -> SparseVector:
+    return SparseVector(indices=list(weights), values=list(weights.values()))
+
+
+def _vector(p: Point) -> Any:
+    dense = np.asarray(p.vector).tolist()
+    return dense if p.sparse is None else {"": dense, SPARSE_VECTOR: _sparse(p.sparse)}
+
+
+def _selector(exclude: Sequence[str]) -> bool | PayloadSelectorExclude:
+    return PayloadSelectorExclude(exclude=list(exclude)) if exclude else True
+
+
+def _hit(p: ScoredPoint | Record) -> Hit:
+    return Hit(str(p.id), float(getattr(p, "score", None) or 0.0), p.payload or {})
+
+
+class QdrantStore(VectorStore):
+    """Collections in a Qdrant server; the async calls go through ``AsyncQdrantClient``."""
+
+    def __init__(self, client: Optional[QdrantClient] = None,
+                 async_client: Optional[AsyncQdrantClient] = None) -> None:
+        self.client = client
+        self.async_client = async_client
+
+    def search(self, collection: str, vector: Sequence[float], *, top_k: int,
+               filters: Optional[Dict[str, Any]] = None, exclude: Sequence[str] = ()) -> List[Hit]:
+        resp = self.client.query_points(
+            collection_name=collection, query=list(vector), limit=top_k,
+            query_filter=_to_filter(filters), with_payload=_selector(exclude),
+        )
+        return [_hit(p) for p in resp.points]
+
+    async def asearch(self, collection: str, vector: Sequence[float], *, top_k: int,
+                      filters: Optional[Dict[str, Any]] = None, exclude: Sequence[str] = ()) -> List[Hit]:
+        resp = await self.async_client.query_points(
+            collection_name=collection, query=list(vector), limit=top_k,
+            query_filter=_to_filter(filters), with_payload=_selector(exclude),
+        )
+        return [_hit(p) for p in resp.points]
+
+    def retrieve(self, collection: str, ids: Sequence[str], *, exclude: Sequence[str] = ()) -> List[Hit]:
+        return [_hit(p) for p in self.client.retrieve(collection, ids=list(ids), with_payload=_selector(exclude))]
+
+    async def aretrieve(self, collection: str, ids: Sequence[str], *, exclude: Sequence[str] = ()) -> List[Hit]:
+        points = await self.async_client.retrieve(collection, ids=list(ids), with_payload=_selector(exclude))
+        return [_hit(p) for p in points]
+
+    def sparse_search(self, collection: str, sparse: Dict[int, float], *, top_k: int,
+                      filters: Optional[Dict[str, Any]] = None, exclude: Sequence[str] = ()) -> List[Hit]:
+        if not sparse:
+            return []
+        resp = self.client.query_points(
+            collection_name=collection, query=_sparse(sparse), using=SPARSE_VECTOR, limit=top_k,
+            query_filter=_to_filter(filters), with_payload=_selector(exclude),
+        )
+        return [_hit(p) for p in resp.points]
+
+    async def asparse_search(self, collection: str, sparse: Dict[int, float], *, top_k: int,
+                             filters: Optional[Dict[str, Any]] = None, exclude: Sequence[str] = ()) -> List[Hit]:
+        if not sparse:
+            return []
+        resp = await self.async_client.query_points(
+            collection_name=collection, query=_sparse(sparse), using=SPARSE_VECTOR, limit=top_k,
+            query_filter=_to_filter(filters), with_payload=_selector(exclude),
+        )
+        return [_hit(p) for p in resp.points]
+
+    async def aopen(self, collection: str) -> None:
+        await self.async_client.get_collections()
+
+    def scroll(self, collection: str, *, fields: Optional[List[str]] = None) -> Iterator[Hit]:
+        offset = None
+        while True:
+            records, offset = self.client.scroll(
+                collection_name=collection, limit=1000, offset=offset,
+                with_payload=fields if fields is not None else True, with_vectors=False,
+            )
+            yield from (_hit(r) for r in records)
+            if offset is None:
+                break
+
+    def ensure_collection(self, collection: str, dim: int, *, recreate: bool = False) -> None:
+        existing = [c.name for c in self.client.get_collections().collections]
+        if collection in existing and recreate:
+            self.client.delete_collection(collection)
+        if recreate or collection not in existing:
+            # the sparse vector slot costs nothing until points carry sparse vectors (ingest --m3)
+            self.client.create_collection(collection, VectorParams(size=dim, distance=Distance.COSINE),
+                                          sparse_vectors_config={SPARSE_VECTOR: SparseVectorParams()})
+            # keyword index on source keeps per-file scroll/delete cheap
+            self.client.create_payload_index(collection, "source", PayloadSchemaType.KEYWORD)
+
+    def upsert(self, collection: str, points: Sequence[Point]) -> None:
+        # wait=False: Qdrant acknowledges once the batch is in its WAL; operations on a
+        # collection are still applied in order, so later deletes cannot overtake it
+        self.client.upsert(
+            collection_name=collection,
+            points=[PointStruct(id=p.id, vector=_vector(p), payload=p.payload) for p in points],
+            wait=False,
+        )
+
+    def delete(self, collection: str, ids: Iterable[str]) -> None:
+        ids = list(ids)
+        for i in range(0, len(ids), 1000):
+            self.client.delete(collection_name=collection, points_selector=PointIdsList(points=ids[i : i + 1000]))
+
+    def delete_sources(self, collection: str, sources: Sequence[str], keep_ids: Iterable[str] = ()) -> None:
+        # a single filtered delete instead of scrolling the sources
+        keep = list(keep_ids)
+        flt = Filter(
+            must=[FieldCondition(key="source", match=MatchAny(any=list(sources)))],
+            must_not=[HasIdCondition(has_id=keep)] if keep else None,
+        )
+        self.client.delete(collection_name=collection, points_selector=FilterSelector(filter=flt))
+
+    def flush(self, collection: str) -> None:
+        # upserts use wait=False; a waited no-op queued after them makes them all visible
+        self.client.delete(collection, points_selector=PointIdsList(points=[]), wait=True)
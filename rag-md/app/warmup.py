@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from .config import get_settings
+from .deps import get_embedder, get_llm, get_reranker, get_vector_store
+from .lexical import get_lexical_index
+from .llm_client.limited import ConcurrencyLimitedClient
+from .llm_client.llama_cpp import LlamaCppClient
+from .llm_client.router import LLMRouter
+from .m3_store import get_m3_store
+from .rerank import score_pairs
+from .retriever import encode_queries, encode_queries_m3
+from .utils import get_tokenizer
+
+logger = logging.getLogger("rag.warmup")
+
+T = TypeVar("T")
+
+# Inputs shaped like real traffic: a short question, passages as long as the
+# reranker will look at. The first forward pass at each batch shape pays for
+# allocator growth and kernel selection, so both batch-1 and full batches run.
+_QUERY = "How do I authenticate requests to the API and refresh an expired token?"
+_PASSAGE = "Requests are authenticated with a bearer token in the Authorization header. " * 16
+
+# Qdrant may come up after the API (compose, k8s), a local store file may not be
+# ingested yet: keep trying, stay unready meanwhile
+STORE_RETRY_S = 2.0
+
+
+@dataclass
+class Readiness:
+    ready: bool = False
+    error: Optional[str] = None
+    started_at: float = field(default_factory=time.time)
+    timings_ms: Dict[str, float] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"ready": self.ready, "error": self.error, "timings_ms": dict(self.timings_ms)}
+
+
+READINESS = Readiness()
+
+
+async def _timed(name: str, fn: Callable[[], Awaitable[T]]) -> T:
+    t0 = time.perf_counter()
+    out = await fn()
+    READINESS.timings_ms[name] = round((time.perf_counter() - t0) * 1000.0, 1)
+    logger.info("warm-up: %s took %.0f ms", name, READINESS.timings_ms[name])
+    return out
+
+
+def _warm_embedder() -> None:
+    get_embedder()
+    # m3 mode encodes queries through the sparse/ColBERT heads as well
+    encode = encode_queries_m3 if get_settings().retrieval_mode == "m3" else encode_queries
+    for n in sorted({1, get_settings().embed_batch_max_size}):
+        encode([_QUERY] * n)
+
+
+def _warm_reranker() -> None:
+    if get_reranker() is None:
+        return
+    cfg = get_settings()
+    for n in sorted({1, cfg.rerank_top_n, cfg.rerank_batch_max_size}):
+        score_pairs([(_QUERY, _PASSAGE)] * n)
+
+
+async def _open_vector_store() -> None:
+    collection = get_settings().qdrant_collection
+    while True:
+        try:
+            await get_vector_store().aopen(collection)
+            return
+        except Exception as e:  # noqa: BLE001 - connection refused, timeouts, auth, no file ...
+            logger.warning("warm-up: vector store not available (%s); retrying in %.0fs", e, STORE_RETRY_S)
+            await asyncio.sleep(STORE_RETRY_S)
+
+
+async def _open_llm() -> None:
+    """Open the LLM connections and detect server capabilities; an unreachable
+    LLM is not fatal (the router's health checks and breaker deal with it)."""
+    try:
+        llm = get_llm()
+    except RuntimeError:
+        logger.warning("warm-up: no LLM backend configured")
+        return
+    clients: List[Any] = []
+    if isinstance(llm, LLMRouter):
+        await llm.check_health()
+        clients = [b.client for b in llm.backends]
+    elif isinstance(llm, ConcurrencyLimitedClient):
+        clients = [llm.inner]
+    await asyncio.gather(*(c.probe() for c in clients if isinstance(c, LlamaCppClient)))
+
+
+def _load_lexical() -> None:
+    cfg = get_settings()
+    if cfg.retrieval_mode == "hybrid":
+        get_lexical_index(cfg.qdrant_collection)
+    elif cfg.retrieval_mode == "m3":
+        get_m3_store(cfg.qdrant_collection)
+
+
+async def warm_up() -> None:
+    """Load and warm everything the first request would otherwise wait for.
+
+    The embedder and reranker load in parallel threads (torch releases the GIL
+    while reading weights and in forward passes) while the vector store and the
+    LLM connections are opened on the loop. ``READINESS`` flips to ready when all
+    of it has finished; a model that fails to load leaves it unready with the error.
+    """
+    t0 = time.perf_counter()
+    try:
+        await asyncio.gather(
+            _timed("tokenizer", lambda: asyncio.to_thread(get_tokenizer)),
+            _timed("embedder", lambda: asyncio.to_thread(_warm_embedder)),
+            _timed("reranker", lambda: asyncio.to_thread(_warm_reranker)),
+            _timed("lexical_index", lambda: asyncio.to_thread(_load_lexical)),
+            _timed("vector_store", _open_vector_store),
+            _timed("llm", _open_llm),
+        )
+    except Exception as e:  # noqa: BLE001 - reported by /ready instead of killing the server
+        READINESS.error = f"{type(e).__name__}: {e}"
+        logger.exception("warm-up failed")
+        return
+    READINESS.timings_ms["total"] = round((time.perf_counter() - t0) * 1000.0, 1)
+    READINESS.ready = True
+    logger.info("warm-up: ready in %.0f ms", READINESS.timings_ms["total"])
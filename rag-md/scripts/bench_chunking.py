@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from app import utils
+from app.chunking import (
+    _is_code_or_table_block,
+    _split_preserving_blocks,
+    _split_text_to_max_tokens,
+    chunk_sections,
+)
+from app.md_loader import MDSection, parse_markdown
+from app.utils import count_tokens, trim_text_tokens
+
+
+class _Uncached:
+    count = staticmethod(count_tokens)
+
+
+_UNCACHED = _Uncached()
+
+
+# Reference: chunk_sections as it was before per-paragraph token counting, kept to
+# check that the current implementation produces identical chunks.
+def legacy_chunk_sections(
+    sections: Iterable[MDSection], *, target_tokens_min: int = 500, target_tokens_max: int = 800,
+    overlap_tokens: int = 100,
+) -> List[Tuple[str, Dict[str, str]]]:
+    chunks: List[Tuple[str, Dict[str, str]]] = []
+    for sec in sections:
+        text = sec.text
+        paragraphs = _split_preserving_blocks(text)
+        current: List[str] = []
+        current_tokens = 0
+
+        def push_chunk(*, keep_overlap: bool = True) -> None:
+            nonlocal current, current_tokens
+            if not current:
+                return
+            content = "\n\n".join(current).strip()
+            if count_tokens(content) > target_tokens_max:
+                content = trim_text_tokens(content, target_tokens_max)
+            if not content:
+                current = []
+                current_tokens = 0
+                return
+            meta = {
+                "source": sec.source,
+                "title": sec.title or "",
+                "section": sec.section or "",
+                "anchor": sec.anchor or "",
+                **sec.meta,
+            }
+            chunks.append((content, meta))
+
+            if keep_overlap and overlap_tokens > 0:
+                back, t = [], 0
+                for para in reversed(current):
+                    n = count_tokens(para)
+                    if t + n > overlap_tokens:
+                        break
+                    back.append(para)
+                    t += n
+                current = list(reversed(back))
+                current_tokens = sum(count_tokens(p) for p in current)
+            else:
+                current = []
+                current_tokens = 0
+
+        for para in paragraphs:
+            n = count_tokens(para)
+            if n >= target_tokens_max:
+                if _is_code_or_table_block(para):
+                    if current:
+                        push_chunk()
+                    current = [para]
+                    current_tokens = n
+                    push_chunk()
+                    continue
+                pieces = _split_text_to_max_tokens(para, target_tokens_max, _UNCACHED)  # type: ignore[arg-type]
+                for piece in pieces:
+                    pn = count_tokens(piece)
+                    while current and current_tokens + pn > target_tokens_max:
+                        push_chunk(keep_overlap=False)
+                    current.append(piece)
+                    current_tokens += pn
+                    if current_tokens >= target_tokens_max:
+                        push_chunk()
+                continue
+
+            if current_tokens + n <= target_tokens_max:
+                current.append(para)
+                current_tokens += n
+            else:
+                if current_tokens < target_tokens_min:
+                    current.append(para)
+                    current_tokens += n
+                    push_chunk()
+                else:
+                    push_chunk()
+                    current = [para]
+                    current_tokens = n
+        push_chunk()
+
+    return chunks
+
+
+def _time(fn, sections: List[List[MDSection]]) -> Tuple[float, List]:
+    t0 = time.perf_counter()
+    out = [fn(secs) for secs in sections]
+    return time.perf_counter() - t0, out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark chunk_sections against the previous implementation")
+    parser.add_argument("--docs", type=str, default="docs", help="Docs folder")
+    args = parser.parse_args()
+
+    sections = [parse_markdown(p)[0] for p in sorted(Path(args.docs).rglob("*.md"))]
+    utils.get_tokenizer()  # load the encoding outside the timed region
+
+    calls = {"n": 0}
+    enc = utils.get_tokenizer()
+    orig_encode = enc.encode
+
+    def counting_encode(text, *a, **kw):  # type: ignore[no-untyped-def]
+        calls["n"] += 1
+        return orig_encode(text, *a, **kw)
+
+    results = {}
+    for name, fn in (("legacy", legacy_chunk_sections), ("current", chunk_sections)):
+        calls["n"] = 0
+        enc.encode = counting_encode  # type: ignore[method-assign]
+        try:
+            dt, out = _time(fn, sections)
+        finally:
+            enc.encode = orig_encode  # type: ignore[method-assign]
+        results[name] = out
+        n_chunks = sum(len(c) for c in out)
+        print(f"{name:<8} {dt:7.2f}s  {n_chunks} chunks  {calls['n']} encode calls")
+    # token_count is new in the current chunker's meta
+    current = [[(t, {k: v for k, v in m.items() if k != "token_count"}) for t, m in chunks]
+               for chunks in results["current"]]
+    same = results["legacy"] == current
+    print("identical output" if same else "OUTPUT DIFFERS")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+from app.context_packer import pack_context
+from app.ingest_pipeline import parse_and_chunk
+from app.utils import get_tokenizer, trim_context
+
+
+def legacy_build_context(results: List[Dict[str, Any]], max_tokens: int) -> Tuple[str, int]:
+    """Context building as ``_plan_answer`` did it before the packer (re-tokenizes every part)."""
+    seen: set = set()
+    parts: List[str] = []
+    for r in results:
+        key = (r["source"], r.get("anchor"))
+        if key in seen:
+            continue
+        seen.add(key)
+        title = r.get("section") or r.get("title") or ""
+        header = f"## {title}" if title else ""
+        parts.append("\n\n".join([header, r["text"]]).strip())
+    return trim_context(parts, max_tokens=max_tokens)
+
+
+def packed_context(results: List[Dict[str, Any]], max_tokens: int) -> Tuple[str, int]:
+    packed = pack_context(results, max_tokens=max_tokens)
+    return packed.text, packed.tokens
+
+
+def sample_requests(docs: str, n: int, per_request: int, seed: int) -> List[List[Dict[str, Any]]]:
+    """Result lists shaped like retrieval output: runs of neighbouring chunks plus strays."""
+    chunks: List[Dict[str, Any]] = []
+    for p in sorted(Path(docs).rglob("*.md")):
+        chunks.extend({"text": t, **meta} for t, meta in parse_and_chunk(str(p))[1])
+    rnd = random.Random(seed)
+    requests = []
+    for _ in range(n):
+        start = rnd.randrange(max(1, len(chunks) - per_request))
+        picked = chunks[start : start + per_request // 2] + rnd.sample(chunks, per_request - per_request // 2)
+        scores = sorted((rnd.random() for _ in picked), reverse=True)
+        requests.append([{**c, "score": s} for c, s in zip(picked, scores)])
+    return requests
+
+
+def cpu_ms(fn: Callable[..., Tuple[str, int]], requests: List[List[Dict[str, Any]]], max_tokens: int
+           ) -> Tuple[List[float], List[int]]:
+    times, tokens = [], []
+    for results in requests:
+        t0 = time.process_time()
+        _, n = fn(results, max_tokens)
+        times.append((time.process_time() - t0) * 1000)
+        tokens.append(n)
+    return times, tokens
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Per-request CPU time of context building: trim_context vs packer")
+    parser.add_argument("--docs", type=str, default="docs", help="Docs folder to take chunks from")
+    parser.add_argument("--requests", type=int, default=500, help="Simulated /answer requests")
+    parser.add_argument("--per-request", type=int, default=8, help="Retrieved chunks per request (as with rerank)")
+    parser.add_argument("--max-context-tokens", type=int, default=3500, help="Context budget")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    requests = sample_requests(args.docs, args.requests, args.per_request, args.seed)
+    get_tokenizer()  # load the encoding outside the timed region
+    print(f"{len(requests)} requests x {args.per_request} chunks, budget {args.max_context_tokens} tokens")
+    for name, fn in (("legacy", legacy_build_context), ("packer", packed_context)):
+        cpu_ms(fn, requests[:20], args.max_context_tokens)  # warm-up
+        times, tokens = cpu_ms(fn, requests, args.max_context_tokens)
+        print(f"{name:<7} cpu/request: mean {statistics.mean(times):6.3f} ms  p95 "
+              f"{statistics.quantiles(times, n=20)[-1]:6.3f} ms  context tokens: mean {statistics.mean(tokens):6.0f}")
+
+
+if __name__ == "__main__":
+    main()
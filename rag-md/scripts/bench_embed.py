@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from app.config import get_settings
+from app.ingest_pipeline import length_sorted_batches, parse_and_chunk
+
+
+def per_file_batches(files: List[List[str]], batch_size: int, inner: int) -> List[List[str]]:
+    """Batches as the old ingest formed them: per-file slices of ``batch_size``, which
+    ``SentenceTransformer.encode`` then length-sorts and splits into ``inner``-sized passes."""
+    out: List[List[str]] = []
+    for texts in files:
+        for i in range(0, len(texts), batch_size):
+            call = texts[i : i + batch_size]
+            out.extend([[call[j] for j in idx] for idx in length_sorted_batches(call, inner)])
+    return out
+
+
+def sorted_batches(texts: List[str], window: int, batch_size: int) -> List[List[str]]:
+    out: List[List[str]] = []
+    for i in range(0, len(texts), window):
+        part = texts[i : i + window]
+        out.extend([[part[j] for j in idx] for idx in length_sorted_batches(part, batch_size)])
+    return out
+
+
+def padding_stats(batches: List[List[str]]) -> Dict[str, float]:
+    real = sum(len(t) for b in batches for t in b)
+    padded = sum(max(len(t) for t in b) * len(b) for b in batches if b)
+    return {"batches": len(batches), "efficiency": real / padded if padded else 1.0}
+
+
+def time_encode(encode: Callable[[List[str]], object], batches: List[List[str]]) -> float:
+    t0 = time.perf_counter()
+    for b in batches:
+        encode(b)
+    return time.perf_counter() - t0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark per-file vs length-sorted cross-file embedding batches")
+    parser.add_argument("--docs", type=str, default="docs", help="Docs folder")
+    parser.add_argument("--limit", type=int, default=0, help="Use only the first N chunks (0 = all)")
+    parser.add_argument("--window", type=int, default=256, help="Cross-file window that gets length-sorted")
+    parser.add_argument("--encode-batch-size", type=int, default=16, help="Chunks per forward pass (new scheme)")
+    parser.add_argument("--dry-run", action="store_true", help="Only report padding efficiency; do not load the model")
+    args = parser.parse_args()
+
+    files: List[List[str]] = []
+    total = 0
+    for p in sorted(Path(args.docs).rglob("*.md")):
+        _source, chunks, _ = parse_and_chunk(str(p))
+        texts = [t for t, _ in chunks]
+        if args.limit and total + len(texts) > args.limit:
+            texts = texts[: args.limit - total]
+        if texts:
+            files.append(texts)
+            total += len(texts)
+        if args.limit and total >= args.limit:
+            break
+    flat = [t for texts in files for t in texts]
+    print(f"{len(files)} files, {len(flat)} chunks")
+
+    before = per_file_batches(files, 16, 8)
+    after = sorted_batches(flat, args.window, args.encode_batch_size)
+    for name, batches in (("per-file", before), ("sorted", after)):
+        st = padding_stats(batches)
+        print(f"{name:<9} {st['batches']:>5} forward passes, padding efficiency {st['efficiency']:.1%}")
+    if args.dry_run:
+        return
+
+    from sentence_transformers import SentenceTransformer
+
+    cfg = get_settings()
+    model = SentenceTransformer(cfg.embedding_model, device=cfg.embedding_device)
+
+    def encode(batch: List[str]) -> object:
+        return model.encode(batch, normalize_embeddings=True, batch_size=len(batch), show_progress_bar=False)
+
+    encode(flat[:8])  # warm-up
+    for name, batches in (("per-file", before), ("sorted", after)):
+        dt = time_encode(encode, batches)
+        print(f"{name:<9} {len(flat) / dt:8.1f} chunks/s ({dt:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
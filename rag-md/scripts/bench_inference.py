@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import argparse
+import multiprocessing as mp
+import resource
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from app.config import get_settings
+from app.ingest_pipeline import parse_and_chunk
+
+
+def sample_chunks(docs: str, limit: int) -> List[str]:
+    texts: List[str] = []
+    for p in sorted(Path(docs).rglob("*.md")):
+        texts.extend(t for t, _ in parse_and_chunk(str(p))[1])
+        if len(texts) >= limit:
+            break
+    return texts[:limit]
+
+
+def _rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+
+def run_backend(backend: str, texts: List[str], batch_size: int, out: "mp.Queue[Dict[str, float]]") -> None:
+    """Runs in a fresh process so load time and peak RSS are per backend."""
+    from sentence_transformers import CrossEncoder, SentenceTransformer
+
+    from app.deps import load_model
+
+    cfg = get_settings()
+    stats: Dict[str, float] = {}
+    rss0 = _rss_mb()
+    t0 = time.perf_counter()
+    embedder = load_model(SentenceTransformer, cfg.embedding_model, backend=backend, device="cpu")
+    stats["embed_load_s"] = time.perf_counter() - t0
+    embedder.encode(texts[:batch_size], batch_size=batch_size, normalize_embeddings=True)
+    t0 = time.perf_counter()
+    embedder.encode(texts, batch_size=batch_size, normalize_embeddings=True)
+    stats["embed_per_s"] = len(texts) / (time.perf_counter() - t0)
+
+    if cfg.reranker_model:
+        t0 = time.perf_counter()
+        rr = load_model(CrossEncoder, cfg.reranker_model, backend=backend, device="cpu",
+                        max_length=cfg.rerank_max_tokens)
+        stats["rerank_load_s"] = time.perf_counter() - t0
+        pairs = [["как создать документ через API", t] for t in texts]
+        rr.predict(pairs[:batch_size], batch_size=batch_size)
+        t0 = time.perf_counter()
+        rr.predict(pairs, batch_size=batch_size)
+        stats["rerank_per_s"] = len(pairs) / (time.perf_counter() - t0)
+    stats["rss_mb"] = _rss_mb() - rss0
+    out.put(stats)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Throughput of the torch vs ONNX Runtime inference backends")
+    parser.add_argument("--docs", type=str, default="docs", help="Docs folder to sample chunks from")
+    parser.add_argument("--backends", type=str, default="torch,onnx-int8", help="Comma-separated backends")
+    parser.add_argument("--limit", type=int, default=256, help="Chunks to encode/rerank")
+    parser.add_argument("--batch-size", type=int, default=16, help="Batch size for encode/predict")
+    args = parser.parse_args()
+
+    texts = sample_chunks(args.docs, args.limit)
+    print(f"{len(texts)} chunks, batch {args.batch_size}")
+    ctx = mp.get_context("spawn")
+    for backend in args.backends.split(","):
+        out: "mp.Queue[Dict[str, float]]" = ctx.Queue()
+        proc = ctx.Process(target=run_backend, args=(backend, texts, args.batch_size, out))
+        proc.start()
+        stats = out.get()
+        proc.join()
+        line = (f"{backend:<10} embed {stats['embed_per_s']:7.1f} chunks/s (load {stats['embed_load_s']:5.1f}s)")
+        if "rerank_per_s" in stats:
+            line += f"  rerank {stats['rerank_per_s']:7.1f} pairs/s (load {stats['rerank_load_s']:5.1f}s)"
+        print(f"{line}  peak RSS +{stats['rss_mb']:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
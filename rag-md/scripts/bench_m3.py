@@ -0,0 +1,13 @@
+from __future__ import annotations
+
+import sys
+
+from scripts.bench_retrieval import main
+
+# bge-m3 sparse + ColBERT against dense + cross-encoder, scored on bench/retrieval_v1.json.
+# Same as `python -m scripts.bench_retrieval --preset m3`; the scratch index is ingested
+# with --m3, and e.g. `--config m3+colbert:mode=m3,with_rerank=true,m3_candidates=50`
+# changes the ColBERT rescoring depth.
+
+if __name__ == "__main__":
+    sys.exit(main(["--preset", "m3", *sys.argv[1:]]))
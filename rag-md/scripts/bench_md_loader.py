@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import frontmatter
+from markdown_it import MarkdownIt
+
+from app.md_loader import MDSection, _slugify, iter_sections
+
+
+# Reference: parse_markdown as it was before the streaming parser (whole file through
+# frontmatter + one markdown-it token list), kept to compare output, time and memory.
+def legacy_parse_markdown(file_path: Path) -> List[MDSection]:
+    post = frontmatter.load(file_path)
+    fm = post.metadata or {}
+    tokens = MarkdownIt("commonmark", options_update={"linkify": True, "typographer": False}).parse(post.content)
+    sections: List[MDSection] = []
+    title: Optional[str] = None
+    section: Optional[str] = None
+    anchor: Optional[str] = None
+    buf: List[str] = []
+
+    def flush() -> None:
+        nonlocal buf
+        text = "".join(buf).strip()
+        if text:
+            sections.append(MDSection(file_path.as_posix(), title, section, anchor, text, {k: str(v) for k, v in fm.items()}))
+        buf = []
+
+    i = 0
+    while i < len(tokens):
+        t = tokens[i]
+        if t.type == "heading_open" and t.tag in {"h1", "h2", "h3", "h4"}:
+            flush()
+            heading_text = tokens[i + 1].content.strip()
+            if t.tag == "h1" and title is None:
+                title = heading_text
+            section = heading_text
+            anchor = _slugify(heading_text)
+            i += 3
+            continue
+        if t.type in {"fence", "code_block"}:
+            buf.append(t.content)
+        elif t.type == "inline":
+            buf.append(t.content + "\n")
+        i += 1
+    flush()
+    updated = dt.datetime.fromtimestamp(file_path.stat().st_mtime).isoformat()
+    for s in sections:
+        s.meta.setdefault("updated_at", updated)
+    return sections
+
+
+def streaming(file_path: Path) -> List[MDSection]:
+    return list(iter_sections(file_path))
+
+
+def consume(file_path: Path) -> List[MDSection]:
+    """Stream without keeping sections, as chunking consumes them."""
+    for _ in iter_sections(file_path):
+        pass
+    return []
+
+
+def _key(s: MDSection) -> Tuple:
+    return (s.source, s.title, s.section, s.anchor, s.text, s.meta)
+
+
+def run(fn: Callable[[Path], List[MDSection]], files: List[Path], largest: List[Path]) -> Dict[str, float]:
+    t0 = time.perf_counter()
+    for p in files:
+        fn(p)
+    elapsed = time.perf_counter() - t0
+    peak = 0
+    for p in largest:
+        tracemalloc.start()
+        fn(p)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return {"time": elapsed, "peak": peak}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the streaming Markdown parser against the previous one")
+    parser.add_argument("--docs", type=str, default="docs", help="Docs folder")
+    parser.add_argument("--largest", type=int, default=10, help="Trace peak memory on the N largest files")
+    args = parser.parse_args()
+
+    files = sorted(Path(args.docs).rglob("*.md"))
+    size = sum(p.stat().st_size for p in files)
+    largest = sorted(files, key=lambda p: p.stat().st_size, reverse=True)[: args.largest]
+    print(f"{len(files)} files, {size / 1e6:.1f} MB; largest {largest[0]} {largest[0].stat().st_size / 1e3:.0f} kB")
+    for name, fn in (("legacy", legacy_parse_markdown), ("stream", streaming), ("consume", consume)):
+        st = run(fn, files, largest)
+        print(f"{name:<8} {st['time']:6.2f}s  peak {st['peak'] / 1e6:6.1f} MB")
+    same = all([_key(s) for s in legacy_parse_markdown(p)] == [_key(s) for s in streaming(p)] for p in files)
+    print("identical output" if same else "OUTPUT DIFFERS")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+from app.content_store import ContentStore, ContentWriter
+from app.vectorstore.base import Hit, Point
+from app.vectorstore.local import LocalVectorStore
+from scripts.bench_vectorstore import corpus_points
+
+COLLECTION = "bench_payloads"
+
+
+def payload_bytes(payloads: Sequence[Dict[str, Any]]) -> int:
+    # JSON is what Qdrant stores per point and what it sends back per hit
+    return sum(len(json.dumps(p, ensure_ascii=False).encode("utf-8")) for p in payloads)
+
+
+def response_bytes(store: LocalVectorStore, queries: np.ndarray, top_k: int, exclude: Sequence[str] = ()) -> float:
+    sizes = [payload_bytes([h.payload for h in store.search(COLLECTION, q, top_k=top_k, exclude=exclude)])
+             for q in queries]
+    return statistics.mean(sizes)
+
+
+def hydrate_ms(content: ContentStore, hits: List[List[Hit]], n: int) -> List[float]:
+    out = []
+    for row in hits:
+        t0 = time.perf_counter()
+        content.get_many(h.payload["text_hash"] for h in row[:n])
+        out.append((time.perf_counter() - t0) * 1000)
+    return out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Stored and transferred payload bytes: full vs slim points")
+    parser.add_argument("--docs", type=str, default="docs", help="Docs folder whose chunks make up the corpus")
+    parser.add_argument("--dim", type=int, default=1024, help="Vector size (bge-m3: 1024)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=24, help="Candidates per query (/answer default)")
+    parser.add_argument("--used", type=int, default=8, help="Chunks whose text a response actually uses")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    points = corpus_points(args.docs, args.dim, args.seed)
+    queries = np.random.default_rng(args.seed + 1).normal(size=(args.queries, args.dim)).astype(np.float32)
+    raw_text = sum(len(p.payload["text"].encode("utf-8")) for p in points)
+    print(f"{len(points)} points, {raw_text / 2**20:.2f} MB of chunk text, top_k {args.top_k}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = ContentWriter(Path(tmp) / "content.zst", fresh=True)
+        slim_points = [Point(p.id, p.vector, writer.slim(p.payload)) for p in points]
+        t0 = time.perf_counter()
+        n_texts, size = writer.save()
+        print(f"content store: {n_texts} texts, {size / 2**20:.2f} MB zstd "
+              f"({raw_text / max(size, 1):.1f}x) in {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+        full_bytes = payload_bytes([p.payload for p in points])
+        slim_bytes = payload_bytes([p.payload for p in slim_points])
+        print(f"stored payload per point    full {full_bytes / len(points):7.0f} B   "
+              f"slim {slim_bytes / len(points):7.0f} B   ({full_bytes / slim_bytes:.1f}x less)")
+
+        stores = {}
+        for name, pts in (("full", points), ("slim", slim_points)):
+            store = LocalVectorStore(Path(tmp) / name)
+            store.ensure_collection(COLLECTION, args.dim)
+            store.upsert(COLLECTION, pts)
+            store.flush(COLLECTION)
+            stores[name] = store
+        full = response_bytes(stores["full"], queries, args.top_k)
+        bare = response_bytes(stores["full"], queries, args.top_k, exclude=("text",))
+        slim = response_bytes(stores["slim"], queries, args.top_k)
+        print(f"search response payloads    full {full:7.0f} B   exclude text {bare:7.0f} B   slim {slim:7.0f} B")
+
+        content = ContentStore.load(Path(tmp) / "content.zst")
+        hits = [stores["slim"].search(COLLECTION, q, top_k=args.top_k) for q in queries]
+        times = hydrate_ms(content, hits, args.used)
+        print(f"hydrate {args.used} texts from the content store: p50 {statistics.median(times):.3f} ms  "
+              f"p95 {statistics.quantiles(times, n=20)[-1]:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
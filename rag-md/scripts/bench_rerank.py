@@ -0,0 +1,12 @@
+from __future__ import annotations
+
+import sys
+
+from scripts.bench_retrieval import main
+
+# Rerank depth comparison: fixed depths against the adaptive RERANK_* cut, scored on
+# bench/retrieval_v1.json. Same as `python -m scripts.bench_retrieval --preset rerank`;
+# every bench_retrieval flag applies (--store configured for an ingested collection).
+
+if __name__ == "__main__":
+    sys.exit(main(["--preset", "rerank", *sys.argv[1:]]))
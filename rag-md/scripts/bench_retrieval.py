@@ -0,0 +1,424 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from qdrant_client import QdrantClient
+
+from app import rerank as rerank_mod
+from app import retriever
+from app.config import Settings, get_settings
+from app.deps import get_vector_store
+from app.embed_cache import EmbeddingCache
+from app.lexical import tokenize
+from app.m3_store import M3Writer, m3_path
+from app.metrics import track_stages
+from app.rerank import get_rerank_batcher, get_rerank_cache
+from app.retriever import asearch, get_m3_query_batcher, get_query_batcher
+from app.vectorstore.base import VectorStore
+from app.vectorstore.local import LocalVectorStore
+from app.vectorstore.qdrant import QdrantStore
+from scripts.ingest_md import Ingestor, list_files, publish
+
+# Offline retrieval benchmark: ingests the dataset's docs into a throwaway local
+# store (or an in-process Qdrant), runs each search configuration over the
+# versioned question set through asearch (the /search code path) and writes
+# recall/MRR/nDCG plus per-stage latency percentiles as JSON. --baseline turns
+# it into a CI gate.
+
+DATASET = "bench/retrieval_v1.json"
+COLLECTION = "bench_retrieval"
+DEFAULT_CONFIGS = ("dense:mode=dense", "hybrid:mode=hybrid", "hybrid+rerank:mode=hybrid,with_rerank=true")
+# config sets run by --preset (and by scripts/bench_rerank.py, scripts/bench_m3.py)
+PRESETS: Dict[str, Tuple[str, ...]] = {
+    "default": DEFAULT_CONFIGS,
+    # fixed rerank depths against the adaptive cut (RERANK_* settings), over /answer's 24 candidates
+    "rerank": (
+        "no-rerank:mode=hybrid,top_k=24",
+        *(f"top-{d}:mode=hybrid,top_k=24,with_rerank=true,rerank_top_n={d},rerank_min_n={d},rerank_score_gap=0"
+          for d in (4, 8, 16, 24)),
+        "adaptive:mode=hybrid,top_k=24,with_rerank=true",
+    ),
+    # bge-m3 sparse + ColBERT against dense + cross-encoder
+    "m3": (
+        "dense:mode=dense",
+        "dense+ce:mode=dense,with_rerank=true",
+        "m3:mode=m3",
+        "m3+colbert:mode=m3,with_rerank=true,m3_colbert_rerank=true",
+        "m3+ce:mode=m3,with_rerank=true,m3_colbert_rerank=false",
+    ),
+}
+# keys passed to asearch; any other config key must be a Settings field
+SEARCH_KEYS = ("top_k", "mode", "with_rerank", "filters")
+PERCENTILES = (50, 95, 99)
+
+Expected = Tuple[str, Optional[str]]  # (source, anchor); anchor None: any chunk of the source
+
+
+@dataclass
+class Question:
+    id: str
+    question: str
+    expected: List[Expected]
+    filters: Optional[Dict[str, Any]] = None
+
+
+def load_dataset(path: Path) -> Tuple[Dict[str, Any], List[Question]]:
+    data = json.loads(path.read_text(encoding="utf-8"))
+    questions = [
+        Question(q["id"], q["question"], [(e["source"], e.get("anchor")) for e in q["expected"]], q.get("filters"))
+        for q in data["questions"]
+    ]
+    return data, questions
+
+
+def docs_fingerprint(docs: Path) -> str:
+    """sha256 over the docs' relative paths and bytes: tells whether a dataset still matches them."""
+    h = hashlib.sha256()
+    for p in sorted(docs.rglob("*.md")):
+        h.update(p.relative_to(docs).as_posix().encode("utf-8") + b"\0")
+        h.update(p.read_bytes())
+    return h.hexdigest()
+
+
+def gains(results: Sequence[Dict[str, Any]], expected: Sequence[Expected]) -> List[int]:
+    """1 at each rank whose chunk is an expected (source, anchor) not matched at an earlier rank."""
+    left = list(expected)
+    out = []
+    for r in results:
+        hit = next((e for e in left if e[0] == r["source"] and (e[1] is None or e[1] == r.get("anchor"))), None)
+        if hit is not None:
+            left.remove(hit)
+        out.append(int(hit is not None))
+    return out
+
+
+def quality(judged: Sequence[Tuple[List[int], int]], cutoffs: Sequence[int]) -> Dict[str, float]:
+    """recall@k and nDCG@k per cutoff, MRR at the largest one; averaged over questions."""
+    n = len(judged) or 1
+    top = max(cutoffs)
+    out: Dict[str, float] = {}
+    for k in cutoffs:
+        out[f"recall@{k}"] = sum(sum(g[:k]) / n_exp for g, n_exp in judged) / n
+    out[f"mrr@{top}"] = sum(next((1.0 / (i + 1) for i, x in enumerate(g[:top]) if x), 0.0) for g, _ in judged) / n
+    for k in cutoffs:
+        total = 0.0
+        for g, n_exp in judged:
+            dcg = sum(x / math.log2(i + 2) for i, x in enumerate(g[:k]))
+            ideal = sum(1.0 / math.log2(i + 2) for i in range(min(n_exp, k)))
+            total += dcg / ideal
+        out[f"ndcg@{k}"] = total / n
+    return {name: round(v, 4) for name, v in out.items()}
+
+
+def percentiles(samples: Sequence[float]) -> Dict[str, float]:
+    values = np.percentile(np.asarray(samples, dtype=np.float64), PERCENTILES)
+    return {**{f"p{p}": round(float(v), 3) for p, v in zip(PERCENTILES, values)}, "n": len(samples)}
+
+
+@lru_cache(maxsize=1 << 16)
+def _feature(feature: str) -> int:
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class HashEmbedder:
+    """Offline stand-in for the embedding model: signed feature hashing of the BM25
+    tokens and their bigrams. It has no semantics, but it is deterministic and needs
+    no download, so pipeline latency and lexical/fusion quality stay trackable in CI."""
+
+    prompts: Dict[str, str] = {}
+
+    def __init__(self, dim: int = 256) -> None:
+        self.dim = dim
+        self.name = f"hash-{dim}"
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts: Sequence[str], **kwargs: Any) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            tokens = tokenize(text)
+            for f in (*tokens, *(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))):
+                h = _feature(f)
+                out[i, h % self.dim] += 1.0 if h >> 63 else -1.0
+        return out / np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+
+
+class OverlapReranker:
+    """Offline stand-in for the cross-encoder: share of the query's tokens in the passage."""
+
+    def predict(self, pairs: Sequence[Sequence[str]], **kwargs: Any) -> List[float]:
+        out = []
+        for query, passage in pairs:
+            q = set(tokenize(query))
+            out.append(len(q & set(tokenize(passage))) / max(len(q), 1))
+        return out
+
+
+class _AsyncOverSync:
+    """AsyncQdrantClient look-alike over an in-process ``QdrantClient(":memory:")``
+    (a separate AsyncQdrantClient(":memory:") would not see its points)."""
+
+    def __init__(self, client: QdrantClient) -> None:
+        self._client = client
+
+    def __getattr__(self, name: str) -> Any:
+        fn = getattr(self._client, name)
+
+        async def call(*args: Any, **kwargs: Any) -> Any:
+            return fn(*args, **kwargs)
+
+        return call
+
+
+def open_store(kind: str, cfg: Settings) -> VectorStore:
+    if kind == "local":
+        return LocalVectorStore(Path(cfg.data_dir) / "vectors", dtype=cfg.local_vector_dtype)
+    if kind == "qdrant-memory":
+        client = QdrantClient(":memory:")
+        return QdrantStore(client, _AsyncOverSync(client))  # type: ignore[arg-type]
+    if kind != "configured":
+        raise ValueError(f"Unknown store: {kind}")
+    return get_vector_store()
+
+
+def install(store: VectorStore, embedder: Any = None, reranker: Any = None) -> None:
+    """Point the search path at the benchmark's store (and stand-in models, if any)."""
+    retriever.get_vector_store = lambda: store
+    if embedder is not None:
+        retriever.get_embedder = lambda: embedder
+    if reranker is not None:
+        rerank_mod.get_reranker = lambda: reranker
+
+
+def ingest(store: VectorStore, collection: str, docs: Path, cfg: Settings, embedder: Any, *,
+           m3: bool = False, max_inflight: int = 4) -> int:
+    """(Re)build ``collection`` from ``docs`` with the embedding cache under DATA_DIR; returns its size."""
+    dim = embedder.get_sentence_embedding_dimension() if embedder is not None else 1024
+    store.ensure_collection(collection, dim, recreate=True)
+    cache = EmbeddingCache(str(Path(cfg.data_dir) / "embed_cache.sqlite3"))
+    writer = M3Writer(m3_path(collection), fresh=True) if m3 else None
+    try:
+        ingestor = Ingestor(store, collection, cfg, cache=cache, m3=writer, embedder=embedder,
+                            max_inflight=max_inflight)
+        ingestor.ingest_files(list_files(docs))
+        return publish(store, collection, m3=writer)
+    finally:
+        cache.close()
+        if writer is not None:
+            writer.close()
+
+
+def parse_config(spec: str, top_k: int) -> Dict[str, Any]:
+    """``name:key=value,...`` (values JSON-decoded when they parse) or a JSON object with a ``name``."""
+    if spec.lstrip().startswith("{"):
+        conf = json.loads(spec)
+    else:
+        name, _, rest = spec.partition(":")
+        conf = {"name": name}
+        for item in filter(None, rest.split(",")):
+            key, _, value = item.partition("=")
+            try:
+                conf[key.strip()] = json.loads(value)
+            except json.JSONDecodeError:
+                conf[key.strip()] = value
+    conf.setdefault("top_k", top_k)
+    unknown = [k for k in conf if k != "name" and k not in SEARCH_KEYS and k not in Settings.model_fields]
+    if unknown:
+        raise ValueError(f"config {conf.get('name')!r}: unknown keys {unknown}")
+    return conf
+
+
+@contextmanager
+def overrides(cfg: Settings, values: Dict[str, Any]) -> Iterator[None]:
+    old = {k: getattr(cfg, k) for k in values}
+    for k, v in values.items():
+        setattr(cfg, k, v)
+    # batchers read their sizes from the settings when created
+    for getter in (get_query_batcher, get_m3_query_batcher, get_rerank_batcher):
+        getter.cache_clear()
+    try:
+        yield
+    finally:
+        for k, v in old.items():
+            setattr(cfg, k, v)
+
+
+async def run_config(conf: Dict[str, Any], questions: Sequence[Question], collection: str, *,
+                     repeat: int, cutoffs: Sequence[int]) -> Dict[str, Any]:
+    cfg = get_settings()
+    kwargs = {k: conf[k] for k in SEARCH_KEYS if k in conf and k != "filters"}
+    with overrides(cfg, {k: v for k, v in conf.items() if k != "name" and k not in SEARCH_KEYS}):
+        await asearch(questions[0].question, collection=collection, **kwargs)  # load indexes, spin up batchers
+        judged: List[Tuple[List[int], int]] = []
+        misses: List[str] = []
+        stages: Dict[str, List[float]] = {"total": []}
+        for q in questions:
+            filters = {**(q.filters or {}), **(conf.get("filters") or {})} or None
+            for i in range(repeat):
+                get_rerank_cache().clear()  # every run pays for its rerank
+                with track_stages() as timings:
+                    t0 = time.perf_counter()
+                    results = await asearch(q.question, collection=collection, filters=filters, **kwargs)
+                    stages["total"].append((time.perf_counter() - t0) * 1000)
+                for name, ms in timings.items():
+                    stages.setdefault(name, []).append(ms)
+                if i == 0:
+                    g = gains(results, q.expected)
+                    judged.append((g, len(q.expected)))
+                    if not any(g[: max(cutoffs)]):
+                        misses.append(q.id)
+    return {
+        "name": conf["name"],
+        "params": {k: v for k, v in conf.items() if k != "name"},
+        "quality": quality(judged, cutoffs),
+        "latency_ms": {name: percentiles(samples) for name, samples in stages.items()},
+        "misses": misses,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], *, max_quality_drop: float,
+            max_latency_increase: Optional[float]) -> List[str]:
+    """Regressions of ``current`` against ``baseline``, per config present in both."""
+    base = {c["name"]: c for c in baseline["configs"]}
+    out = []
+    for c in current["configs"]:
+        b = base.get(c["name"])
+        if b is None:
+            continue
+        for metric, value in c["quality"].items():
+            ref = b["quality"].get(metric)
+            if ref is not None and value < ref - max_quality_drop:
+                out.append(f"{c['name']}: {metric} {value:.4f} < baseline {ref:.4f}")
+        if max_latency_increase is not None:
+            now, ref = c["latency_ms"]["total"]["p95"], b["latency_ms"]["total"]["p95"]
+            if now > ref * (1 + max_latency_increase):
+                out.append(f"{c['name']}: p95 {now:.1f} ms > baseline {ref:.1f} ms +{max_latency_increase:.0%}")
+    return out
+
+
+def print_table(report: Dict[str, Any], file: Any = None) -> None:
+    configs = report["configs"]
+    metrics = list(configs[0]["quality"]) if configs else []
+    print(f"{'config':<16} " + " ".join(f"{m:>9}" for m in metrics) + f" {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}", file=file)
+    for c in configs:
+        total = c["latency_ms"]["total"]
+        print(f"{c['name']:<16} " + " ".join(f"{c['quality'][m]:9.3f}" for m in metrics)
+              + f" {total['p50']:8.1f} {total['p95']:8.1f} {total['p99']:8.1f}", file=file)
+        stages = [f"{s} {v['p50']:.2f}/{v['p95']:.2f}" for s, v in c["latency_ms"].items() if s != "total"]
+        print(f"{'':<16} stages p50/p95 ms: {', '.join(stages)}", file=file)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline retrieval quality/latency benchmark over a versioned question set")
+    parser.add_argument("--dataset", type=str, default=DATASET)
+    parser.add_argument("--config", action="append", default=[],
+                        help="Search configuration, repeatable: 'name:mode=hybrid,top_k=10,with_rerank=true' or a JSON "
+                             "object; keys other than top_k/mode/with_rerank/filters override Settings fields "
+                             "(default: the --preset configs)")
+    parser.add_argument("--preset", choices=sorted(PRESETS), default="default",
+                        help=f"Config set run without --config ({', '.join(f'{k}: {len(v)}' for k, v in PRESETS.items())})")
+    parser.add_argument("--top-k", type=int, default=10, help="top_k of configs that do not set one")
+    parser.add_argument("--cutoffs", type=str, default="1,5,10")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per question")
+    parser.add_argument("--store", choices=["local", "qdrant-memory", "configured"], default="local",
+                        help="local / in-process Qdrant built from the docs, or the configured store as ingested")
+    parser.add_argument("--models", choices=["configured", "hash"], default="configured",
+                        help="hash: offline stand-ins for the embedder and reranker (no download)")
+    parser.add_argument("--m3", action="store_true",
+                        help="Also ingest bge-m3 sparse/ColBERT outputs (implied by mode=m3 configs)")
+    parser.add_argument("--collection", type=str, default="", help="Collection (default: a scratch one; "
+                                                                   "QDRANT_COLLECTION with --store configured)")
+    parser.add_argument("--data-dir", type=str, default="", help="Keep the index and embedding cache here between runs")
+    parser.add_argument("--output", type=str, default="", help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", type=str, default="", help="Earlier JSON report: exit 1 on regressions")
+    parser.add_argument("--max-quality-drop", type=float, default=0.0)
+    parser.add_argument("--max-latency-increase", type=float, default=None,
+                        help="Allowed relative p95 increase (e.g. 0.2); latency is not gated without it")
+    args = parser.parse_args(argv)
+
+    cfg = get_settings()
+    dataset_path = Path(args.dataset)
+    data, questions = load_dataset(dataset_path)
+    cutoffs = [int(k) for k in args.cutoffs.split(",")]
+    try:
+        configs = [parse_config(s, args.top_k) for s in (args.config or PRESETS[args.preset])]
+    except ValueError as e:
+        parser.error(str(e))
+    use_m3 = args.m3 or any(c.get("mode") == "m3" for c in configs)
+    docs = Path(data["docs"])
+    fingerprint = docs_fingerprint(docs)
+    if fingerprint != data.get("docs_sha256"):
+        print(f"warning: {docs} changed since {dataset_path.name} was written; expected anchors may be stale",
+              file=sys.stderr)
+
+    embedder = reranker = None
+    if args.models == "hash":
+        embedder, reranker = HashEmbedder(), OverlapReranker()
+        cfg.embedding_model = embedder.name  # keeps its vectors apart in the embedding cache
+    tmp = tempfile.TemporaryDirectory() if not args.data_dir and args.store != "configured" else None
+    if tmp is not None or args.data_dir:
+        cfg.data_dir = tmp.name if tmp is not None else args.data_dir
+    cfg.vector_store = "local" if args.store == "local" else cfg.vector_store
+    try:
+        store = open_store(args.store, cfg)
+        collection = args.collection or (cfg.qdrant_collection if args.store == "configured" else COLLECTION)
+        setup: Dict[str, Any] = {"store": args.store, "models": args.models, "collection": collection,
+                                 "embedding_model": cfg.embedding_model,
+                                 "reranker_model": "overlap" if reranker is not None else cfg.reranker_model}
+        if args.store != "configured":
+            t0 = time.perf_counter()
+            # qdrant-client's in-process mode is not thread-safe: one upsert at a time
+            setup["chunks"] = ingest(store, collection, docs, cfg, embedder, m3=use_m3,
+                                     max_inflight=1 if args.store == "qdrant-memory" else 4)
+            setup["ingest_s"] = round(time.perf_counter() - t0, 2)
+        install(store, embedder, reranker)
+        # a loop per config: batchers re-created with its settings start clean, old ones are cancelled
+        results = [asyncio.run(run_config(c, questions, collection, repeat=args.repeat, cutoffs=cutoffs))
+                   for c in configs]
+    finally:
+        if tmp is not None:
+            tmp.cleanup()
+
+    report = {
+        "dataset": {"path": dataset_path.as_posix(), "name": data["name"], "version": data["version"],
+                    "questions": len(questions), "docs_sha256": fingerprint,
+                    "docs_match": fingerprint == data.get("docs_sha256")},
+        "setup": setup,
+        "configs": results,
+    }
+    print_table(report, file=None if args.output else sys.stderr)  # stdout carries the JSON otherwise
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        if baseline["dataset"]["version"] != data["version"]:
+            print(f"baseline is for dataset v{baseline['dataset']['version']}, not v{data['version']}: not compared",
+                  file=sys.stderr)
+            return 1
+        regressions = compare(baseline, report, max_quality_drop=args.max_quality_drop,
+                              max_latency_increase=args.max_latency_increase)
+        for r in regressions:
+            print(f"REGRESSION {r}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
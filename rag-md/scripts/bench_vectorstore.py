@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from qdrant_client import AsyncQdrantClient, QdrantClient
+
+from app.config import get_settings
+from app.embed_cache import point_id
+from app.ingest_pipeline import parse_and_chunk
+from app.vectorstore.base import Point, VectorStore
+from app.vectorstore.local import LocalVectorStore
+from app.vectorstore.qdrant import QdrantStore
+
+COLLECTION = "bench_vectorstore"
+
+
+def corpus_points(docs: str, dim: int, seed: int) -> List[Point]:
+    """Real chunk payloads from ``docs`` with random unit vectors (exact search cost
+    does not depend on the vectors, and no embedding model is needed)."""
+    rnd = np.random.default_rng(seed)
+    points = []
+    for p in sorted(Path(docs).rglob("*.md")):
+        for text, meta in parse_and_chunk(str(p))[1]:
+            vec = rnd.normal(size=dim).astype(np.float32)
+            points.append(Point(point_id(text, meta["source"], meta.get("anchor")), vec / np.linalg.norm(vec),
+                                {"text": text, **meta}))
+    return points
+
+
+async def latencies_ms(store: VectorStore, queries: np.ndarray, top_k: int,
+                       filters: List[Optional[Dict[str, Any]]]) -> List[float]:
+    out = []
+    for q, f in zip(queries, filters):
+        t0 = time.perf_counter()
+        await store.asearch(COLLECTION, q.tolist(), top_k=top_k, filters=f)
+        out.append((time.perf_counter() - t0) * 1000)
+    return out
+
+
+def report(name: str, times: List[float]) -> None:
+    print(f"{name:<28} p50 {statistics.median(times):7.3f} ms  p95 {statistics.quantiles(times, n=20)[-1]:7.3f} ms")
+
+
+def qdrant_store(url: str, points: List[Point], dim: int) -> Optional[QdrantStore]:
+    store = QdrantStore(QdrantClient(url=url, timeout=60), AsyncQdrantClient(url=url))
+    try:
+        store.ensure_collection(COLLECTION, dim, recreate=True)
+    except Exception as e:  # noqa: BLE001 - no server: report the local numbers only
+        print(f"qdrant: not reachable at {url} ({e}); skipped")
+        return None
+    for i in range(0, len(points), 256):
+        store.upsert(COLLECTION, points[i : i + 256])
+    store.flush(COLLECTION)
+    return store
+
+
+async def run(args: argparse.Namespace) -> None:
+    points = corpus_points(args.docs, args.dim, args.seed)
+    rnd = np.random.default_rng(args.seed + 1)
+    queries = rnd.normal(size=(args.queries, args.dim)).astype(np.float32)
+    sources = sorted({p.payload["source"] for p in points})
+    unfiltered: List[Optional[Dict[str, Any]]] = [None] * args.queries
+    by_source: List[Optional[Dict[str, Any]]] = [{"source": sources[i % len(sources)]} for i in range(args.queries)]
+    print(f"{len(points)} points x {args.dim} dims, {args.queries} queries, top_k {args.top_k}")
+
+    stores: List[tuple[str, VectorStore]] = []
+    tmp = tempfile.TemporaryDirectory()
+    for dtype in ("float16", "int8"):
+        local = LocalVectorStore(Path(tmp.name) / dtype, dtype=dtype)
+        local.ensure_collection(COLLECTION, args.dim)
+        local.upsert(COLLECTION, points)
+        local.flush(COLLECTION)
+        t0 = time.perf_counter()
+        local.collection(COLLECTION)
+        size_mb = local.path(COLLECTION).stat().st_size / 2**20
+        print(f"local {dtype:<8} file {size_mb:6.1f} MB, load {(time.perf_counter() - t0) * 1000:6.1f} ms")
+        stores.append((f"local {dtype}", local))
+    qdrant = qdrant_store(args.qdrant_url or get_settings().qdrant_url, points, args.dim)
+    if qdrant is not None:
+        stores.append(("qdrant", qdrant))
+
+    for name, store in stores:
+        await latencies_ms(store, queries[:20], args.top_k, unfiltered[:20])  # warm-up
+        report(f"{name}", await latencies_ms(store, queries, args.top_k, unfiltered))
+        report(f"{name} +source filter", await latencies_ms(store, queries, args.top_k, by_source))
+    if qdrant is not None:
+        qdrant.client.delete_collection(COLLECTION)
+    tmp.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Search latency: local in-process vector store vs Qdrant")
+    parser.add_argument("--docs", type=str, default="docs", help="Docs folder whose chunks make up the corpus")
+    parser.add_argument("--dim", type=int, default=1024, help="Vector size (bge-m3: 1024)")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--qdrant-url", type=str, default="", help="Qdrant server (default: QDRANT_URL)")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,131 +1,408 @@
 from __future__ import annotations
 
 import argparse
+import os
+import threading
 import time
-import uuid
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Set
 
+import numpy as np
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams
 from tqdm import tqdm
 
-from app.chunking import chunk_sections
-from app.config import get_settings
-from app.md_loader import parse_markdown
+from app.cache import bump_collection_version
+from app.config import Settings, get_settings
+from app.content_store import ContentWriter, content_path, text_hash
+from app.embed_cache import EmbeddingCache
+from app.ingest_pipeline import IngestPipeline
+from app.lexical import build_from_collection
+from app.m3 import M3Heads, M3Output, encode_m3
+from app.m3_store import M3Writer, m3_path
+from app.manifest import Manifest, is_under
+from app.metrics import INGEST_ITEMS, INGEST_STAGE_SECONDS, write_textfile
+from app.vectorstore.base import Point, VectorStore
+from app.vectorstore.local import LocalVectorStore
+from app.vectorstore.qdrant import QdrantStore
 
 
-def ensure_collection(client, name: str, vector_size: int = 1024, recreate: bool = False) -> None:
-    existing = [c.name for c in client.get_collections().collections]
-    if name in existing and recreate:
-        client.delete_collection(name)
-    if recreate or name not in existing:
-        client.create_collection(name, VectorParams(size=vector_size, distance=Distance.COSINE))
+def encode_texts(embedder, texts: List[str], *, doc_prompt: Optional[str], batch_size: int) -> np.ndarray:
+    embeddings = None
+    # Try with selected document prompt if available; fall back gracefully
+    try:
+        if doc_prompt:
+            embeddings = embedder.encode(
+                texts,
+                normalize_embeddings=True,
+                batch_size=batch_size,
+                show_progress_bar=False,
+                prompt_name=doc_prompt,
+            )
+    except Exception:
+        embeddings = None
+    if embeddings is None:
+        embeddings = embedder.encode(
+            texts,
+            normalize_embeddings=True,
+            batch_size=batch_size,
+            show_progress_bar=False,
+        )
+    return np.asarray(embeddings, dtype=np.float32)
 
 
-def batched(iterable: List, batch_size: int):
-    for i in range(0, len(iterable), batch_size):
-        yield iterable[i : i + batch_size]
+def open_store(kind: str, cfg: Settings) -> VectorStore:
+    if kind == "local":
+        return LocalVectorStore(Path(cfg.data_dir) / "vectors", dtype=cfg.local_vector_dtype)
+    if kind != "qdrant":
+        raise ValueError(f"Unknown vector store: {kind}")
+    return QdrantStore(QdrantClient(url=cfg.qdrant_url, api_key=cfg.qdrant_api_key, timeout=60))
+
+
+def delete_stale_points(store: VectorStore, collection: str, keep_ids: Set[str], *, sources: Set[str]) -> int:
+    """Delete the points of ``sources`` that are not in ``keep_ids``."""
+    stale = [
+        h.id
+        for h in store.scroll(collection, fields=["source"])
+        if h.payload.get("source") in sources and h.id not in keep_ids
+    ]
+    store.delete(collection, stale)
+    return len(stale)
+
+
+def stored_sources(store: VectorStore, collection: str, root: Path) -> Set[str]:
+    """Sources under ``root`` that have points in the collection."""
+    found = {h.payload.get("source", "") for h in store.scroll(collection, fields=["source"])}
+    return {s for s in found if is_under(s, root)}
+
+
+class Ingestor:
+    """Runs the ingest pipeline over files; keeps the embedder loaded between runs."""
+
+    def __init__(self, store: VectorStore, collection: str, cfg: Settings, *, batch_size: int = 256,
+                 encode_batch_size: int = 16, cache: Optional[EmbeddingCache] = None,
+                 parse_workers: int = 1,
+                 upsert_batch_size: int = 128, max_inflight: int = 4,
+                 content: Optional[ContentWriter] = None, m3: Optional[M3Writer] = None,
+                 embedder: Any = None) -> None:
+        self.store = store
+        self.collection = collection
+        self.cfg = cfg
+        self.batch_size = batch_size
+        self.encode_batch_size = encode_batch_size
+        self.cache = cache
+        self.parse_workers = parse_workers
+        self.upsert_batch_size = upsert_batch_size
+        self.max_inflight = max_inflight
+        # set for slim payloads: texts go here, points keep only their hash
+        self.content = content
+        # set for ingest --m3: bge-m3's sparse weights go into the points, its ColBERT
+        # token vectors into the m3 store
+        self.m3 = m3
+        self._heads: Optional[M3Heads] = None
+        self._model_lock = threading.Lock()
+        self.total_chunks = 0
+        self.total_encoded = 0
+        self.last_report = ""
+        # a preloaded model (benchmarks pass a stand-in); else EMBEDDING_MODEL on first use
+        self._embedder = embedder
+        self._doc_prompt: Optional[str] = None
+
+    def embedder(self):
+        # Loaded on first cache miss: an unchanged re-ingest never needs the model
+        if self._embedder is None:
+            from sentence_transformers import SentenceTransformer  # local import for faster startup
+
+            self._embedder = SentenceTransformer(self.cfg.embedding_model, device=self.cfg.embedding_device)
+            # Choose best available prompt name for documents depending on model presets
+            prompts = getattr(self._embedder, "prompts", {}) or {}
+            if isinstance(prompts, dict):
+                if "document" in prompts:
+                    self._doc_prompt = "document"
+                elif "passage" in prompts:
+                    self._doc_prompt = "passage"
+        return self._embedder
+
+    def heads(self) -> M3Heads:
+        if self._heads is None:
+            self._heads = M3Heads.load(self.cfg.embedding_model, self.embedder().tokenizer)
+        return self._heads
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        # the pipeline hands over one length-sorted batch: encode it in a single forward pass
+        if self.m3 is not None:
+            return np.stack([out.dense for out in self._encode_m3(texts)])
+        model = self.embedder()
+        return encode_texts(model, texts, doc_prompt=self._doc_prompt, batch_size=len(texts))
+
+    def _encode_m3(self, texts: List[str]) -> List[M3Output]:
+        with self._model_lock:
+            outs = encode_m3(self.embedder(), self.heads(), texts, batch_size=self.encode_batch_size,
+                             prompt_name=self._doc_prompt)
+        for text, out in zip(texts, outs):
+            self.m3.put(text_hash(text), out)
+        return outs
+
+    def _with_sparse(self, points: List[Point]) -> List[Point]:
+        """Attach sparse weights from this run's encodes or the previous m3 file; chunks whose
+        dense vector came from the embedding cache but have no m3 outputs are encoded again."""
+        sparse = []
+        for p in points:
+            weights = self.m3.link(p.id, text_hash(p.payload["text"]))
+            sparse.append(weights if weights is not None else self.m3.sparse(p.id))
+        missing = [i for i, s in enumerate(sparse) if s is None]
+        if missing:
+            self._encode_m3([points[i].payload["text"] for i in missing])
+            for i in missing:
+                sparse[i] = self.m3.link(points[i].id, text_hash(points[i].payload["text"]))
+        return [Point(p.id, p.vector, p.payload, s) for p, s in zip(points, sparse)]
+
+    def _upsert(self, points: List[Point]) -> None:
+        if self.m3 is not None:
+            points = self._with_sparse(points)
+        if self.content is not None:
+            points = [Point(p.id, p.vector, self.content.slim(p.payload), p.sparse) for p in points]
+        self.store.upsert(self.collection, points)
+
+    def ingest_files(self, paths: List[Path], on_file=None) -> Dict[str, Set[str]]:
+        """Ingest ``paths`` and return the point ids of every source."""
+        pipeline = IngestPipeline(
+            encode=self._encode,
+            upsert=self._upsert,
+            model_name=self.cfg.embedding_model,
+            cache=self.cache,
+            parse_workers=self.parse_workers,
+            embed_batch_size=self.batch_size,
+            encode_batch_size=self.encode_batch_size,
+            upsert_batch_size=self.upsert_batch_size,
+            max_inflight=self.max_inflight,
+            on_file=on_file,
+        )
+        ids = pipeline.run(paths)
+        self.total_chunks += pipeline.embed.items
+        self.total_encoded += pipeline.embed.extra["encoded"]
+        self.last_report = pipeline.report()
+        return ids
+
+    def sync(self, manifest: Manifest, files: List[Path], *, root: Optional[Path] = None,
+             prune: bool = True, on_file=None) -> int:
+        """Ingest ``files``, record them in ``manifest`` and drop points of chunks that no
+        longer exist; returns how many were removed.
+
+        Only the ingested files are pruned, plus, when ``root`` says the whole tree under
+        it was scanned, sources under ``root`` that are gone. Points of other sources in
+        the collection are never touched.
+        """
+        ids = self.ingest_files(files, on_file=on_file)
+        seen_ids: Set[str] = set().union(*ids.values())
+        scanned = {f.as_posix() for f in files}
+        for file_path in files:
+            manifest.record(file_path)
+        removed = 0
+        if prune:
+            sources = scanned | (stored_sources(self.store, self.collection, root) if root is not None else set())
+            removed = delete_stale_points(self.store, self.collection, seen_ids, sources=sources)
+        if root is not None:
+            for source in [s for s in manifest.files if is_under(s, root) and s not in scanned]:
+                manifest.forget(source)
+        manifest.save()
+        return removed
+
+    def apply_changes(self, manifest: Manifest, changed: List[Path], deleted: List[str]) -> None:
+        """Re-ingest changed files and drop points of deleted ones, keeping ``manifest`` in sync."""
+        if changed:
+            ids = self.ingest_files(changed)
+            for file_path in changed:
+                source = file_path.as_posix()
+                self.store.delete_sources(self.collection, [source], keep_ids=ids.get(source, ()))
+                manifest.record(file_path)
+        if deleted:
+            self.store.delete_sources(self.collection, deleted)
+            for source in deleted:
+                manifest.forget(source)
+                print(f"Removed {source}", flush=True)
+        manifest.save()
+
+
+def publish(store: VectorStore, collection: str, *, content: Optional[ContentWriter] = None,
+            m3: Optional[M3Writer] = None) -> int:
+    """Make the collection's writes visible and rebuild the BM25 index from it; returns its size.
+
+    The content store (slim payloads) and the m3 store are rewritten first, keeping
+    only what live points still refer to.
+    """
+    store.flush(collection)
+    if content is not None:
+        t0 = time.time()
+        hits = store.scroll(collection, fields=["text_hash"])
+        live = {h.payload["text_hash"] for h in hits if "text_hash" in h.payload}
+        n_texts, size = content.save(live)
+        print(f"Content store: {n_texts} texts, {size / 2**20:.1f} MB in {time.time()-t0:.2f}s", flush=True)
+    if m3 is not None:
+        t0 = time.time()
+        n_points, n_tokens = m3.save(h.id for h in store.scroll(collection, fields=["source"]))
+        print(f"m3 store: {n_points} points, {n_tokens} token vectors in {time.time()-t0:.2f}s", flush=True)
+    t0 = time.time()
+    n = len(build_from_collection(store, collection))
+    INGEST_STAGE_SECONDS.labels("lexical_index").observe(time.time() - t0)
+    INGEST_ITEMS.labels("lexical_index").inc(n)
+    print(f"Lexical index: {n} chunks in {time.time()-t0:.2f}s", flush=True)
+    return n
+
+
+def list_files(docs_path: Path) -> List[Path]:
+    if docs_path.is_file():
+        return [docs_path]
+    return sorted(docs_path.rglob("*.md"))
+
+
+def iter_changes(docs_path: Path, interval: float) -> Iterator[None]:
+    """Yield whenever something under ``docs_path`` may have changed.
+
+    Uses inotify/FSEvents through ``watchfiles`` when installed, else polls every
+    ``interval`` seconds; callers re-check the manifest either way.
+    """
+    try:
+        from watchfiles import watch
+    except ImportError:
+        while True:
+            time.sleep(interval)
+            yield
+    # a periodic timeout wake-up also catches anything the watcher may have missed
+    for _ in watch(docs_path, debounce=int(interval * 1000), rust_timeout=60_000, yield_on_timeout=True):
+        yield
 
 
 def main() -> None:
-    parser = argparse.ArgumentParser(description="Ingest Markdown docs into Qdrant")
+    parser = argparse.ArgumentParser(description="Ingest Markdown docs into the vector store")
     parser.add_argument("--docs", type=str, required=True, help="Path to docs folder or single file")
-    parser.add_argument("--only", type=str, default="", help="Ingest only this file (overrides --docs directory scan)")
-    parser.add_argument("--collection", type=str, default="api_docs", help="Qdrant collection name")
+    parser.add_argument("--only", type=str, default="", help="Ingest only this file (overrides --docs directory scan, also with --incremental/--watch)")
+    parser.add_argument("--collection", type=str, default="api_docs", help="Collection name")
+    parser.add_argument("--store", choices=["qdrant", "local"], default=None, help="Vector store (default: VECTOR_STORE)")
     parser.add_argument("--recreate", action="store_true", help="Drop and recreate collection")
-    parser.add_argument("--batch-size", type=int, default=16, help="Embedding/upsert batch size")
+    parser.add_argument("--m3", action=argparse.BooleanOptionalAction, default=None,
+                        help="Also store bge-m3 sparse and ColBERT vectors (default: on if RETRIEVAL_MODE=m3)")
+    parser.add_argument("--slim-payloads", action=argparse.BooleanOptionalAction, default=None,
+                        help="Keep chunk texts in the local content store, not in the points (default: SLIM_PAYLOADS)")
+    parser.add_argument("--batch-size", type=int, default=256, help="Chunks gathered across files and length-sorted before encoding")
+    parser.add_argument("--encode-batch-size", type=int, default=16, help="Chunks per embedding forward pass")
+    parser.add_argument("--upsert-batch-size", type=int, default=128, help="Points per upsert request")
+    parser.add_argument("--parse-workers", type=int, default=max(1, (os.cpu_count() or 2) // 2), help="Processes for parsing/chunking")
+    parser.add_argument("--max-inflight", type=int, default=4, help="Max concurrent upsert requests")
     parser.add_argument("--max-files", type=int, default=0, help="Limit number of files for ingestion (0 = no limit)")
+    parser.add_argument("--embed-cache", type=str, default="", help="Embedding cache path (default: <DATA_DIR>/embed_cache.sqlite3)")
+    parser.add_argument("--no-embed-cache", action="store_true", help="Always re-encode chunks")
+    parser.add_argument("--incremental", action="store_true", help="Only process files changed since the last run (per manifest)")
+    parser.add_argument("--watch", action="store_true", help="Keep running and apply edits under --docs as they happen")
+    parser.add_argument("--watch-interval", type=float, default=1.0, help="Watch debounce/poll interval in seconds")
+    parser.add_argument("--metrics-file", type=str, default="", help="Write per-stage ingest metrics here after each run (Prometheus textfile format)")
     args = parser.parse_args()
+    if args.max_files and (args.incremental or args.watch):
+        parser.error("--max-files cannot be combined with --incremental/--watch")
 
     docs_path = Path(args.docs)
     assert docs_path.exists(), f"Docs path not found: {docs_path}"
+    # what --incremental / --watch compare against the manifest
+    scan_root = Path(args.only) if args.only else docs_path
 
     cfg = get_settings()
-    client = QdrantClient(url=cfg.qdrant_url, api_key=cfg.qdrant_api_key, timeout=60)
-    ensure_collection(client, args.collection, vector_size=1024, recreate=args.recreate)
-
-    from sentence_transformers import SentenceTransformer  # local import for faster startup
-
-    embedder = SentenceTransformer(cfg.embedding_model, device=cfg.embedding_device)
-    # Choose best available prompt name for documents depending on model presets
-    prompts = getattr(embedder, "prompts", {}) or {}
-    doc_prompt = None
-    if isinstance(prompts, dict):
-        if "document" in prompts:
-            doc_prompt = "document"
-        elif "passage" in prompts:
-            doc_prompt = "passage"
-
-    if args.only:
-        file_list = [Path(args.only)]
+    store = open_store(args.store or cfg.vector_store, cfg)
+    store.ensure_collection(args.collection, 1024, recreate=args.recreate)
+
+    cache: Optional[EmbeddingCache] = None
+    if not args.no_embed_cache:
+        cache = EmbeddingCache(args.embed_cache or str(Path(cfg.data_dir) / "embed_cache.sqlite3"))
+    slim = cfg.slim_payloads if args.slim_payloads is None else args.slim_payloads
+    content = ContentWriter(content_path(args.collection), fresh=args.recreate) if slim else None
+    use_m3 = cfg.retrieval_mode == "m3" if args.m3 is None else args.m3
+    m3 = M3Writer(m3_path(args.collection), fresh=args.recreate) if use_m3 else None
+    ingestor = Ingestor(
+        store,
+        args.collection,
+        cfg,
+        batch_size=args.batch_size,
+        encode_batch_size=args.encode_batch_size,
+        cache=cache,
+        parse_workers=args.parse_workers,
+        upsert_batch_size=args.upsert_batch_size,
+        max_inflight=args.max_inflight,
+        content=content,
+        m3=m3,
+    )
+    manifest = Manifest(Path(cfg.data_dir) / "manifests" / f"{args.collection}.json")
+    if args.recreate:
+        manifest.clear()
+
+    t_start = time.time()
+    if args.incremental or args.watch:
+        changed, deleted = manifest.diff(list_files(scan_root), root=scan_root)
+        print(f"{len(changed)} changed, {len(deleted)} deleted file(s)", flush=True)
+        ingestor.apply_changes(manifest, changed, deleted)
     else:
-        if docs_path.is_file():
-            file_list = [docs_path]
+        # a complete scan of --docs may also drop what was deleted under it
+        root: Optional[Path] = None
+        if args.only:
+            file_list = [Path(args.only)]
         else:
-            file_list = sorted(docs_path.rglob("*.md"))
+            file_list = list_files(docs_path)
             if args.max_files and args.max_files > 0:
                 file_list = file_list[: args.max_files]
+            else:
+                root = docs_path
+
+        use_progress = len(file_list) > 1 and not args.only
+        pbar = tqdm(total=len(file_list), desc="Files", unit="file") if use_progress else None
 
-    use_progress = len(file_list) > 1 and not args.only
-    pbar = tqdm(total=len(file_list), desc="Files", unit="file") if use_progress else None
-    total_chunks = 0
-
-    for file_path in file_list:
-        start_file = time.time()
-        sections, _fm = parse_markdown(file_path)
-        chunks = chunk_sections(sections)
-        texts = [c[0] for c in chunks]
-        metas = [c[1] for c in chunks]
-        print(f"{file_path.name}: {len(chunks)} chunks", flush=True)
-        if not texts:
+        def on_file(source: str, n_chunks: int) -> None:
             if pbar:
                 pbar.update(1)
-            continue
-
-        for text_batch, meta_batch in zip(batched(texts, args.batch_size), batched(metas, args.batch_size)):
-            t0 = time.time()
-            embeddings = None
-            # Try with selected document prompt if available; fall back gracefully
-            try:
-                if doc_prompt:
-                    embeddings = embedder.encode(
-                        text_batch,
-                        normalize_embeddings=True,
-                        batch_size=min(args.batch_size, 8),
-                        show_progress_bar=False,
-                        prompt_name=doc_prompt,
-                    )
-            except Exception:
-                embeddings = None
-            if embeddings is None:
-                embeddings = embedder.encode(
-                    text_batch,
-                    normalize_embeddings=True,
-                    batch_size=min(args.batch_size, 8),
-                    show_progress_bar=False,
-                )
-            t1 = time.time()
-            points = []
-            for vec, text, meta in zip(embeddings, text_batch, meta_batch):
-                payload = {"text": text, **meta}
-                points.append({
-                    "id": str(uuid.uuid4()),
-                    "vector": vec.tolist(),
-                    "payload": payload,
-                })
-            client.upsert(collection_name=args.collection, points=points)
-            t2 = time.time()
-            total_chunks += len(points)
-            print(f"{file_path.name}: batch {len(points)} emb {t1-t0:.2f}s upsert {t2-t1:.2f}s", flush=True)
+            else:
+                print(f"{source}: {n_chunks} chunks", flush=True)
+
+        removed = ingestor.sync(manifest, file_list, root=root, prune=not args.recreate, on_file=on_file)
         if pbar:
-            pbar.update(1)
-        print(f"Done {file_path.name} in {time.time()-start_file:.2f}s (total {total_chunks})", flush=True)
+            pbar.close()
+        if not args.recreate:
+            print(f"Removed {removed} stale point(s)", flush=True)
 
-    if pbar:
-        pbar.close()
-    print(f"Ingested {total_chunks} chunks into collection '{args.collection}'.")
+    publish(store, args.collection, content=content, m3=m3)
+    # invalidate cached /search and /answer results computed against the old data
+    version = bump_collection_version(args.collection)
+    if ingestor.last_report:
+        print(ingestor.last_report, flush=True)
+    print(
+        f"Ingested {ingestor.total_chunks} chunks ({ingestor.total_encoded} encoded) "
+        f"into collection '{args.collection}' (version {version}) in {time.time()-t_start:.1f}s."
+    )
+    if args.metrics_file:
+        write_textfile(args.metrics_file)
+
+    if args.watch:
+        print(f"Watching {scan_root} for changes...", flush=True)
+        try:
+            for _ in iter_changes(scan_root, args.watch_interval):
+                changed, deleted = manifest.diff(list_files(scan_root), root=scan_root)
+                if not changed and not deleted:
+                    continue
+                t0 = time.time()
+                ingestor.apply_changes(manifest, changed, deleted)
+                publish(store, args.collection, content=content, m3=m3)
+                version = bump_collection_version(args.collection)
+                print(
+                    f"Applied {len(changed)} changed, {len(deleted)} deleted file(s) "
+                    f"in {time.time()-t0:.2f}s (version {version})",
+                    flush=True,
+                )
+                if changed:
+                    print(ingestor.last_report, flush=True)
+                if args.metrics_file:
+                    write_textfile(args.metrics_file)
+        except KeyboardInterrupt:
+            pass
+    if cache:
+        cache.close()
+    if m3:
+        m3.close()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
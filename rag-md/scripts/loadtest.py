@@ -0,0 +1,393 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+import numpy as np
+
+# Load generator for the HTTP API. Each step runs one load level for --duration:
+# closed loop (N clients, each sending its next request when the last one is
+# done) or open loop (Poisson arrivals at a fixed rate, independent of how fast
+# the server answers; latency counts from the scheduled arrival, so a backlog
+# is not hidden). /metrics is scraped around every step for the server's
+# event-loop lag and per-stage times.
+
+ENDPOINTS = ("search", "answer", "answer_stream", "answer_async")
+_SAMPLE_RE = re.compile(r"^([a-zA-Z_:][\w:]*)(?:\{(.*)\})?\s+(\S+)$")
+_LABEL_RE = re.compile(r'(\w+)="([^"]*)"')
+
+
+@dataclass
+class Sample:
+    latency_s: float
+    error: Optional[str] = None
+    ttft_s: Optional[float] = None  # answer_stream: first token event
+
+
+def load_queries(path: Path) -> List[str]:
+    """Questions from a benchmark dataset (``.json`` with ``questions``) or a JSONL file."""
+    text = path.read_text(encoding="utf-8")
+    if path.suffix == ".json":
+        return [q["question"] for q in json.loads(text)["questions"]]
+    return [json.loads(line)["question"] for line in text.splitlines() if line.strip()]
+
+
+class Requests:
+    """One request of ``endpoint`` per :meth:`send`; queries are taken round robin."""
+
+    def __init__(self, client: httpx.AsyncClient, endpoint: str, queries: Sequence[str], *,
+                 body: Optional[Dict[str, Any]] = None, cache_bust: bool = True,
+                 poll_interval_s: float = 0.2) -> None:
+        if endpoint not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint: {endpoint}")
+        self.client = client
+        self.endpoint = endpoint
+        self.queries = list(queries)
+        self.body = body or {}
+        self.cache_bust = cache_bust
+        self.poll_interval_s = poll_interval_s
+        self._n = 0
+
+    def _next_body(self) -> Dict[str, Any]:
+        query = self.queries[self._n % len(self.queries)]
+        if self.cache_bust:
+            # a distinct query per request: the result caches would otherwise answer repeats
+            query = f"{query} {self._n}"
+        self._n += 1
+        return {**self.body, "query": query}
+
+    async def send(self, started: float) -> Sample:
+        """Run one request; latency counts from ``started`` (loop time)."""
+        loop = asyncio.get_running_loop()
+        body = self._next_body()
+        ttft = None
+        try:
+            if self.endpoint == "answer_stream":
+                ttft, error = await self._stream(body, started)
+            elif self.endpoint == "answer_async":
+                error = await self._job(body)
+            else:
+                r = await self.client.post(f"/{self.endpoint}", json=body)
+                error = None if r.status_code == 200 else f"http {r.status_code}"
+        except httpx.TimeoutException:
+            error = "timeout"
+        except httpx.HTTPError as e:
+            error = type(e).__name__
+        return Sample(loop.time() - started, error, ttft)
+
+    async def _stream(self, body: Dict[str, Any], started: float) -> Tuple[Optional[float], Optional[str]]:
+        ttft, event = None, ""
+        async with self.client.stream("POST", "/answer/stream", json=body) as r:
+            if r.status_code != 200:
+                return None, f"http {r.status_code}"
+            async for line in r.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                    if event == "token" and ttft is None:
+                        ttft = asyncio.get_running_loop().time() - started
+                    elif event == "error":
+                        return ttft, "stream error"
+        return ttft, None if event == "done" else "stream cut"
+
+    async def _job(self, body: Dict[str, Any]) -> Optional[str]:
+        r = await self.client.post("/answer_async/start", json=body)
+        if r.status_code != 200:
+            return f"http {r.status_code}"
+        job_id = r.json()["job_id"]
+        while True:
+            await asyncio.sleep(self.poll_interval_s)
+            r = await self.client.get(f"/answer_async/status/{job_id}")
+            if r.status_code != 200:
+                return f"http {r.status_code}"
+            status = r.json()["status"]
+            if status == "done":
+                return None
+            if status == "error":
+                return "job error"
+
+
+async def closed_loop(requests: Requests, concurrency: int, duration_s: float) -> List[Sample]:
+    loop = asyncio.get_running_loop()
+    end = loop.time() + duration_s
+    samples: List[Sample] = []
+
+    async def client() -> None:
+        while loop.time() < end:
+            samples.append(await requests.send(loop.time()))
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return samples
+
+
+async def open_loop(requests: Requests, rate: float, duration_s: float, *, seed: int = 0) -> List[Sample]:
+    loop = asyncio.get_running_loop()
+    rnd = random.Random(seed)
+    at, end = loop.time(), loop.time() + duration_s
+    tasks = []
+    while True:
+        at += rnd.expovariate(rate)
+        if at >= end:
+            break
+        await asyncio.sleep(max(0.0, at - loop.time()))
+        tasks.append(asyncio.create_task(requests.send(at)))
+    return list(await asyncio.gather(*tasks))
+
+
+class LagProbe:
+    """The load generator's own event-loop lag: if it is high, the client is the bottleneck."""
+
+    def __init__(self, interval_s: float = 0.05) -> None:
+        self.interval_s = interval_s
+        self.lags: List[float] = []
+        self._task: Optional[asyncio.Task[None]] = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            t0 = loop.time()
+            await asyncio.sleep(self.interval_s)
+            self.lags.append(max(0.0, loop.time() - t0 - self.interval_s))
+
+    def __enter__(self) -> "LagProbe":
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        assert self._task is not None
+        self._task.cancel()
+
+
+Histograms = Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Dict[str, Any]]
+
+
+def parse_histograms(text: str) -> Histograms:
+    """``(name, labels without le) -> {"buckets": [(le, cumulative count)], "sum", "count"}`` of a /metrics page."""
+    out: Histograms = {}
+    for line in text.splitlines():
+        m = _SAMPLE_RE.match(line)
+        if not m or line.startswith("#"):
+            continue
+        name, raw_labels, value = m.groups()
+        labels = dict(_LABEL_RE.findall(raw_labels or ""))
+        for suffix in ("_bucket", "_sum", "_count"):
+            if name.endswith(suffix):
+                le = labels.pop("le", None)
+                h = out.setdefault((name[: -len(suffix)], tuple(sorted(labels.items()))),
+                                   {"buckets": [], "sum": 0.0, "count": 0.0})
+                if suffix == "_bucket":
+                    h["buckets"].append((float(le) if le != "+Inf" else float("inf"), float(value)))
+                else:
+                    h[suffix[1:]] = float(value)
+    return out
+
+
+def histogram_delta(after: Dict[str, Any], before: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if before is None:
+        return after
+    prev = dict(before["buckets"])
+    return {"buckets": [(le, n - prev.get(le, 0.0)) for le, n in after["buckets"]],
+            "sum": after["sum"] - before["sum"], "count": after["count"] - before["count"]}
+
+
+def histogram_quantile(q: float, h: Dict[str, Any]) -> Optional[float]:
+    """Linear interpolation within the bucket holding the q-quantile (as Prometheus does)."""
+    if not h["count"]:
+        return None
+    rank, lower, below = q * h["count"], 0.0, 0.0
+    for le, cum in h["buckets"]:
+        if cum >= rank:
+            if le == float("inf"):
+                return lower
+            return lower + (le - lower) * ((rank - below) / (cum - below) if cum > below else 0.0)
+        lower, below = le, cum
+    return lower
+
+
+async def scrape(client: httpx.AsyncClient) -> Optional[Histograms]:
+    try:
+        r = await client.get("/metrics")
+    except httpx.HTTPError:
+        return None
+    return parse_histograms(r.text) if r.status_code == 200 else None
+
+
+def server_summary(before: Optional[Histograms], after: Optional[Histograms]) -> Dict[str, Any]:
+    """Event-loop lag percentiles and mean time per pipeline stage (ms) between two scrapes."""
+    if before is None or after is None:
+        return {}
+    out: Dict[str, Any] = {}
+    lag = after.get(("rag_event_loop_lag_seconds", ()))
+    if lag is not None:
+        d = histogram_delta(lag, before.get(("rag_event_loop_lag_seconds", ())))
+        if d["count"]:
+            out["loop_lag_ms"] = {"mean": round(d["sum"] / d["count"] * 1000, 2),
+                                  **{f"p{int(q * 100)}": round(histogram_quantile(q, d) * 1000, 2)  # type: ignore[operator]
+                                     for q in (0.5, 0.99)}}
+    stages = {}
+    for (name, labels), h in after.items():
+        if name == "rag_stage_seconds":
+            d = histogram_delta(h, before.get((name, labels)))
+            if d["count"]:
+                stages[dict(labels)["stage"]] = round(d["sum"] / d["count"] * 1000, 2)
+    if stages:
+        out["stages_ms"] = stages
+    return out
+
+
+def latency_summary(values: Sequence[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ms = np.asarray(values, dtype=np.float64) * 1000
+    p50, p90, p99 = np.percentile(ms, (50, 90, 99))
+    return {"p50": round(float(p50), 1), "p90": round(float(p90), 1), "p99": round(float(p99), 1),
+            "max": round(float(ms.max()), 1), "mean": round(float(ms.mean()), 1)}
+
+
+def step_report(samples: Sequence[Sample], elapsed_s: float) -> Dict[str, Any]:
+    ok = [s for s in samples if s.error is None]
+    errors: Dict[str, int] = {}
+    for s in samples:
+        if s.error is not None:
+            errors[s.error] = errors.get(s.error, 0) + 1
+    out: Dict[str, Any] = {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(len(samples) and (len(samples) - len(ok)) / len(samples), 4),
+        "throughput_rps": round(len(ok) / elapsed_s, 2) if elapsed_s > 0 else 0.0,
+        "latency_ms": latency_summary([s.latency_s for s in ok]),
+    }
+    ttft = [s.ttft_s for s in ok if s.ttft_s is not None]
+    if ttft:
+        out["ttft_ms"] = latency_summary(ttft)
+    return out
+
+
+async def run_step(client: httpx.AsyncClient, requests: Requests, *, concurrency: Optional[int] = None,
+                   rate: Optional[float] = None, duration_s: float, seed: int = 0) -> Dict[str, Any]:
+    """One load level: ``concurrency`` closed-loop clients or Poisson arrivals at ``rate``/s."""
+    before = await scrape(client)
+    loop = asyncio.get_running_loop()
+    with LagProbe() as probe:
+        t0 = loop.time()
+        if rate is not None:
+            samples = await open_loop(requests, rate, duration_s, seed=seed)
+        else:
+            samples = await closed_loop(requests, concurrency or 1, duration_s)
+        elapsed = loop.time() - t0
+    after = await scrape(client)
+    load = {"rate_rps": rate} if rate is not None else {"concurrency": concurrency}
+    out = {**load, "elapsed_s": round(elapsed, 2), **step_report(samples, elapsed)}
+    server = server_summary(before, after)
+    if server:
+        out["server"] = server
+    out["client_loop_lag_ms"] = latency_summary(probe.lags)
+    return out
+
+
+def find_saturation(steps: Sequence[Dict[str, Any]], *, slo_ms: Optional[float] = None,
+                    max_error_rate: float = 0.01, min_gain: float = 0.05) -> Optional[Dict[str, Any]]:
+    """The first step past the knee: too many errors, p99 over the SLO, an open-loop step that no
+    longer keeps up with its arrival rate, or more clients that add less than ``min_gain`` throughput."""
+    for i, s in enumerate(steps):
+        reason = None
+        p99 = s["latency_ms"].get("p99")
+        if s["error_rate"] > max_error_rate:
+            reason = f"error rate {s['error_rate']:.1%}"
+        elif slo_ms is not None and p99 is not None and p99 > slo_ms:
+            reason = f"p99 {p99:.0f} ms > SLO {slo_ms:.0f} ms"
+        elif s.get("rate_rps") and s["throughput_rps"] < 0.9 * s["rate_rps"]:
+            reason = f"{s['throughput_rps']} rps served of {s['rate_rps']} offered"
+        elif i and "concurrency" in s and s["throughput_rps"] < steps[i - 1]["throughput_rps"] * (1 + min_gain):
+            reason = f"throughput {s['throughput_rps']} rps, was {steps[i - 1]['throughput_rps']} rps"
+        if reason is not None:
+            return {"step": i, "reason": reason, "last_good": steps[i - 1] if i else None}
+    return None
+
+
+def print_step(endpoint: str, s: Dict[str, Any], file: Any = None) -> None:
+    load = f"rate {s['rate_rps']}/s" if "rate_rps" in s else f"conc {s['concurrency']}"
+    lat = s["latency_ms"]
+    line = (f"{endpoint:<13} {load:<11} {s['throughput_rps']:7.2f} rps  p50 {lat.get('p50', 0):8.1f}  "
+            f"p90 {lat.get('p90', 0):8.1f}  p99 {lat.get('p99', 0):8.1f} ms  err {s['error_rate']:6.1%}")
+    if "ttft_ms" in s:
+        line += f"  ttft p50 {s['ttft_ms']['p50']:.0f} ms"
+    lag = s.get("server", {}).get("loop_lag_ms")
+    if lag:
+        line += f"  loop lag p99 {lag['p99']:.1f} ms"
+    print(line, file=file, flush=True)
+
+
+async def run(args: argparse.Namespace, client: httpx.AsyncClient) -> Dict[str, Any]:
+    queries = load_queries(Path(args.queries))
+    body = json.loads(args.body) if args.body else {}
+    requests = Requests(client, args.endpoint, queries, body=body, cache_bust=args.cache_bust,
+                        poll_interval_s=args.poll_interval)
+    if args.warmup > 0:
+        await closed_loop(requests, 1, args.warmup)
+    levels: List[Tuple[Optional[int], Optional[float]]]
+    if args.rate:
+        levels = [(None, float(r)) for r in args.rate.split(",")]
+    else:
+        levels = [(int(c), None) for c in args.concurrency.split(",")]
+    steps = []
+    out = sys.stdout if args.output else sys.stderr
+    for i, (concurrency, rate) in enumerate(levels):
+        step = await run_step(client, requests, concurrency=concurrency, rate=rate, duration_s=args.duration,
+                              seed=args.seed + i)
+        print_step(args.endpoint, step, file=out)
+        steps.append(step)
+    saturation = find_saturation(steps, slo_ms=args.slo_ms, max_error_rate=args.max_error_rate)
+    if saturation is None:
+        print("no saturation within the tested load", file=out)
+    else:
+        good = saturation["last_good"]
+        print(f"saturated at step {saturation['step'] + 1}: {saturation['reason']}"
+              + (f"; last good: {good['throughput_rps']} rps" if good else ""), file=out)
+    return {"endpoint": args.endpoint, "base_url": args.url, "duration_s": args.duration, "body": body,
+            "steps": steps, "saturation": saturation}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test /search, /answer, /answer/stream or /answer_async")
+    parser.add_argument("--url", type=str, default="http://127.0.0.1:8000", help="API base URL")
+    parser.add_argument("--endpoint", choices=ENDPOINTS, default="search")
+    parser.add_argument("--queries", type=str, default="bench/retrieval_v1.json",
+                        help="Benchmark dataset (.json) or JSONL with a 'question' per line")
+    parser.add_argument("--body", type=str, default="", help='Extra request fields as JSON, e.g. \'{"with_rerank": false}\'')
+    parser.add_argument("--concurrency", type=str, default="1,2,4,8,16", help="Closed-loop client counts to sweep")
+    parser.add_argument("--rate", type=str, default="", help="Open-loop Poisson arrival rates (req/s) to sweep instead")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per step")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Seconds of single-client load before the first step")
+    parser.add_argument("--timeout", type=float, default=300.0, help="Per-request timeout, seconds")
+    parser.add_argument("--poll-interval", type=float, default=0.2, help="answer_async status polling, seconds")
+    parser.add_argument("--cache-bust", action=argparse.BooleanOptionalAction, default=True,
+                        help="Make every query distinct so result caches do not answer")
+    parser.add_argument("--slo-ms", type=float, default=None, help="p99 latency above this marks saturation")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=str, default="", help="Write the JSON report here (default: stdout)")
+    args = parser.parse_args()
+
+    async def go() -> Dict[str, Any]:
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=256)
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+            return await run(args, client)
+
+    report = asyncio.run(go())
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Stand-in for a llama.cpp ``server`` when load-testing the API: the same routes
+# (/completion, /v1/chat/completions, /props, /health), requests queue for one
+# of --slots slots, and tokens arrive with llama.cpp-like timing: prompt
+# evaluation before the first token, then a steady per-slot decode rate that
+# drops as more slots decode together. The text is a fixed filler.
+
+_WORDS = ("Для", "этого", "отправьте", "запрос", "к", "эндпоинту", "с", "нужными", "полями,", "как", "показано",
+          "в", "примере", "из", "документации.")
+
+
+@dataclass
+class StubTiming:
+    slots: int = 2
+    # time to first token: fixed overhead plus prompt evaluation at prompt_tps (0: prompt size ignored)
+    ttft_ms: float = 200.0
+    prompt_tps: float = 0.0
+    # decode speed of one slot alone; each further busy slot slows every slot by batch_penalty
+    tps: float = 20.0
+    batch_penalty: float = 0.0
+    tokens: int = 200  # generated per request, capped by max_tokens / n_predict
+    jitter: float = 0.1  # relative spread of the delays
+    error_rate: float = 0.0  # share of requests answered with HTTP 500
+
+
+def _prompt_tokens(text: str) -> int:
+    return max(1, len(text) // 4)  # ~4 characters per token
+
+
+def create_app(timing: StubTiming, *, seed: Optional[int] = None) -> FastAPI:
+    app = FastAPI(title="llama.cpp stub")
+    rnd = random.Random(seed)
+    slots = asyncio.Semaphore(timing.slots)
+    state = {"busy": 0, "waiting": 0, "requests": 0, "errors": 0, "tokens": 0}
+
+    def spread(seconds: float) -> float:
+        return max(0.0, seconds * (1.0 + rnd.uniform(-timing.jitter, timing.jitter)))
+
+    async def generate(prompt: str, n_tokens: int) -> AsyncIterator[str]:
+        state["waiting"] += 1
+        try:
+            await slots.acquire()
+        finally:
+            state["waiting"] -= 1
+        state["busy"] += 1
+        try:
+            prefill = timing.ttft_ms / 1000.0
+            if timing.prompt_tps > 0:
+                prefill += _prompt_tokens(prompt) / timing.prompt_tps
+            await asyncio.sleep(spread(prefill))
+            for i in range(n_tokens):
+                if i:
+                    step = (1.0 + timing.batch_penalty * (state["busy"] - 1)) / timing.tps
+                    await asyncio.sleep(spread(step))
+                state["tokens"] += 1
+                yield (" " if i else "") + _WORDS[i % len(_WORDS)]
+        finally:
+            state["busy"] -= 1
+            slots.release()
+
+    def accept() -> Optional[JSONResponse]:
+        state["requests"] += 1
+        if timing.error_rate and rnd.random() < timing.error_rate:
+            state["errors"] += 1
+            return JSONResponse({"error": {"code": 500, "message": "stub failure"}}, status_code=500)
+        return None
+
+    def n_tokens(max_tokens: Optional[int]) -> int:
+        return min(timing.tokens, max_tokens) if max_tokens and max_tokens > 0 else timing.tokens
+
+    def sse(payload: Any) -> str:
+        return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    @app.get("/health")
+    async def health() -> Dict[str, Any]:
+        return {"status": "ok", "slots_idle": timing.slots - state["busy"], "slots_processing": state["busy"]}
+
+    @app.get("/props")
+    async def props() -> Dict[str, Any]:
+        return {"total_slots": timing.slots, "default_generation_settings": {"n_predict": timing.tokens}}
+
+    @app.get("/v1/models")
+    async def models() -> Dict[str, Any]:
+        return {"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "llamacpp"}]}
+
+    @app.get("/stats")
+    async def stats() -> Dict[str, Any]:
+        return dict(state)
+
+    @app.post("/completion")
+    async def completion(request: Request) -> Any:
+        body = await request.json()
+        failed = accept()
+        if failed is not None:
+            return failed
+        prompt, n = str(body.get("prompt", "")), n_tokens(body.get("n_predict"))
+        if body.get("stream"):
+            async def events() -> AsyncIterator[str]:
+                async for piece in generate(prompt, n):
+                    yield sse({"content": piece, "stop": False})
+                yield sse({"content": "", "stop": True, "tokens_predicted": n})
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+        t0 = time.perf_counter()
+        parts = [piece async for piece in generate(prompt, n)]
+        return {"content": "".join(parts), "stop": True, "tokens_predicted": n,
+                "timings": {"total_ms": (time.perf_counter() - t0) * 1000}}
+
+    @app.post("/v1/chat/completions")
+    async def chat(request: Request) -> Any:
+        body = await request.json()
+        failed = accept()
+        if failed is not None:
+            return failed
+        messages: List[Dict[str, Any]] = body.get("messages") or []
+        prompt = "\n".join(str(m.get("content", "")) for m in messages)
+        n = n_tokens(body.get("max_tokens"))
+        if body.get("stream"):
+            async def events() -> AsyncIterator[str]:
+                async for piece in generate(prompt, n):
+                    yield sse({"object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": piece}}]})
+                yield sse({"object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+        parts = [piece async for piece in generate(prompt, n)]
+        return {
+            "object": "chat.completion",
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(parts)},
+                         "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": _prompt_tokens(prompt), "completion_tokens": n},
+        }
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Stub llama.cpp server with configurable token timing")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--slots", type=int, default=2, help="Parallel sequences, as llama-server --parallel")
+    parser.add_argument("--ttft-ms", type=float, default=200.0, help="Fixed time to first token")
+    parser.add_argument("--prompt-tps", type=float, default=0.0, help="Prompt eval speed, tokens/s (0: ignore prompt size)")
+    parser.add_argument("--tps", type=float, default=20.0, help="Decode speed of one slot, tokens/s")
+    parser.add_argument("--batch-penalty", type=float, default=0.0,
+                        help="Per extra busy slot, relative slowdown of every slot's decode")
+    parser.add_argument("--tokens", type=int, default=200, help="Tokens generated per request")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    timing = StubTiming(slots=args.slots, ttft_ms=args.ttft_ms, prompt_tps=args.prompt_tps, tps=args.tps,
+                        batch_penalty=args.batch_penalty, tokens=args.tokens, jitter=args.jitter,
+                        error_rate=args.error_rate)
+    uvicorn.run(create_app(timing, seed=args.seed), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,10 @@
 from __future__ import annotations
 
 import asyncio
+import json
 from typing import Any, Dict, List
 
+import httpx
 import pytest
 
 from app.main import post_answer
@@ -18,11 +20,131 @@ class DummyLLM:
 async def test_answer_no_context(monkeypatch: pytest.MonkeyPatch) -> None:
     from app import main as main_mod
 
+    async def _empty_search(**kwargs: Any) -> List[Dict[str, Any]]:
+        return []
+
     # Monkeypatch search to return empty
-    monkeypatch.setattr(main_mod, "search", lambda **kwargs: [])
+    monkeypatch.setattr(main_mod, "asearch", _empty_search)
     # Monkeypatch get_llm
     monkeypatch.setattr(main_mod, "get_llm", lambda: DummyLLM())
 
     req = AnswerRequest(query="What is X?", with_rerank=True)
     resp = await post_answer(req)
-    assert "Недостаточно" in resp.answer 
\ No newline at end of file
+    assert "Недостаточно" in resp.answer 
+
+
+class StreamingLLM:
+    async def astream(self, messages: List[Dict[str, Any]], **kwargs: Any):
+        for piece in ["Ответ", ": ", "```json\n{\"a\": ", "1,}\n```"]:
+            yield piece
+
+
+def _events(body: str) -> List[tuple]:
+    out = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        out.append((lines["event"], json.loads(lines["data"])))
+    return out
+
+
+@pytest.mark.asyncio
+async def test_answer_stream_emits_citations_then_tokens(monkeypatch: pytest.MonkeyPatch) -> None:
+    from app import main as main_mod
+
+    async def _search(**kwargs: Any) -> List[Dict[str, Any]]:
+        return [{"text": "слово " * 80, "score": 0.9, "source": "docs/a.md", "title": "A", "anchor": "#a"}]
+
+    monkeypatch.setattr(main_mod, "asearch", _search)
+    monkeypatch.setattr(main_mod, "get_llm", lambda: StreamingLLM())
+    main_mod.get_query_cache().clear()
+
+    transport = httpx.ASGITransport(app=main_mod.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        r = await client.post("/answer/stream", json={"query": "stream me", "with_rerank": False})
+    assert r.headers["content-type"].startswith("text/event-stream")
+    events = _events(r.text)
+    assert events[0] == ("citations", {"citations": [{"title": "A", "source": "docs/a.md", "anchor": "#a"}], "related": []})
+    tokens = [d["text"] for e, d in events if e == "token"]
+    assert tokens[0] == "Ответ"
+    assert "невалидный JSON" in tokens[-1]  # trailing comma in the fence
+    assert events[-1][0] == "done" and events[-1][1]["meta"]["ttft_ms"] is not None
+
+    # the streamed answer is cached for /answer
+    cached = await post_answer(AnswerRequest(query="stream me", with_rerank=False))
+    assert cached.answer == "".join(tokens).strip()
+    assert cached.meta["cache"]["hit"] is True
+
+
+@pytest.mark.asyncio
+async def test_semantic_cache_answers_paraphrase_without_retrieval(monkeypatch: pytest.MonkeyPatch) -> None:
+    from app import main as main_mod
+
+    searches: List[str] = []
+    vectors = {"как получить список заказов": [1.0, 0.0], "list customer orders": [0.96, 0.28],
+               "удалить товар": [0.0, 1.0]}
+
+    async def _search(**kwargs: Any) -> List[Dict[str, Any]]:
+        searches.append(kwargs["query"])
+        assert kwargs["query_vector"] == vectors[kwargs["query"]]  # embedded once, reused
+        return [{"text": "слово " * 80, "score": 0.9, "source": "docs/a.md", "title": "A", "anchor": "#a"}]
+
+    async def _embed(query: str) -> List[float]:
+        return vectors[query]
+
+    monkeypatch.setattr(main_mod, "asearch", _search)
+    monkeypatch.setattr(main_mod, "aembed_query", _embed)
+    monkeypatch.setattr(main_mod, "get_llm", lambda: DummyLLM())
+    monkeypatch.setattr(main_mod.get_settings(), "semantic_cache_enabled", True)
+    main_mod.get_query_cache().clear()
+    main_mod.get_semantic_cache().clear()
+
+    first = await post_answer(AnswerRequest(query="как получить список заказов", with_rerank=False))
+    para = await post_answer(AnswerRequest(query="list customer orders", with_rerank=False))
+    other = await post_answer(AnswerRequest(query="удалить товар", with_rerank=False))
+    assert searches == ["как получить список заказов", "удалить товар"]
+    assert para.answer == first.answer and para.meta["cache"]["tier"] == "semantic"
+    assert para.meta["similarity"] >= 0.92
+    assert other.meta["cache"]["hit"] is False
+    assert main_mod.get_semantic_cache().stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_answer_hybrid_gate_uses_dense_similarity(monkeypatch: pytest.MonkeyPatch) -> None:
+    import numpy as np
+    from qdrant_client import AsyncQdrantClient
+    from qdrant_client.models import Distance, PointStruct, VectorParams
+
+    from app import main as main_mod
+    from app import retriever
+    from app.lexical import LexicalIndex
+    from app.vectorstore.qdrant import QdrantStore
+
+    docs = [("00000000-0000-0000-0000-000000000001", "POST /entity/customerorder создает заказ", {"source": "a.md"}),
+            ("00000000-0000-0000-0000-000000000002", "DELETE /entity/webhook удаляет вебхук", {"source": "b.md"})]
+    client = AsyncQdrantClient(":memory:")
+    await client.create_collection("api_docs", VectorParams(size=3, distance=Distance.COSINE))
+    await client.upsert("api_docs", [PointStruct(id=pid, vector=v, payload={"text": t, **m})
+                                     for (pid, t, m), v in zip(docs, [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]])])
+
+    class Embedder:
+        prompts: dict = {}
+
+        def encode(self, texts, **kwargs):
+            return np.array([[0.0, 0.0, 1.0]] * len(texts), dtype=np.float32)  # unrelated to every chunk
+
+    index = LexicalIndex.build(docs)
+    monkeypatch.setattr(retriever, "get_vector_store", lambda: QdrantStore(async_client=client))
+    monkeypatch.setattr(retriever, "get_embedder", lambda: Embedder())
+    monkeypatch.setattr(retriever, "get_lexical_index", lambda collection: index)
+    monkeypatch.setattr(main_mod, "get_llm", lambda: DummyLLM())
+    retriever.get_query_batcher.cache_clear()
+    main_mod.get_query_cache().clear()
+
+    # off-topic, but one word matches by chance, so both legs return hits
+    query = "ветер удаляет облака над парижем"
+    hits = await retriever.asearch(query, top_k=2, mode="hybrid")
+    # the fused score of the top hit is high by construction, its dense similarity is not
+    assert hits[0]["score"] >= 0.5 and hits[0]["dense_score"] == pytest.approx(0.0, abs=1e-6)
+    resp = await post_answer(AnswerRequest(query=query, with_rerank=False, mode="hybrid"))
+    retriever.get_query_batcher.cache_clear()
+    assert resp.answer.startswith("Не нашёл") and resp.related
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, List
+
+import numpy as np
+import pytest
+
+from app import deps
+
+
+class FakeModel:
+    loads: List[tuple] = []
+
+    def __init__(self, name: str, **kwargs: Any) -> None:
+        FakeModel.loads.append((name, kwargs))
+
+
+def test_onnx_export_is_cached(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    cfg = deps.get_settings()
+    monkeypatch.setattr(cfg, "data_dir", str(tmp_path))
+    exports = []
+
+    def fake_export(cls, name, target, backend, **kwargs):
+        exports.append(backend)
+        (target / "onnx").mkdir(parents=True)
+        (target / deps._onnx_file(backend)).write_bytes(b"")
+
+    monkeypatch.setattr(deps, "_export_onnx", fake_export)
+    FakeModel.loads.clear()
+    for _ in range(2):
+        deps.load_model(FakeModel, "BAAI/bge-m3", backend="onnx-int8", device="cpu")
+    assert exports == ["onnx-int8"]
+    name, kwargs = FakeModel.loads[-1]
+    assert name == str(tmp_path / "onnx" / "BAAI--bge-m3" / "onnx-int8")
+    assert kwargs == {"backend": "onnx", "model_kwargs": {"file_name": "onnx/model_qint8_avx2.onnx"}, "device": "cpu"}
+
+    # switching backends back and forth exports each once and keeps both
+    for backend in ("onnx", "onnx-int8", "onnx"):
+        deps.load_model(FakeModel, "BAAI/bge-m3", backend=backend)
+    assert exports == ["onnx-int8", "onnx"]
+    assert (tmp_path / "onnx" / "BAAI--bge-m3" / "onnx-int8" / deps._onnx_file("onnx-int8")).exists()
+
+    deps.load_model(FakeModel, "BAAI/bge-m3", backend="torch")
+    assert FakeModel.loads[-1] == ("BAAI/bge-m3", {})
+    with pytest.raises(ValueError):
+        deps.load_model(FakeModel, "BAAI/bge-m3", backend="tensorrt")
+
+
+PASSAGES = [
+    "Заказ покупателя создается запросом POST /entity/customerorder.",
+    "Use the limit and offset parameters to page through large collections.",
+    "Токен доступа передается в заголовке Authorization: Bearer <token>.",
+    "Отгрузка списывает товары со склада.",
+]
+
+
+@pytest.mark.integration
+def test_onnx_int8_parity_with_torch() -> None:
+    pytest.importorskip("optimum.onnxruntime")
+    from sentence_transformers import CrossEncoder, SentenceTransformer
+
+    cfg = deps.get_settings()
+    ref = deps.load_model(SentenceTransformer, cfg.embedding_model, backend="torch")
+    q8 = deps.load_model(SentenceTransformer, cfg.embedding_model, backend="onnx-int8")
+    a = ref.encode(PASSAGES, normalize_embeddings=True)
+    b = q8.encode(PASSAGES, normalize_embeddings=True)
+    cos = np.sum(a * b, axis=1)
+    assert cos.min() > 0.98
+
+    assert cfg.reranker_model
+    pairs = [["как создать заказ покупателя", p] for p in PASSAGES]
+    ref_rr = deps.load_model(CrossEncoder, cfg.reranker_model, backend="torch")
+    q8_rr = deps.load_model(CrossEncoder, cfg.reranker_model, backend="onnx-int8")
+    s_ref, s_q8 = ref_rr.predict(pairs), q8_rr.predict(pairs)
+    assert int(np.argmax(s_ref)) == int(np.argmax(s_q8))
+    assert np.allclose(s_ref, s_q8, atol=0.1 * (np.ptp(s_ref) + 1e-6))
@@ -0,0 +1,41 @@
+from __future__ import annotations
+
+import asyncio
+from typing import List
+
+import pytest
+
+from app.batching import MicroBatcher
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_batch() -> None:
+    calls: List[List[str]] = []
+
+    def fn(items: List[str]) -> List[str]:
+        calls.append(list(items))
+        return [s.upper() for s in items]
+
+    batcher: MicroBatcher[str, str] = MicroBatcher(fn, max_batch_size=8, max_wait_ms=50)
+    out = await asyncio.gather(*(batcher.submit(s) for s in ["a", "b", "c"]))
+    assert out == ["A", "B", "C"]
+    assert calls == [["a", "b", "c"]]
+    st = batcher.stats()
+    assert st["batches"] == 1
+    assert st["fill_ratio"] == pytest.approx(3 / 8)
+
+
+@pytest.mark.asyncio
+async def test_batch_size_cap_and_errors() -> None:
+    def fn(items: List[int]) -> List[int]:
+        if -1 in items:
+            raise ValueError("boom")
+        return [i * 2 for i in items]
+
+    batcher: MicroBatcher[int, int] = MicroBatcher(fn, max_batch_size=2, max_wait_ms=20)
+    out = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+    assert out == [0, 2, 4, 6, 8]
+    assert batcher.stats()["batches"] == 3
+
+    with pytest.raises(ValueError):
+        await batcher.submit(-1)
@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import json
+import math
+from pathlib import Path
+
+import pytest
+
+from app import rerank, retriever
+from app.config import get_settings
+from scripts import bench_retrieval as bench
+
+
+def test_gains_and_quality_metrics() -> None:
+    results = [{"source": "a.md", "anchor": "#x"}, {"source": "a.md", "anchor": "#x"},
+               {"source": "b.md", "anchor": "#y"}, {"source": "c.md", "anchor": "#z"}]
+    # a repeated section counts once; an expected item without anchor matches any chunk of its source
+    g = bench.gains(results, [("a.md", "#x"), ("c.md", None)])
+    assert g == [1, 0, 0, 1]
+    q = bench.quality([(g, 2), ([0, 0, 0, 0], 1)], [1, 4])
+    assert q["recall@1"] == 0.25 and q["recall@4"] == 0.5 and q["mrr@4"] == 0.5
+    assert q["ndcg@4"] == pytest.approx(round((1 + 1 / math.log2(5)) / (1 + 1 / math.log2(3)) / 2, 4))
+    assert bench.percentiles([1.0, 2.0, 3.0])["p50"] == 2.0
+
+
+def test_parse_config() -> None:
+    conf = bench.parse_config("rr:mode=hybrid,with_rerank=true,rerank_top_n=8", top_k=10)
+    assert conf == {"name": "rr", "mode": "hybrid", "with_rerank": True, "rerank_top_n": 8, "top_k": 10}
+    assert bench.parse_config('{"name": "f", "filters": {"source": "a.md"}, "top_k": 3}', top_k=10)["top_k"] == 3
+    with pytest.raises(ValueError, match="nope"):
+        bench.parse_config("x:nope=1", top_k=10)
+    for preset in bench.PRESETS.values():
+        assert len({bench.parse_config(spec, top_k=10)["name"] for spec in preset}) == len(preset)
+
+
+def test_offline_run_and_baseline_gate(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    cfg = get_settings()
+    for name in ("data_dir", "vector_store", "embedding_model"):
+        monkeypatch.setattr(cfg, name, getattr(cfg, name))
+    monkeypatch.setattr(retriever, "get_vector_store", retriever.get_vector_store)
+    monkeypatch.setattr(retriever, "get_embedder", retriever.get_embedder)
+    monkeypatch.setattr(rerank, "get_reranker", rerank.get_reranker)
+
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "orders.md").write_text("# Заказы\n\n## Создать заказ\n\nPOST /entity/customerorder создает заказ.\n\n"
+                                    "## Удалить заказ\n\nDELETE /entity/customerorder/{id} удаляет заказ.\n")
+    (docs / "hooks.md").write_text("# Вебхуки\n\n## Создать вебхук\n\nPOST /entity/webhook, поле url обязательно.\n")
+    orders = (docs / "orders.md").as_posix()
+    dataset = {"name": "tiny", "version": 1, "docs": docs.as_posix(), "docs_sha256": bench.docs_fingerprint(docs),
+               "questions": [
+                   {"id": "q1", "question": "удалить заказ customerorder",
+                    "expected": [{"source": orders, "anchor": "#удалить-заказ"}]},
+                   {"id": "q2", "question": "создать вебхук url", "expected": [{"source": (docs / "hooks.md").as_posix()}]},
+                   {"id": "q3", "question": "создать", "filters": {"source": orders},
+                    "expected": [{"source": orders, "anchor": "#создать-заказ"}]},
+               ]}
+    (tmp_path / "ds.json").write_text(json.dumps(dataset, ensure_ascii=False), encoding="utf-8")
+    base = ["--dataset", str(tmp_path / "ds.json"), "--models", "hash", "--repeat", "2", "--cutoffs", "1,3",
+            "--data-dir", str(tmp_path / "data")]
+
+    assert bench.main([*base, "--output", str(tmp_path / "r1.json"),
+                       "--config", "hybrid:mode=hybrid,top_k=3", "--config", "rr:mode=hybrid,with_rerank=true"]) == 0
+    report = json.loads((tmp_path / "r1.json").read_text(encoding="utf-8"))
+    assert report["dataset"]["docs_match"] and report["setup"]["chunks"] == 3
+    hybrid, rr = report["configs"]
+    assert hybrid["params"] == {"mode": "hybrid", "top_k": 3} and hybrid["quality"]["recall@3"] == 1.0
+    assert hybrid["latency_ms"]["total"]["n"] == 6 and {"embed", "vector_search", "lexical"} <= set(hybrid["latency_ms"])
+    assert "rerank" in rr["latency_ms"] and rr["misses"] == []
+
+    # the same config under a worse setting regresses against the first report
+    assert bench.main([*base, "--output", str(tmp_path / "r2.json"), "--baseline", str(tmp_path / "r1.json"),
+                       "--config", "hybrid:mode=hybrid,top_k=1"]) == 1
+    assert bench.main([*base, "--output", str(tmp_path / "r3.json"), "--baseline", str(tmp_path / "r1.json"),
+                       "--config", "hybrid:mode=hybrid,top_k=3"]) == 0
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from app import cache as cache_mod
+from app.cache import QueryCache, SemanticCache, make_key
+
+
+def test_key_normalizes_query() -> None:
+    a = make_key("search", query="  How to   Paginate ", top_k=5, collection="c")
+    b = make_key("search", query="how to paginate", top_k=5, collection="c")
+    assert a == b
+    assert a != make_key("search", query="how to paginate", top_k=6, collection="c")
+
+
+def test_lru_ttl_and_version(monkeypatch: pytest.MonkeyPatch) -> None:
+    now = [1000.0]
+    monkeypatch.setattr(cache_mod.time, "time", lambda: now[0])
+    c = QueryCache(max_entries=2, ttl_s=10)
+    c.set("a", "v1", 1)
+    c.set("b", "v1", 2)
+    assert c.get("a", "v1") == (1, "memory")
+    c.set("c", "v1", 3)  # evicts "b", the least recently used
+    assert c.get("b", "v1") == (None, None)
+    assert c.get("a", "v2") == (None, None)  # collection version changed
+    now[0] += 11
+    assert c.get("c", "v1") == (None, None)  # expired
+    st = c.stats()
+    assert st["memory_hits"] == 1 and st["misses"] == 3 and st["evictions"] == 1
+
+
+def test_sqlite_tier_survives_restart(tmp_path: Path) -> None:
+    db = str(tmp_path / "cache.sqlite3")
+    QueryCache(sqlite_path=db).set("k", "v1", {"answer": "x"})
+    fresh = QueryCache(sqlite_path=db)
+    assert fresh.get("k", "v1") == ({"answer": "x"}, "disk")
+    assert fresh.get("k", "v1") == ({"answer": "x"}, "memory")
+
+
+def test_bump_collection_version(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(cache_mod, "_version_path", lambda name: tmp_path / "versions" / name)
+    assert cache_mod.collection_version("docs") == "0"
+    v1 = cache_mod.bump_collection_version("docs")
+    assert cache_mod.collection_version("docs") == v1
+    v2 = cache_mod.bump_collection_version("docs")
+    assert v2 != v1 and cache_mod.collection_version("docs") == v2
+
+
+def _unit(*xs: float) -> list:
+    v = np.asarray(xs, dtype=np.float32)
+    return (v / np.linalg.norm(v)).tolist()
+
+
+def test_semantic_cache_threshold_scope_lru_and_version() -> None:
+    c = SemanticCache(max_entries=2, threshold=0.9)
+    c.set(_unit(1, 0, 0), "scope", "v1", {"answer": "orders"}, llm_ms=1500)
+    assert c.get(_unit(1, 0.2, 0), "scope", "v1")[0] == {"answer": "orders"}  # cos ~0.98
+    assert c.get(_unit(1, 1, 0), "scope", "v1")[0] is None  # cos ~0.71
+    assert c.get(_unit(1, 0, 0), "other-filters", "v1")[0] is None
+
+    c.set(_unit(0, 1, 0), "scope", "v1", {"answer": "b"})
+    c.get(_unit(1, 0, 0), "scope", "v1")
+    c.set(_unit(0, 0, 1), "scope", "v1", {"answer": "c"})  # evicts "b", the least recently used
+    assert c.get(_unit(0, 1, 0), "scope", "v1")[0] is None
+    st = c.stats()
+    assert st["hits"] == 2 and st["evictions"] == 1 and st["saved_llm_ms"] == 3000
+
+    assert c.get(_unit(1, 0, 0), "scope", "v2")[0] is None  # re-ingested
+    assert c.stats()["entries"] == 0
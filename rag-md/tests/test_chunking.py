@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import random
+
+from app.chunking import _TokenCounter, chunk_sections
+from app.md_loader import MDSection
+from app.utils import count_tokens
+from scripts.bench_chunking import legacy_chunk_sections
+
+
+def test_joined_counts_match_full_encode() -> None:
+    counter = _TokenCounter()
+    parts = [
+        "Intro line.",
+        "Ends with spaces  inside  text!",
+        "| a | b |\n|---|---|\n| 1 | 2 |",
+        "Trailing number 123",
+        "Unicode: naïve café — done?",
+        "```py\nx = 1\n```",
+    ]
+    for i in range(len(parts)):
+        for j in range(i + 1, len(parts) + 1):
+            joined = "\n\n".join(parts[i:j])
+            assert counter.count_joined(parts[i:j]) == count_tokens(joined)
+            assert counter.decode(counter.joined_ids(parts[i:j])) == joined
+
+
+def _random_sections(seed: int) -> list[MDSection]:
+    rnd = random.Random(seed)
+    words = ["alpha", "beta,", "gamma.", "delta!", "x=1", "`code`", "über", "42", "end?", "|", "  "]
+    sections = []
+    for s in range(6):
+        paras = []
+        for _ in range(rnd.randint(1, 30)):
+            kind = rnd.random()
+            if kind < 0.1:
+                paras.append("\n".join(f"| {rnd.randint(0, 99)} | {rnd.choice(words)} |" for _ in range(rnd.randint(2, 400))))
+            elif kind < 0.2:
+                paras.append("".join(rnd.choice("abcdef ") for _ in range(rnd.randint(1000, 6000))))
+            else:
+                paras.append(" ".join(rnd.choice(words) for _ in range(rnd.randint(1, 900))))
+        sections.append(MDSection(source="doc.md", title="T", section=f"S{s}", anchor=f"s{s}", text="\n\n".join(paras), meta={}))
+    return sections
+
+
+def _without_counts(chunks: list) -> list:
+    out = []
+    for text, meta in chunks:
+        assert meta.pop("token_count") == count_tokens(text)
+        out.append((text, meta))
+    return out
+
+
+def test_chunk_sections_matches_legacy_output() -> None:
+    for seed in range(5):
+        sections = _random_sections(seed)
+        assert _without_counts(chunk_sections(sections)) == legacy_chunk_sections(sections)
+        kw = dict(target_tokens_min=50, target_tokens_max=120, overlap_tokens=30)
+        assert _without_counts(chunk_sections(sections, **kw)) == legacy_chunk_sections(sections, **kw)
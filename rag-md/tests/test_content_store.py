@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pytest.importorskip("zstandard")
+
+from app.config import get_settings
+from app.content_store import ContentStore, ContentWriter, content_path, get_content_store, text_hash
+
+
+class FakeEmbedder:
+    prompts: dict = {}
+
+    def encode(self, texts, **kwargs):
+        return np.array([[1.0, float(len(t) % 3)] for t in texts], dtype=np.float32)
+
+
+def test_content_store_roundtrip_and_gc(tmp_path: Path) -> None:
+    path = tmp_path / "c.zst"
+    writer = ContentWriter(path)
+    texts = [f"chunk {i}: GET /entity/product/{i} – описание" for i in range(100)]
+    hashes = [writer.put(t) for t in texts]
+    assert writer.put(texts[0]) == hashes[0] == text_hash(texts[0])
+    n, size = writer.save()
+    assert n == 100 and size < sum(len(t.encode()) for t in texts)
+
+    # a later run starts from the saved texts and drops the ones no point refers to
+    again = ContentWriter(path)
+    again.slim({"text": "new", "source": "x.md"})
+    again.save(live=[*hashes[:10], text_hash("new")])
+    store = ContentStore.load(path)
+    assert len(store) == 11
+    got = store.get_many([hashes[3], hashes[50], text_hash("new"), "missing"])
+    assert got == {hashes[3]: texts[3], text_hash("new"): "new"}
+
+
+def test_slim_ingest_and_hydrated_search(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    from app import retriever
+    from app.embed_cache import EmbeddingCache
+    from app.lexical import get_lexical_index
+    from app.manifest import Manifest
+    from app.vectorstore.local import LocalVectorStore
+    from scripts.ingest_md import Ingestor, publish
+
+    monkeypatch.setattr(get_settings(), "data_dir", str(tmp_path))
+    store = LocalVectorStore(tmp_path / "vectors")
+    store.ensure_collection("c", 2)
+    content = ContentWriter(content_path("c"))
+    ingestor = Ingestor(store, "c", get_settings(), cache=EmbeddingCache(str(tmp_path / "emb.sqlite3")),
+                        content=content)
+    ingestor._embedder = FakeEmbedder()
+    m = Manifest(tmp_path / "manifest.json")
+    a, b = tmp_path / "a.md", tmp_path / "b.md"
+    a.write_text("# A\n\nalpha customerorder text\n")
+    b.write_text("# B\n\nbeta text\n")
+    ingestor.apply_changes(m, *m.diff([a, b], root=tmp_path))
+    publish(store, "c", content=content)
+
+    # points carry only the hash; texts live in the content store
+    payloads = [h.payload for h in store.scroll("c")]
+    assert all("text" not in p and p["text_hash"] for p in payloads)
+    assert len(get_content_store("c")) == 2
+    assert [pid for pid, _ in get_lexical_index("c").search("customerorder")]
+
+    monkeypatch.setattr(retriever, "get_vector_store", lambda: store)
+    monkeypatch.setattr(retriever, "get_embedder", lambda: FakeEmbedder())
+    full = retriever.search("alpha", top_k=2, collection="c", mode="dense")
+    assert sorted(r["text"] for r in full) == ["alpha customerorder text", "beta text"]
+    bare = retriever.search("alpha", top_k=2, collection="c", mode="dense", with_text=False)
+    assert [r["text"] for r in bare] == [None, None]
+    retriever.hydrate(bare[:1], "c")
+    assert bare[0]["text"] == next(r["text"] for r in full if r["id"] == bare[0]["id"])
+    # the async path decompresses in a worker thread, not on the event loop
+    threads = []
+    real = retriever.hydrate_texts
+    monkeypatch.setattr(retriever, "hydrate_texts", lambda rs, c: threads.append(threading.get_ident()) or real(rs, c))
+    asyncio.run(retriever.ahydrate(bare[1:], "c"))
+    assert bare[1]["text"] and threads and threads[0] != threading.get_ident()
+
+    # an edit replaces the chunk and its text is garbage-collected on the next save
+    a.write_text("# A\n\nalpha edited\n")
+    ingestor.apply_changes(m, *m.diff([a, b], root=tmp_path))
+    publish(store, "c", content=content)
+    assert len(get_content_store("c")) == 2
+    texts = {r["text"] for r in retriever.search("alpha", top_k=2, collection="c", mode="dense")}
+    assert texts == {"alpha edited", "beta text"}
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+from typing import Any, Dict
+
+import pytest
+
+from app import context_packer
+from app.context_packer import pack_context
+from app.utils import count_tokens
+
+
+def _chunk(text: str, score: float, source: str = "a.md", anchor: str = "#a", **kw: Any) -> Dict[str, Any]:
+    return {"text": text, "score": score, "source": source, "anchor": anchor, "section": "Orders",
+            "token_count": count_tokens(text), **kw}
+
+
+def test_pack_merges_section_chunks_and_drops_duplicates(monkeypatch: pytest.MonkeyPatch) -> None:
+    first = "Create an order with POST.\n\nThe body is JSON."
+    second = "The body is JSON.\n\nThe response has the order id."
+    results = [
+        _chunk(second, 0.9),
+        _chunk(first, 0.8),
+        _chunk("Create an order with POST.\nThe body is JSON.", 0.7, source="b.md", anchor="#b"),
+        _chunk("Tokens go in the Authorization header.", 0.6, source="c.md", anchor="#c", section="Auth"),
+    ]
+    calls = []
+    monkeypatch.setattr(context_packer, "count_tokens", lambda t: calls.append(t) or count_tokens(t))
+    context_packer._header_tokens.cache_clear()
+
+    packed = pack_context(results, max_tokens=1000)
+    assert [[c["score"] for c in g] for g in packed.groups] == [[0.9, 0.8], [0.6]]
+    assert packed.text == (
+        "## Orders\n\nCreate an order with POST.\n\nThe body is JSON.\n\nThe response has the order id."
+        "\n\n## Auth\n\nTokens go in the Authorization header."
+    )
+    assert abs(packed.tokens - count_tokens(packed.text)) <= 3
+    assert calls == ["## Orders\n\n", "## Auth\n\n"]  # chunk texts are never tokenized
+
+
+def test_pack_respects_budget_by_score_per_token() -> None:
+    big = _chunk("word " * 300, 0.9, source="big.md", anchor="#big")
+    small = [_chunk(f"fact {i} " * 20, 0.5, source=f"s{i}.md", anchor=f"#s{i}") for i in range(3)]
+    packed = pack_context([big, *small], max_tokens=200)
+    assert [g[0]["source"] for g in packed.groups] == ["s0.md", "s1.md", "s2.md"]
+    assert packed.tokens <= 200
+
+    # a single high-scoring chunk beats a set of low-scoring ones
+    weak = [_chunk(f"fact {i} " * 20, 0.01, source=f"w{i}.md", anchor=f"#w{i}") for i in range(3)]
+    top = _chunk("word " * 150, 0.9, source="top.md", anchor="#top")
+    assert [g[0]["source"] for g in pack_context([top, *weak], max_tokens=200).groups] == ["top.md"]
+
+    # chunks ingested before token counts were stored still fit the budget
+    legacy = {k: v for k, v in small[0].items() if k != "token_count"}
+    assert pack_context([legacy], max_tokens=100).tokens == count_tokens("## Orders\n\n" + legacy["text"])
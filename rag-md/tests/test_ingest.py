@@ -1,9 +1,15 @@
 from __future__ import annotations
 
+import os
 from pathlib import Path
 
-from app.md_loader import parse_markdown
+import numpy as np
+import pytest
+
+from app.md_loader import iter_sections, parse_markdown, read_section_text
 from app.chunking import chunk_sections
+from app.embed_cache import EmbeddingCache, embedding_key, point_id
+from app.manifest import Manifest
 
 
 def test_parse_and_chunk(tmp_path: Path) -> None:
@@ -17,4 +23,215 @@ def test_parse_and_chunk(tmp_path: Path) -> None:
     # ensure metadata propagated
     content, meta = chunks[0]
     assert meta["source"].endswith("doc.md")
-    assert meta.get("service") == "stock" 
\ No newline at end of file
+    assert meta.get("service") == "stock" 
+
+
+def test_streaming_sections_keep_byte_offsets(tmp_path: Path) -> None:
+    md = tmp_path / "doc.md"
+    md.write_text("Intro\n\n# Title\n\n```md\n# not a heading\n```\n\nSetext\n------\n\nBody ü\n\n## Last\nEnd\n", encoding="utf-8")
+    sections = list(iter_sections(md))
+    assert [s.section for s in sections] == [None, "Title", "Setext", "Last"]
+    assert sections[1].text == "# not a heading"
+    raw = md.read_bytes()
+    assert raw[sections[2].start :].startswith(b"Setext")
+    assert sections[-1].end == len(raw)
+    for s in sections:
+        assert read_section_text(md, s.start, s.end) == s.text
+
+
+def test_point_ids_are_content_addressed() -> None:
+    a = point_id("text", "docs/a.md", "#x")
+    assert a == point_id("text", "docs/a.md", "#x")
+    assert a != point_id("text!", "docs/a.md", "#x")
+    assert a != point_id("text", "docs/b.md", "#x")
+
+
+def test_embedding_cache_roundtrip(tmp_path: Path) -> None:
+    cache = EmbeddingCache(str(tmp_path / "emb.sqlite3"))
+    k1, k2 = embedding_key("m", "one"), embedding_key("m", "two")
+    cache.put_many([(k1, np.array([0.5, 1.0], dtype=np.float32))])
+    got = cache.get_many([k1, k2])
+    assert list(got) == [k1]
+    assert got[k1].tolist() == [0.5, 1.0]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_delete_stale_points() -> None:
+    from qdrant_client import QdrantClient
+
+    from app.vectorstore.base import Point
+    from app.vectorstore.qdrant import QdrantStore
+    from scripts.ingest_md import delete_stale_points
+
+    store = QdrantStore(QdrantClient(":memory:"))
+    store.ensure_collection("c", 2)
+    ids = {name: point_id(name, src, None) for name, src in [("a", "x.md"), ("b", "x.md"), ("c", "y.md")]}
+    srcs = {"a": "x.md", "b": "x.md", "c": "y.md"}
+    store.upsert("c", [Point(id=i, vector=[1.0, 0.0], payload={"source": srcs[n]}) for n, i in ids.items()])
+
+    # re-ingesting x.md produced only chunk "a": "b" is stale, y.md is untouched
+    assert delete_stale_points(store, "c", {ids["a"]}, sources={"x.md"}) == 1
+    left = {h.id for h in store.scroll("c")}
+    assert left == {ids["a"], ids["c"]}
+
+
+def test_manifest_diff(tmp_path: Path) -> None:
+    a, b = tmp_path / "a.md", tmp_path / "b.md"
+    a.write_text("# A\n")
+    b.write_text("# B\n")
+    m = Manifest(tmp_path / "manifest.json")
+    assert m.diff([a, b], root=tmp_path) == ([a, b], [])
+    m.record(a)
+    m.record(b)
+    m.save()
+
+    m = Manifest(tmp_path / "manifest.json")
+    b.write_text("# B changed\n")
+    os.utime(a, ns=(1, 1))  # touched, same content
+    a_key = a.as_posix()
+    b.unlink()
+    assert m.diff([a], root=tmp_path) == ([], [b.as_posix()])
+    assert m.files[a_key].mtime_ns == 1
+
+
+def test_manifest_diff_only_deletes_under_root(tmp_path: Path) -> None:
+    (tmp_path / "sub").mkdir()
+    a, b = tmp_path / "a.md", tmp_path / "sub" / "b.md"
+    a.write_text("# A\n")
+    b.write_text("# B\n")
+    m = Manifest(tmp_path / "manifest.json")
+    m.record(a)
+    m.record(b)
+
+    # a rescan of sub/ (or of a single file) says nothing about a.md
+    assert m.diff([b], root=tmp_path / "sub") == ([], [])
+    assert m.diff([b], root=b) == ([], [])
+    b.unlink()
+    assert m.diff([], root=tmp_path / "sub") == ([], [b.as_posix()])
+
+
+class FakeEmbedder:
+    prompts: dict = {}
+
+    def encode(self, texts, **kwargs):
+        return np.ones((len(texts), 2), dtype=np.float32)
+
+
+@pytest.mark.parametrize("kind", ["qdrant", "local"])
+def test_incremental_apply_changes(tmp_path: Path, kind: str) -> None:
+    from qdrant_client import QdrantClient
+
+    from app.config import Settings
+    from app.vectorstore.local import LocalVectorStore
+    from app.vectorstore.qdrant import QdrantStore
+    from scripts.ingest_md import Ingestor
+
+    store = QdrantStore(QdrantClient(":memory:")) if kind == "qdrant" else LocalVectorStore(tmp_path / "vectors")
+    store.ensure_collection("c", 2)
+    ingestor = Ingestor(store, "c", Settings(), cache=EmbeddingCache(str(tmp_path / "emb.sqlite3")))
+    ingestor._embedder = FakeEmbedder()
+    m = Manifest(tmp_path / "manifest.json")
+
+    a, b = tmp_path / "a.md", tmp_path / "b.md"
+    a.write_text("# A\n\nalpha text\n")
+    b.write_text("# B\n\nbeta text\n")
+    ingestor.apply_changes(m, *m.diff([a, b], root=tmp_path))
+
+    def sources() -> list:
+        return sorted(h.payload["source"] for h in store.scroll("c"))
+
+    assert sources() == [a.as_posix(), b.as_posix()]
+
+    a.write_text("# A\n\nalpha text, edited\n")
+    b.unlink()
+    changed, deleted = m.diff([a], root=tmp_path)
+    assert changed == [a] and deleted == [b.as_posix()]
+    ingestor.apply_changes(m, changed, deleted)
+    assert [h.payload["text"] for h in store.scroll("c")] == ["alpha text, edited"]
+    assert m.diff([a], root=tmp_path) == ([], [])
+    # the unchanged chunk text was never re-encoded
+    assert ingestor.total_encoded == 3
+
+
+def test_full_scan_of_one_folder_keeps_other_folders(tmp_path: Path) -> None:
+    from app.config import Settings
+    from app.vectorstore.local import LocalVectorStore
+    from scripts.ingest_md import Ingestor, list_files
+
+    store = LocalVectorStore(tmp_path / "vectors")
+    store.ensure_collection("c", 2)
+    ingestor = Ingestor(store, "c", Settings(), cache=EmbeddingCache(str(tmp_path / "emb.sqlite3")))
+    ingestor._embedder = FakeEmbedder()
+    m = Manifest(tmp_path / "manifest.json")
+    first, second = tmp_path / "docs" / "first", tmp_path / "docs" / "second"
+    for folder in (first, second):
+        folder.mkdir(parents=True)
+        (folder / "a.md").write_text(f"# {folder.name}\n\n{folder.name} text\n")
+    # a sibling whose name merely starts like the scanned folder is not under it
+    (tmp_path / "docs" / "first-extra").mkdir()
+    extra = tmp_path / "docs" / "first-extra" / "x.md"
+    extra.write_text("# X\n\nextra text\n")
+
+    def sources() -> set:
+        return {h.payload["source"] for h in store.scroll("c")}
+
+    ingestor.sync(m, [*list_files(first), extra], root=first)
+    ingestor.sync(m, list_files(second), root=second)
+    assert sources() == {(first / "a.md").as_posix(), (second / "a.md").as_posix(), extra.as_posix()}
+
+    # a file deleted from the scanned folder is pruned, the other folders stay
+    (second / "a.md").unlink()
+    (second / "b.md").write_text("# B\n\nbeta text\n")
+    assert ingestor.sync(m, list_files(second), root=second) == 1
+    assert sources() == {(first / "a.md").as_posix(), (second / "b.md").as_posix(), extra.as_posix()}
+    assert set(m.files) == sources()
+
+
+def test_pipeline_batches_across_files(tmp_path: Path) -> None:
+    from app.ingest_pipeline import IngestPipeline
+
+    paths = []
+    for i in range(5):
+        p = tmp_path / f"f{i}.md"
+        p.write_text(f"# File {i}\n\n## One\nfirst {i}\n\n## Two\nsecond {i}\n")
+        paths.append(p)
+    encoded_batches: list = []
+    uploaded: list = []
+
+    def encode(texts):
+        encoded_batches.append(len(texts))
+        return np.ones((len(texts), 2), dtype=np.float32)
+
+    pipeline = IngestPipeline(
+        encode=encode,
+        upsert=uploaded.extend,
+        model_name="m",
+        parse_workers=2,
+        embed_batch_size=4,
+        encode_batch_size=4,
+        upsert_batch_size=3,
+        max_inflight=2,
+    )
+    ids = pipeline.run(paths)
+    assert sorted(ids) == sorted(p.as_posix() for p in paths)
+    assert all(len(v) == 2 for v in ids.values())
+    assert encoded_batches == [4, 4, 2]  # chunks of different files share batches
+    assert len(uploaded) == 10
+    assert pipeline.upload.extra["requests"] == 4
+    assert "files" in pipeline.report()
+
+
+def test_encode_length_sorted_scatters_back() -> None:
+    from app.ingest_pipeline import encode_length_sorted, length_sorted_batches
+
+    texts = ["a" * n for n in (3, 10, 1, 7, 5)]
+    assert length_sorted_batches(texts, 2) == [[1, 3], [4, 0], [2]]
+    seen = []
+
+    def encode(batch):
+        seen.append([len(t) for t in batch])
+        return np.array([[len(t), 0.0] for t in batch], dtype=np.float32)
+
+    out = encode_length_sorted(encode, texts, 2)
+    assert seen == [[10, 7], [5, 3], [1]]
+    assert out[:, 0].tolist() == [3, 10, 1, 7, 5]
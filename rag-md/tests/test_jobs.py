@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import asyncio
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pytest
+
+from app.jobs import Job, JobQueue, MemoryJobStore, QueueFull, SQLiteJobStore
+from app.llm_client.limited import ConcurrencyLimitedClient
+
+
+async def _wait_done(queue: JobQueue, job_id: str) -> Job:
+    for _ in range(200):
+        job = await queue.get(job_id)
+        assert job is not None
+        if job.status in ("done", "error"):
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError("job did not finish")
+
+
+@pytest.mark.asyncio
+async def test_queue_runs_by_priority_and_rejects_when_full() -> None:
+    order: List[str] = []
+    gate = asyncio.Event()
+
+    async def runner(payload: Dict[str, Any]) -> Dict[str, Any]:
+        await gate.wait()
+        order.append(payload["q"])
+        if payload["q"] == "boom":
+            raise RuntimeError("llm down")
+        return {"answer": payload["q"]}
+
+    queue = JobQueue(runner, MemoryJobStore(), workers=1, max_pending=3, poll_interval_s=0.01)
+    first = await queue.submit({"q": "first"})
+    await asyncio.sleep(0.02)  # the single worker picks it up and blocks on the gate
+    low = await queue.submit({"q": "low"})
+    boom = await queue.submit({"q": "boom"})
+    high = await queue.submit({"q": "high"}, priority=5)
+    assert await queue.position(high.id) == 1 and await queue.position(boom.id) == 3
+    with pytest.raises(QueueFull) as exc:
+        await queue.submit({"q": "overflow"})
+    assert exc.value.depth == 3
+    # stats() reports the counts the workers keep, without a store call on the event loop
+    store, queue._store = queue._store, None  # type: ignore[assignment]
+    assert {k: queue.stats()[k] for k in ("depth", "running")} == {"depth": 3, "running": 1}
+    queue._store = store
+
+    gate.set()
+    assert (await _wait_done(queue, boom.id)).error == "llm down"
+    assert (await _wait_done(queue, low.id)).result == {"answer": "low"}
+    assert order == ["first", "high", "low", "boom"]
+    st = queue.stats()
+    assert st["done"] == 3 and st["failed"] == 1 and st["rejected"] == 1 and st["depth"] == 0
+    assert await queue.get(first.id) is not None
+
+
+def test_sqlite_store_survives_restart_and_requeues_stale_leases(tmp_path: Path) -> None:
+    path = str(tmp_path / "jobs.sqlite")
+    store = SQLiteJobStore(path)
+    store.add(Job(id="a", payload={"q": "a"}))
+    store.add(Job(id="b", payload={"q": "b"}, priority=1))
+    claimed = store.claim(lease_s=-1.0)  # the worker "died": its lease is already over
+    assert claimed is not None and claimed.id == "b" and claimed.status == "running"
+
+    reopened = SQLiteJobStore(path)
+    assert reopened.depth() == 1 and reopened.position("a") == 1
+    again = reopened.claim(lease_s=60.0)
+    assert again is not None and again.id == "b"  # stale lease went back to the queue
+
+    again.status, again.result, again.finished_at, again.expires_at = "done", {"answer": "ok"}, 1.0, 2.0
+    reopened.finish(again)
+    assert store.get("b").result == {"answer": "ok"}
+    assert reopened.evict(now=3.0) == 1 and reopened.get("b") is None
+
+
+class SlowLLM:
+    def __init__(self) -> None:
+        self.active = 0
+        self.peak = 0
+
+    async def acomplete(self, messages: Any, **kwargs: Any) -> str:
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        return "ok"
+
+
+@pytest.mark.asyncio
+async def test_llm_concurrency_limit() -> None:
+    inner = SlowLLM()
+    llm = ConcurrencyLimitedClient(inner, max_concurrency=2)  # type: ignore[arg-type]
+    out = await asyncio.gather(*(llm.acomplete([]) for _ in range(6)))
+    assert out == ["ok"] * 6 and inner.peak == 2
+
+
+@pytest.mark.asyncio
+async def test_running_job_keeps_its_lease_and_is_released_on_cancel(tmp_path: Path) -> None:
+    path = str(tmp_path / "jobs.sqlite")
+    started, finish = asyncio.Event(), asyncio.Event()
+
+    async def runner(payload: Dict[str, Any]) -> Dict[str, Any]:
+        started.set()
+        await finish.wait()
+        return {"answer": "ok"}
+
+    queue = JobQueue(runner, SQLiteJobStore(path), workers=1, lease_s=0.15, poll_interval_s=0.01)
+    job = await queue.submit({"q": "slow"})
+    await started.wait()
+    await asyncio.sleep(0.4)  # well past the first lease: the heartbeat renewed it
+    other = SQLiteJobStore(path)
+    assert other.claim(lease_s=60.0) is None
+
+    # shutdown mid-run hands the job back instead of leaving it "running"
+    for task in queue._tasks:
+        task.cancel()
+    await asyncio.gather(*queue._tasks, return_exceptions=True)
+    assert other.get(job.id).status == "pending"
+    finish.set()
+    assert (await _wait_done(queue, job.id)).result == {"answer": "ok"}  # restarted workers pick it up
+
+
+@pytest.mark.asyncio
+async def test_only_dead_workers_are_restarted() -> None:
+    async def runner(payload: Dict[str, Any]) -> Dict[str, Any]:
+        return {}
+
+    queue = JobQueue(runner, MemoryJobStore(), workers=3, poll_interval_s=0.01)
+    await queue.submit({})
+    alive = list(queue._tasks)
+    alive[0].cancel()
+    await asyncio.gather(alive[0], return_exceptions=True)
+    await queue.submit({})
+    assert len(queue._tasks) == 3 and queue._tasks[:2] == alive[1:]
+    for task in queue._tasks:
+        task.cancel()
+    await asyncio.gather(*queue._tasks, return_exceptions=True)
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import Any, Dict, List
+
+import httpx
+import pytest
+
+from app.llm_client.llama_cpp import LlamaCppClient
+from app.utils import JsonFenceChecker, all_json_fences_valid
+
+MESSAGES = [{"role": "system", "content": "sys"}, {"role": "user", "content": "hi"}]
+
+
+def _sse(*payloads: Any) -> bytes:
+    return "".join(f"data: {p if isinstance(p, str) else json.dumps(p)}\n\n" for p in payloads).encode()
+
+
+def _client(handler, **kwargs: Any) -> LlamaCppClient:
+    client = LlamaCppClient("http://llama", "mistral", **kwargs)
+    client._client = httpx.AsyncClient(base_url="http://llama", transport=httpx.MockTransport(handler))
+    return client
+
+
+@pytest.mark.asyncio
+async def test_llama_astream_chat_completions() -> None:
+    seen: List[Dict[str, Any]] = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.method == "GET":
+            return httpx.Response(200, json={})
+        seen.append(json.loads(request.content))
+        assert request.url.path == "/v1/chat/completions"
+        body = _sse({"choices": [{"delta": {"role": "assistant"}}]},
+                    {"choices": [{"delta": {"content": "Hel"}}]},
+                    {"choices": [{"delta": {"content": "lo"}}]}, "[DONE]")
+        return httpx.Response(200, content=body, headers={"content-type": "text/event-stream"})
+
+    pieces = [p async for p in _client(handler).astream(MESSAGES, max_tokens=5)]
+    assert pieces == ["Hel", "lo"]
+    assert seen[0]["stream"] is True and seen[0]["max_tokens"] == 5 and seen[0]["cache_prompt"] is True
+
+
+@pytest.mark.asyncio
+async def test_llama_astream_falls_back_to_native_completion() -> None:
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path != "/completion":
+            return httpx.Response(404)
+        payload = json.loads(request.content)
+        assert payload["stream"] is True and payload["prompt"] == "sys\nhi"
+        body = _sse({"content": "a", "stop": False}, {"content": "b", "stop": False}, {"content": "", "stop": True})
+        return httpx.Response(200, content=body)
+
+    assert [p async for p in _client(handler).astream(MESSAGES)] == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_llama_probes_once_and_dedups_inflight_prompts() -> None:
+    calls: List[str] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url.path)
+        if request.url.path == "/props":
+            return httpx.Response(200, json={"total_slots": 2})
+        if request.url.path != "/completion":
+            return httpx.Response(404)  # build without the OpenAI-compatible routes
+        await asyncio.sleep(0.02)
+        return httpx.Response(200, json={"content": json.loads(request.content)["prompt"]})
+
+    client = _client(handler)
+    same = await asyncio.gather(*(client.acomplete(MESSAGES) for _ in range(5)))
+    assert same == ["sys\nhi"] * 5 and client.dedup_hits == 4
+    await client.acomplete([{"role": "user", "content": "other"}])
+    assert calls == ["/v1/models", "/props", "/completion", "/completion"]
+    assert client.chat_api is False and client.stats()["slots"] == 2
+
+
+@pytest.mark.asyncio
+async def test_llama_slot_affinity_pins_idle_slots() -> None:
+    slots: List[int] = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.method == "GET":
+            return httpx.Response(200, json={"total_slots": 2})
+        payload = json.loads(request.content)
+        slots.append(payload["id_slot"])
+        assert payload["cache_prompt"] is True
+        await asyncio.sleep(0.02)
+        return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+
+    client = _client(handler, slot_affinity=True)
+    prompts = [[{"role": "user", "content": str(i)}] for i in range(4)]
+    assert await asyncio.gather(*(client.acomplete(p) for p in prompts)) == ["ok"] * 4
+    assert sorted(slots) == [0, 0, 1, 1]
+    await client.acomplete(MESSAGES)
+    assert slots[-1] == 0  # idle again: the lowest (warmest) slot is reused
+
+
+def test_json_fence_checker_matches_full_check() -> None:
+    text = 'x ```json\n{"a": 1}\n``` y ```json\n{"b": }\n``` z'
+    for step in (1, 3, 7, len(text)):
+        checker = JsonFenceChecker()
+        for i in range(0, len(text), step):
+            checker.feed(text[i : i + step])
+        assert checker.valid == all_json_fences_valid(text) is False
+    # the invalid fence is not closed yet
+    partial = JsonFenceChecker()
+    partial.feed(text[:40])
+    assert partial.valid
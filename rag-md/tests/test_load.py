@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+import httpx
+import numpy as np
+import pytest
+from qdrant_client.models import ScoredPoint
+
+from app import main as main_mod
+from app import rerank, retriever
+from app.main import app
+from app.vectorstore.qdrant import QdrantStore
+
+INFERENCE_DELAY_S = 0.2
+
+
+class SlowEmbedder:
+    prompts: Dict[str, str] = {}
+
+    def encode(self, texts: List[str], **kwargs: Any) -> np.ndarray:
+        time.sleep(INFERENCE_DELAY_S)  # blocking "forward pass"
+        return np.ones((len(texts), 4), dtype=np.float32)
+
+
+class SlowReranker:
+    def predict(self, pairs: List[List[str]], **kwargs: Any) -> List[float]:
+        time.sleep(INFERENCE_DELAY_S)
+        return [1.0 for _ in pairs]
+
+
+class FakeAsyncQdrant:
+    async def query_points(self, **kwargs: Any) -> SimpleNamespace:
+        await asyncio.sleep(0.05)
+        payload = {"text": "word " * 200, "source": "doc.md", "title": "T", "anchor": "#t", "token_count": 200}
+        return SimpleNamespace(points=[ScoredPoint(id=1, version=0, score=0.9, payload=payload)])
+
+
+class DummyLLM:
+    async def acomplete(self, messages: List[Dict[str, Any]], **kwargs: Any) -> str:
+        await asyncio.sleep(0.1)
+        return "dummy answer"
+
+
+@pytest.mark.asyncio
+async def test_health_latency_flat_under_answer_load(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(retriever, "get_embedder", lambda: SlowEmbedder())
+    monkeypatch.setattr(rerank, "get_reranker", lambda: SlowReranker())
+    monkeypatch.setattr(retriever, "get_vector_store", lambda: QdrantStore(async_client=FakeAsyncQdrant()))
+    monkeypatch.setattr(main_mod, "get_llm", lambda: DummyLLM())
+    retriever.get_query_batcher.cache_clear()
+    rerank.get_rerank_batcher.cache_clear()
+    rerank.get_rerank_cache().clear()
+    main_mod.get_query_cache().clear()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+
+        async def answer(i: int) -> int:
+            r = await client.post("/answer", json={"query": f"q{i}", "with_rerank": True})
+            return r.status_code
+
+        async def probe_health() -> List[float]:
+            latencies = []
+            for _ in range(20):
+                t0 = time.perf_counter()
+                r = await client.get("/health")
+                latencies.append(time.perf_counter() - t0)
+                assert r.status_code == 200
+                await asyncio.sleep(0.02)
+            return latencies
+
+        t0 = time.perf_counter()
+        answers = [asyncio.create_task(answer(i)) for i in range(16)]
+        health = await probe_health()
+        codes = await asyncio.gather(*answers)
+        elapsed = time.perf_counter() - t0
+
+    rerank_batches = rerank.get_rerank_batcher().stats()["batches"]
+    retriever.get_query_batcher.cache_clear()
+    rerank.get_rerank_batcher.cache_clear()
+    assert all(c == 200 for c in codes)
+    # every request waited for a blocking embed and a blocking rerank pass ...
+    assert elapsed > 2 * INFERENCE_DELAY_S
+    # ... and rerank work of the concurrent requests was coalesced into shared batches ...
+    assert rerank_batches < 16
+    # ... while /health keeps answering without waiting for model inference
+    assert max(health) < INFERENCE_DELAY_S / 2
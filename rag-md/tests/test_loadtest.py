@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app import main as main_mod
+from app import rerank, retriever
+from app.llm_client.llama_cpp import LlamaCppClient
+from app.main import app
+from app.vectorstore.qdrant import QdrantStore
+from scripts import loadtest
+from scripts.stub_llama_server import StubTiming, create_app
+from tests.test_load import FakeAsyncQdrant, SlowEmbedder, SlowReranker
+
+MESSAGES = [{"role": "system", "content": "sys"}, {"role": "user", "content": "hi"}]
+
+
+def _stub_llm(timing: StubTiming) -> LlamaCppClient:
+    client = LlamaCppClient("http://stub", "stub", slots=timing.slots)
+    client._client = httpx.AsyncClient(base_url="http://stub", transport=httpx.ASGITransport(app=create_app(timing, seed=0)))
+    return client
+
+
+@pytest.mark.asyncio
+async def test_stub_server_timing_and_slots() -> None:
+    timing = StubTiming(slots=1, ttft_ms=50, tps=200, tokens=5, jitter=0.0)
+    llm = _stub_llm(timing)
+    assert await llm.acomplete(MESSAGES) == "Для этого отправьте запрос к"
+    assert "".join([t async for t in llm.astream(MESSAGES, max_tokens=3)]) == "Для этого отправьте"
+
+    # one slot: two requests take twice as long as one (50 ms prefill + 4 x 5 ms decode each);
+    # distinct prompts, identical ones in flight would share one upstream call
+    t0 = time.perf_counter()
+    await asyncio.gather(llm.acomplete(MESSAGES), llm.acomplete([*MESSAGES, {"role": "user", "content": "again"}]))
+    assert time.perf_counter() - t0 >= 2 * 0.07
+
+
+def test_histogram_quantile_and_saturation() -> None:
+    text = "\n".join([
+        "# TYPE rag_event_loop_lag_seconds histogram",
+        'rag_event_loop_lag_seconds_bucket{le="0.001"} 50',
+        'rag_event_loop_lag_seconds_bucket{le="0.01"} 90',
+        'rag_event_loop_lag_seconds_bucket{le="+Inf"} 100',
+        "rag_event_loop_lag_seconds_sum 0.5",
+        "rag_event_loop_lag_seconds_count 100",
+        'rag_stage_seconds_bucket{stage="embed",le="+Inf"} 4',
+        'rag_stage_seconds_sum{stage="embed"} 0.2',
+        'rag_stage_seconds_count{stage="embed"} 4',
+    ])
+    h = loadtest.parse_histograms(text)
+    lag = h[("rag_event_loop_lag_seconds", ())]
+    assert loadtest.histogram_quantile(0.5, lag) == 0.001
+    assert loadtest.histogram_quantile(0.7, lag) == pytest.approx(0.0055)
+    server = loadtest.server_summary({}, h)
+    assert server["loop_lag_ms"]["mean"] == 5.0 and server["stages_ms"] == {"embed": 50.0}
+
+    def step(tput: float, p99: float = 100.0, err: float = 0.0, **load: float) -> dict:
+        return {**load, "throughput_rps": tput, "error_rate": err, "latency_ms": {"p99": p99}}
+
+    closed = [step(10, concurrency=1), step(19, concurrency=2), step(19.5, concurrency=4)]
+    assert loadtest.find_saturation(closed)["step"] == 2
+    assert loadtest.find_saturation(closed, slo_ms=50)["step"] == 0
+    opened = [step(5, rate_rps=5), step(9.8, rate_rps=10), step(12, rate_rps=20)]
+    assert loadtest.find_saturation(opened)["last_good"]["rate_rps"] == 10
+    assert loadtest.find_saturation([step(5, err=0.1, rate_rps=5)])["reason"].startswith("error rate")
+
+
+@pytest.mark.asyncio
+async def test_closed_loop_step_against_api(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(retriever, "get_embedder", lambda: SlowEmbedder())
+    monkeypatch.setattr(rerank, "get_reranker", lambda: SlowReranker())
+    monkeypatch.setattr(retriever, "get_vector_store", lambda: QdrantStore(async_client=FakeAsyncQdrant()))
+    monkeypatch.setattr("tests.test_load.INFERENCE_DELAY_S", 0.0)
+    llm = _stub_llm(StubTiming(slots=2, ttft_ms=20, tps=500, tokens=10))
+    monkeypatch.setattr(main_mod, "get_llm", lambda: llm)
+    retriever.get_query_batcher.cache_clear()
+    rerank.get_rerank_batcher.cache_clear()
+    main_mod.get_query_cache().clear()
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        steps = {}
+        for endpoint in ("answer", "answer_stream"):
+            requests = loadtest.Requests(client, endpoint, ["как создать заказ"], body={"with_rerank": False})
+            steps[endpoint] = await loadtest.run_step(client, requests, concurrency=2, duration_s=0.5)
+    retriever.get_query_batcher.cache_clear()
+    rerank.get_rerank_batcher.cache_clear()
+
+    answer, stream = steps["answer"], steps["answer_stream"]
+    assert answer["requests"] > 2 and answer["error_rate"] == 0 and answer["throughput_rps"] > 0
+    assert answer["latency_ms"]["p50"] >= 20 and "stages_ms" in answer["server"]
+    assert stream["error_rate"] == 0 and stream["ttft_ms"]["p50"] <= stream["latency_ms"]["p50"]
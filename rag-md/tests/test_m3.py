@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app import m3_store
+from app.config import get_settings
+from app.m3 import M3Heads, M3Output, colbert_score, encode_m3, sparse_score
+from app.m3_store import M3Store, M3Writer, get_m3_store, m3_path
+
+HIDDEN = 8
+SPECIAL = {"cls_token_id": 0, "pad_token_id": 1, "eos_token_id": 2, "unk_token_id": 3}
+
+
+class FakeM3Model:
+    """Token ids from words, a fixed random vector per token id, CLS/EOS around the text."""
+
+    prompts: dict = {}
+    tokenizer = SimpleNamespace(**SPECIAL)
+
+    def __init__(self) -> None:
+        self.table = np.random.default_rng(0).normal(size=(64, HIDDEN)).astype(np.float32)
+
+    def encode(self, texts, output_value=None, batch_size=32, **kwargs):
+        assert output_value is None
+        out = []
+        for t in texts:
+            ids = [0] + [4 + sum(map(ord, w)) % 60 for w in t.lower().split()] + [2, 1]  # one pad
+            mask = [1] * (len(ids) - 1) + [0]
+            hidden = self.table[ids]
+            out.append({"input_ids": np.array(ids), "attention_mask": np.array(mask),
+                        "token_embeddings": hidden, "sentence_embedding": hidden[:-1].mean(axis=0)})
+        return out
+
+
+def _heads() -> M3Heads:
+    rnd = np.random.default_rng(1)
+    return M3Heads(rnd.normal(size=HIDDEN).astype(np.float32), 0.1,
+                   rnd.normal(size=(HIDDEN, HIDDEN)).astype(np.float32), np.zeros(HIDDEN, dtype=np.float32),
+                   frozenset(SPECIAL.values()))
+
+
+def test_heads_match_reference_formulas() -> None:
+    model, heads = FakeM3Model(), _heads()
+    [out] = encode_m3(model, heads, ["alpha beta alpha"], batch_size=4)
+    [f] = model.encode(["alpha beta alpha"])
+    hidden, ids = f["token_embeddings"][:-1], f["input_ids"][:-1].tolist()
+
+    weights = np.maximum(hidden @ heads.sparse_weight + heads.sparse_bias, 0)
+    expected = {}
+    for tok, w in zip(ids, weights.tolist()):
+        if tok not in SPECIAL.values() and w > 0:
+            expected[tok] = max(w, expected.get(tok, 0.0))
+    assert out.sparse == pytest.approx(expected)
+    # CLS dropped, padding dropped, EOS kept; unit rows
+    assert out.colbert.shape == (len(ids) - 1, HIDDEN)
+    assert np.allclose(np.linalg.norm(out.colbert, axis=1), 1.0, atol=1e-5)
+    assert np.isclose(np.linalg.norm(out.dense), 1.0)
+    assert sparse_score(out.sparse, out.sparse) == pytest.approx(sum(w * w for w in out.sparse.values()))
+    assert colbert_score(out.colbert, out.colbert) == pytest.approx(1.0, abs=1e-5)
+
+
+def _outputs(n: int, seed: int = 0) -> list:
+    rnd = np.random.default_rng(seed)
+    outs = []
+    for i in range(n):
+        colbert = rnd.normal(size=(3 + i % 5, 16)).astype(np.float32)
+        colbert /= np.linalg.norm(colbert, axis=1, keepdims=True)
+        outs.append(M3Output(colbert[0], {i: 1.0, 100 + i % 3: 0.5}, colbert))
+    return outs
+
+
+def test_m3_store_roundtrip_scores_and_gc(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    path = tmp_path / "c.m3"
+    outs = _outputs(40)
+    writer = M3Writer(path)
+    for i, out in enumerate(outs):
+        writer.put(f"h{i}", out)
+        assert writer.link(f"p{i}", f"h{i}") == out.sparse
+    assert writer.link("p-unknown", "h-unknown") is None
+    assert writer.save(f"p{i}" for i in range(40)) == (40, sum(len(o.colbert) for o in outs))
+
+    store = M3Store.load(path)
+    assert store.sparse("p7") == outs[7].sparse and store.sparse("nope") is None
+    query = _outputs(1, seed=5)[0].colbert
+    monkeypatch.setattr(m3_store, "_SCORE_BLOCK_ROWS", 10)  # several blocks, one point bigger than a block
+    got = store.colbert_scores(query, ["p3", "nope", "p30", "p0"])
+    assert got[1] is None
+    for pid_score, i in zip([got[0], got[2], got[3]], [3, 30, 0]):
+        assert pid_score == pytest.approx(colbert_score(query, outs[i].colbert), abs=0.02)
+
+    # the next run keeps old entries of live points, adds new ones and drops the rest
+    again = M3Writer(path)
+    assert again.sparse("p3") == outs[3].sparse
+    extra = _outputs(1, seed=9)[0]
+    again.put("hx", extra)
+    again.link("px", "hx")
+    assert again.save(["p3", "px", "p-gone"])[0] == 2
+    again.close()
+    store = M3Store.load(path)
+    assert store.ids == ["p3", "px"] and not (tmp_path / "c.spool").exists()
+    assert store.colbert_scores(extra.colbert, ["px"])[0] == pytest.approx(1.0, abs=0.02)
+
+
+def test_m3_ingest_and_colbert_search(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    from app import retriever
+    from app.embed_cache import EmbeddingCache
+    from app.manifest import Manifest
+    from app.vectorstore.local import LocalVectorStore
+    from scripts.ingest_md import Ingestor, publish
+
+    cfg = get_settings()
+    monkeypatch.setattr(cfg, "data_dir", str(tmp_path))
+    store = LocalVectorStore(tmp_path / "vectors")
+    store.ensure_collection("c", HIDDEN)
+    model, heads = FakeM3Model(), _heads()
+    writer = M3Writer(m3_path("c"))
+    ingestor = Ingestor(store, "c", cfg, cache=EmbeddingCache(str(tmp_path / "emb.sqlite3")), m3=writer)
+    ingestor._embedder, ingestor._heads = model, heads
+    docs = {"a.md": "orders list and filters", "b.md": "product stock levels", "c.md": "webhooks retry policy"}
+    paths = []
+    for name, text in docs.items():
+        (tmp_path / name).write_text(f"# {name}\n\n{text}\n")
+        paths.append(tmp_path / name)
+    m = Manifest(tmp_path / "manifest.json")
+    ingestor.apply_changes(m, *m.diff(paths, root=tmp_path))
+    publish(store, "c", m3=writer)
+
+    assert all(h.payload for h in store.scroll("c"))
+    assert len(get_m3_store("c")) == 3
+    sparse_hits = store.sparse_search("c", encode_m3(model, heads, ["stock levels"], batch_size=1)[0].sparse, top_k=3)
+    assert sparse_hits and sparse_hits[0].payload["source"].endswith("b.md")
+
+    monkeypatch.setattr(retriever, "get_vector_store", lambda: store)
+    monkeypatch.setattr(retriever, "get_embedder", lambda: model)
+    monkeypatch.setattr(retriever, "get_m3_heads", lambda: heads)
+    monkeypatch.setattr(retriever, "get_lexical_index", lambda collection: None)
+    first = retriever.search("product stock levels", top_k=3, collection="c", mode="m3")
+    rescored = retriever.search("product stock levels", top_k=2, collection="c", mode="m3", with_rerank=True)
+    assert len(rescored) == 2 and rescored[0]["source"].endswith("b.md") and rescored[0]["text"]
+    assert rescored[0]["score"] >= rescored[1]["score"] and {r["id"] for r in rescored} <= {r["id"] for r in first}
+
+    # an unchanged re-ingest takes sparse weights from the m3 store: nothing is encoded
+    ingestor.total_encoded = 0
+    calls = []
+    monkeypatch.setattr(model, "encode", lambda *a, **k: calls.append(a) or [])
+    (tmp_path / "c.md").unlink()
+    ingestor.apply_changes(m, *m.diff(paths[:2], root=tmp_path))
+    publish(store, "c", m3=writer)
+    assert calls == [] and len(get_m3_store("c")) == 2
+    assert sorted(h.payload["source"] for h in store.scroll("c")) == sorted(p.as_posix() for p in paths[:2])
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import asyncio
+from typing import Any, Dict, List
+
+import httpx
+import pytest
+from prometheus_client.parser import text_string_to_metric_families
+
+from app.metrics import REGISTRY, record_stage, stage, track_stages
+
+
+def _stage_count(name: str) -> float:
+    return REGISTRY.get_sample_value("rag_stage_seconds_count", {"stage": name}) or 0.0
+
+
+@pytest.mark.asyncio
+async def test_stage_breakdown_collects_from_child_tasks() -> None:
+    async def child() -> None:
+        with stage("vector_search"):
+            await asyncio.sleep(0.01)
+
+    before = _stage_count("vector_search")
+    with track_stages() as stages:
+        await asyncio.gather(asyncio.ensure_future(child()), asyncio.ensure_future(child()))
+        record_stage("pack", 0.002)
+    record_stage("pack", 1.0)  # outside: histogram only
+    assert set(stages) == {"vector_search", "pack"}
+    assert stages["vector_search"] >= 20 and stages["pack"] == 2.0
+    assert _stage_count("vector_search") == before + 2
+
+
+class DummyLLM:
+    async def acomplete(self, messages: List[Dict[str, Any]], **kwargs: Any) -> str:
+        return "ok"
+
+
+@pytest.mark.asyncio
+async def test_answer_meta_and_metrics_endpoint(monkeypatch: pytest.MonkeyPatch) -> None:
+    from app import main as main_mod
+
+    async def _search(**kwargs: Any) -> List[Dict[str, Any]]:
+        return [{"text": "слово " * 80, "score": 0.9, "source": "docs/a.md", "title": "A", "anchor": "#a"}]
+
+    monkeypatch.setattr(main_mod, "asearch", _search)
+    monkeypatch.setattr(main_mod, "get_llm", lambda: DummyLLM())
+    main_mod.get_query_cache().clear()
+
+    transport = httpx.ASGITransport(app=main_mod.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        r = await client.post("/answer", json={"query": "metrics please", "with_rerank": False})
+        assert set(r.json()["meta"]["stages_ms"]) == {"pack", "llm_total", "json_validation"}
+        text = (await client.get("/metrics")).text
+    families = {f.name: f for f in text_string_to_metric_families(text)}
+    assert families["rag_stage_seconds"].type == "histogram"
+    assert {s.labels["stage"] for s in families["rag_stage_seconds"].samples} >= {"pack", "llm_total"}
+    assert any(s.labels == {"cache": "query", "result": "miss"} for s in families["rag_cache_lookups"].samples)
+    assert [s.value for s in families["rag_jobs_pending"].samples] == [0.0]
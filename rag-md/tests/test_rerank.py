@@ -0,0 +1,90 @@
+from __future__ import annotations
+
+from typing import Any, List
+
+import pytest
+
+from app import rerank
+
+
+def test_rerank_depth_cuts_at_score_gap() -> None:
+    scores = [0.9, 0.85, 0.8, 0.5, 0.4, 0.3]
+    assert rerank.rerank_depth(scores, top_n=4, min_n=1, max_gap=1.0) == 4
+    assert rerank.rerank_depth(scores, top_n=6, min_n=1, max_gap=0.2) == 3
+    # the first min_n candidates are always reranked
+    assert rerank.rerank_depth(scores, top_n=6, min_n=5, max_gap=0.2) == 5
+    assert rerank.rerank_depth([], top_n=6, min_n=2, max_gap=0.2) == 0
+    # hybrid candidates only BM25 found carry no dense similarity and never cut the list
+    assert rerank.rerank_depth([0.9, None, 0.85, 0.5], top_n=4, min_n=1, max_gap=0.2) == 3
+
+
+class CountingReranker:
+    def __init__(self) -> None:
+        self.pairs: List[List[str]] = []
+
+    def predict(self, pairs: List[List[str]], **kwargs: Any) -> List[float]:
+        self.pairs.extend(pairs)
+        # longer passages score higher
+        return [len(p) / 10.0 for _, p in pairs]
+
+
+def _results(n: int) -> List[dict]:
+    return [
+        {"text": "x" * (i + 1), "score": 1.0 - i * 0.01, "source": "a.md", "anchor": f"#{i}"}
+        for i in range(n)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_rerank_head_only_with_score_cache(monkeypatch: pytest.MonkeyPatch) -> None:
+    rr = CountingReranker()
+    monkeypatch.setattr(rerank, "get_reranker", lambda: rr)
+    rerank.get_rerank_cache().clear()
+    rerank.get_rerank_batcher.cache_clear()
+    cfg = rerank.get_settings()
+    monkeypatch.setattr(cfg, "rerank_top_n", 4)
+    monkeypatch.setattr(cfg, "rerank_min_n", 2)
+
+    out = rerank.rerank("q", _results(6))
+    assert len(rr.pairs) == 4
+    # reranked head first (by new score), then the tail in retrieval order
+    assert [r["anchor"] for r in out] == ["#3", "#2", "#1", "#0", "#4", "#5"]
+    # the tail keeps its retrieval score apart from the reranker's
+    assert [r["score"] for r in out[4:]] == [None, None]
+    assert [r["retrieval_score"] for r in out[4:]] == [0.96, 0.95]
+
+    again = await rerank.arerank("Q ", _results(6))
+    assert len(rr.pairs) == 4  # same normalized query and chunks: served from cache
+    assert [r["score"] for r in again] == [r["score"] for r in out]
+    rerank.get_rerank_batcher.cache_clear()
+
+
+@pytest.mark.asyncio
+async def test_arerank_loads_the_model_off_the_event_loop(monkeypatch: pytest.MonkeyPatch) -> None:
+    import asyncio
+    import time
+
+    rr = CountingReranker()
+
+    def slow_load() -> CountingReranker:
+        time.sleep(0.2)  # first call: the CrossEncoder loads
+        return rr
+
+    monkeypatch.setattr(rerank, "get_reranker", slow_load)
+    rerank.get_rerank_cache().clear()
+    rerank.get_rerank_batcher.cache_clear()
+
+    ticks = []
+
+    async def ticker() -> None:
+        for _ in range(10):
+            t0 = time.perf_counter()
+            await asyncio.sleep(0.01)
+            ticks.append(time.perf_counter() - t0)
+
+    ticking = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    out = await rerank.arerank("q", _results(3))
+    await ticking
+    rerank.get_rerank_batcher.cache_clear()
+    assert len(out) == 3 and max(ticks) < 0.1
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Any
+
+import httpx
+import pytest
+
+from app.llm_client.router import Backend, LLMRouter, NoBackendAvailable
+
+
+class FakeServer:
+    """Stands in for one llama.cpp server."""
+
+    def __init__(self, name: str, delay: float = 0.01, fail: bool = False) -> None:
+        self.name, self.delay, self.fail = name, delay, fail
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+
+    async def acomplete(self, messages: Any, **kwargs: Any) -> str:
+        self.calls += 1
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                raise httpx.ConnectError("down")
+            return self.name
+        finally:
+            self.active -= 1
+
+    async def astream(self, messages: Any, **kwargs: Any):
+        yield await self.acomplete(messages)
+
+
+def _router(*servers: FakeServer, **kwargs: Any) -> LLMRouter:
+    backends = [Backend(s.name, s, max_concurrency=2) for s in servers]  # type: ignore[arg-type]
+    return LLMRouter(backends, health_interval_s=0, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_least_outstanding_spreads_load_within_caps() -> None:
+    a, b = FakeServer("a"), FakeServer("b")
+    router = _router(a, b)
+    out = await asyncio.gather(*(router.acomplete([]) for _ in range(8)))
+    assert sorted(out) == ["a"] * 4 + ["b"] * 4
+    assert a.peak <= 2 and b.peak <= 2
+    st = router.stats()["backends"]
+    assert st["a"]["completed"] == 4 and st["a"]["ewma_latency_ms"] > 0
+
+
+@pytest.mark.asyncio
+async def test_ewma_prefers_the_faster_backend() -> None:
+    fast, slow = FakeServer("fast", delay=0.005), FakeServer("slow", delay=0.05)
+    router = _router(fast, slow, strategy="ewma")
+    out = [await router.acomplete([]) for _ in range(6)]
+    # each backend is tried once to get a measurement, then the fast one wins
+    assert out[:2] == ["fast", "slow"] and out[2:] == ["fast"] * 4
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_fails_over_then_half_opens() -> None:
+    bad, good = FakeServer("bad", fail=True), FakeServer("good")
+    router = _router(bad, good, failure_threshold=2, cooldown_s=0.05)
+    router.backends[1].outstanding = 10  # make "bad" the preferred pick
+    assert [await router.acomplete([]) for _ in range(3)] == ["good"] * 3
+    assert bad.calls == 2  # opened after two consecutive failures
+    assert router.stats()["backends"]["bad"]["circuit"] == "open"
+
+    time.sleep(0.06)
+    bad.fail = False
+    assert await router.acomplete([]) == "bad"  # trial request closes the circuit
+    assert router.stats()["backends"]["bad"]["circuit"] == "closed"
+
+    bad.fail = good.fail = True
+    with pytest.raises(NoBackendAvailable):
+        await router.acomplete([])
+
+
+@pytest.mark.asyncio
+async def test_health_checks_take_backends_out_of_rotation() -> None:
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(503 if request.url.host == "a" else 200)
+
+    a, b = FakeServer("a"), FakeServer("b")
+    backends = [
+        Backend(s.name, s, health_url=f"http://{s.name}/health")  # type: ignore[arg-type]
+        for s in (a, b)
+    ]
+    router = LLMRouter(backends, health_interval_s=0,
+                       http=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    await router.check_health()
+    assert [await router.acomplete([]) for _ in range(3)] == ["b"] * 3
+    assert [p async for p in router.astream([])] == ["b"]
+    assert router.stats()["backends"]["a"]["healthy"] is False
+
+
+@pytest.mark.asyncio
+async def test_cancelled_or_abandoned_trial_does_not_wedge_half_open() -> None:
+    bad = FakeServer("bad", delay=0.2, fail=True)
+    router = _router(bad, failure_threshold=1, cooldown_s=0.0)
+    with pytest.raises(NoBackendAvailable):
+        await router.acomplete([])
+    assert router.backends[0].failures == 1
+
+    # the trial request is cancelled (client gone, timeout) before it answers
+    bad.fail = False
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(router.acomplete([]), 0.05)
+    assert router.stats()["backends"]["bad"]["circuit"] == "closed"
+
+    # a trial stream is closed by the caller after its first piece
+    stream = router.astream([])
+    assert await stream.__anext__() == "bad"
+    await stream.aclose()
+    assert router.stats()["backends"]["bad"]["circuit"] == "closed"
+
+    bad.delay = 0.0
+    assert await router.acomplete([]) == "bad"
+    assert router.backends[0].failures == 0
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import json
 import os
 
 import pytest
@@ -22,4 +23,108 @@ def test_qdrant_available() -> None:
 def test_embed_query() -> None:
     vec = embed_query("test query")
     assert isinstance(vec, list)
-    assert len(vec) == 1024 
\ No newline at end of file
+    assert len(vec) == 1024
+
+
+DOCS = [
+    ("00000000-0000-0000-0000-000000000001", "GET /entity/customerorder?expand=positions returns orders", {"source": "a.md"}),
+    ("00000000-0000-0000-0000-000000000002", "Отгрузки создаются запросом POST /entity/demand", {"source": "b.md"}),
+    ("00000000-0000-0000-0000-000000000003", "Создание отгрузок и заказов покупателей", {"source": "b.md"}),
+    ("00000000-0000-0000-0000-000000000004", "Unrelated text about authentication tokens", {"source": "c.md"}),
+]
+
+
+def test_lexical_index_roundtrip_and_filters(tmp_path) -> None:
+    from app.lexical import LexicalIndex, tokenize
+
+    assert tokenize("expand=positions /entity/demand Отгрузки") == ["expand", "positions", "entity", "demand", "отгруз"]
+    path = tmp_path / "api_docs.bm25"
+    LexicalIndex.build(DOCS).save(path)
+    index = LexicalIndex.load(path)
+    assert [pid for pid, _ in index.search("customerorder expand")] == [DOCS[0][0]]
+    # Russian inflections share a stem: "отгрузка" matches "Отгрузки" / "отгрузок"
+    assert {pid for pid, _ in index.search("создание отгрузка")} == {DOCS[1][0], DOCS[2][0]}
+    assert [pid for pid, _ in index.search("demand", filters={"source": "a.md"})] == []
+    assert index.search("nothing matches") == []
+
+
+def test_lexical_masks_cached_only_for_low_cardinality_fields(monkeypatch) -> None:
+    from app import lexical
+
+    monkeypatch.setattr(lexical, "_MASK_MAX_VALUES", 3)
+    docs = [(pid, text, {**payload, "n": i}) for i, (pid, text, payload) in enumerate(DOCS)]
+    index = lexical.LexicalIndex.build(docs)
+    assert [pid for pid, _ in index.search("demand", filters={"source": "b.md"})] == [DOCS[1][0]]
+    for i in range(len(DOCS)):
+        assert [pid for pid, _ in index.search("demand", filters={"n": i})] == ([DOCS[1][0]] if i == 1 else [])
+    assert list(index._masks) == [json.dumps(["source", "b.md"])]
+
+
+def test_hybrid_search_fuses_dense_and_lexical(monkeypatch) -> None:
+    import numpy as np
+    from qdrant_client.models import Distance, PointStruct, VectorParams
+
+    from app import retriever
+    from app.lexical import LexicalIndex, rrf_fuse
+    from app.vectorstore.qdrant import QdrantStore
+
+    assert rrf_fuse([["a", "b"], ["a"]])[0] == ("a", 1.0)
+
+    client = QdrantClient(":memory:")
+    client.create_collection("api_docs", VectorParams(size=2, distance=Distance.COSINE))
+    vectors = [[1.0, 0.0], [0.0, 1.0], [0.1, 1.0], [1.0, 0.1]]
+    client.upsert("api_docs", [PointStruct(id=pid, vector=v, payload={"text": t, **m}) for (pid, t, m), v in zip(DOCS, vectors)])
+
+    class Embedder:
+        prompts: dict = {}
+
+        def encode(self, texts, **kwargs):
+            return np.array([[0.0, 1.0]] * len(texts), dtype=np.float32)
+
+    index = LexicalIndex.build(DOCS)
+    monkeypatch.setattr(retriever, "get_vector_store", lambda: QdrantStore(client))
+    monkeypatch.setattr(retriever, "get_embedder", lambda: Embedder())
+    monkeypatch.setattr(retriever, "get_lexical_index", lambda collection: index)
+
+    dense = retriever.search("customerorder", top_k=2, mode="dense")
+    assert [r["source"] for r in dense] == ["b.md", "b.md"]
+    hybrid = retriever.search("customerorder", top_k=2, mode="hybrid")
+    # the exact identifier match is only found by BM25 but survives fusion, payload fetched from Qdrant
+    assert "GET /entity/customerorder?expand=positions returns orders" in [r["text"] for r in hybrid]
+    # fused results keep the dense leg's similarity; a BM25-only hit has none
+    assert {r["text"][:3]: r["dense_score"] is None for r in hybrid} == {"GET": True, "Отг": False}
+    filtered = retriever.search("customerorder", top_k=2, mode="hybrid", filters={"source": "b.md"})
+    assert {r["source"] for r in filtered} == {"b.md"}
+
+
+@pytest.mark.asyncio
+async def test_async_hybrid_runs_both_legs_concurrently(monkeypatch) -> None:
+    import asyncio
+    import time
+
+    import numpy as np
+
+    from app import retriever
+    from app.lexical import LexicalIndex
+    from app.vectorstore.base import Hit
+
+    index = LexicalIndex.build(DOCS)
+
+    def slow_index(collection):
+        time.sleep(0.1)  # blocking, like loading the index from disk
+        return index
+
+    class Store:
+        async def asearch(self, collection, vector, **kwargs):
+            await asyncio.sleep(0.1)
+            return [Hit(id=DOCS[1][0], score=0.9, payload={"text": DOCS[1][1], **DOCS[1][2]})]
+
+        async def aretrieve(self, collection, ids, **kwargs):
+            return [Hit(id=pid, score=0.0, payload={"text": t, **m}) for pid, t, m in DOCS if pid in ids]
+
+    monkeypatch.setattr(retriever, "get_vector_store", lambda: Store())
+    monkeypatch.setattr(retriever, "get_lexical_index", slow_index)
+    t0 = time.perf_counter()
+    out = await retriever.asearch("customerorder", top_k=2, mode="hybrid", query_vector=list(np.ones(2)))
+    assert time.perf_counter() - t0 < 0.18
+    assert {r["source"] for r in out} == {"a.md", "b.md"}
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient
+
+from app.vectorstore.base import Point
+from app.vectorstore.local import LocalVectorStore
+from app.vectorstore.qdrant import QdrantStore
+
+
+def _points(n: int = 300, dim: int = 16, seed: int = 0) -> list:
+    rnd = np.random.default_rng(seed)
+    vectors = rnd.normal(size=(n, dim)).astype(np.float32)
+    return [
+        Point(
+            id=f"00000000-0000-0000-0000-{i:012d}",
+            vector=vectors[i],
+            payload={"text": f"chunk {i} – текст", "source": f"doc{i % 7}.md", "anchor": f"#a{i}", "token_count": i},
+        )
+        for i in range(n)
+    ]
+
+
+def _local(tmp_path: Path, points: list, dtype: str = "float16") -> LocalVectorStore:
+    store = LocalVectorStore(tmp_path, dtype=dtype)
+    store.ensure_collection("c", len(points[0].vector))
+    store.upsert("c", points)
+    store.flush("c")
+    return store
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_local_search_matches_qdrant(tmp_path: Path, dtype: str) -> None:
+    points = _points()
+    qdrant = QdrantStore(QdrantClient(":memory:"))
+    qdrant.ensure_collection("c", 16)
+    qdrant.upsert("c", points)
+    local = _local(tmp_path, points, dtype)
+    query = np.random.default_rng(1).normal(size=16)
+
+    for filters in (None, {"source": "doc3.md"}, {"source": "doc3.md", "token_count": 10}):
+        expected = qdrant.search("c", query, top_k=10, filters=filters)
+        got = local.search("c", query, top_k=10, filters=filters)
+        # quantization may swap near-ties, never the set of clear winners
+        assert len(got) == len(expected)
+        assert len({h.id for h in got} & {h.id for h in expected}) >= len(expected) - 1
+        assert got[0].id == expected[0].id
+        assert [h.payload for h in got[:1]] == [expected[0].payload]
+        assert abs(got[0].score - expected[0].score) < 0.02
+        scores = [h.score for h in got]
+        assert scores == sorted(scores, reverse=True)
+
+
+def test_local_filters_and_retrieve(tmp_path: Path) -> None:
+    points = _points()
+    store = _local(tmp_path, points)
+    query = points[5].vector
+
+    hits = store.search("c", query, top_k=5, filters={"source": "doc5.md"})
+    assert hits[0].id == points[5].id and {h.payload["source"] for h in hits} == {"doc5.md"}
+    # high-cardinality field (no precomputed bitmask), unknown value, int vs str
+    assert [h.id for h in store.search("c", query, top_k=5, filters={"anchor": "#a17"})] == [points[17].id]
+    assert store.search("c", query, top_k=5, filters={"source": "missing.md"}) == []
+    assert store.search("c", query, top_k=5, filters={"token_count": "5"}) == []
+
+    got = store.retrieve("c", [points[3].id, "nope"])
+    assert [h.id for h in got] == [points[3].id] and got[0].payload == points[3].payload
+
+
+def test_local_writes_visible_after_flush(tmp_path: Path) -> None:
+    points = _points(20)
+    store = _local(tmp_path, points)
+    reader = LocalVectorStore(tmp_path)  # e.g. the API process
+    assert len(reader.collection("c")) == 20
+
+    store.delete_sources("c", ["doc0.md"], keep_ids=[points[0].id])
+    store.upsert("c", [Point(id="new", vector=points[1].vector, payload={"text": "new", "source": "n.md"})])
+    assert len(reader.collection("c")) == 20
+    store.flush("c")
+    assert len(reader.collection("c")) == 20 - 2 + 1
+    assert reader.search("c", points[1].vector, top_k=2)[0].id in {"new", points[1].id}
+
+    # a fresh writer picks up the flushed file
+    again = LocalVectorStore(tmp_path)
+    assert {h.id for h in again.scroll("c", fields=["source"])} == {h.id for h in reader.scroll("c")}
+    with pytest.raises(ValueError):
+        again.ensure_collection("c", 8)
+    again.ensure_collection("c", 8, recreate=True)
+    again.flush("c")
+    assert reader.search("c", np.ones(8), top_k=3) == []
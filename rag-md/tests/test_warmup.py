@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import subprocess
+import sys
+from typing import Any, Iterator, List
+
+import httpx
+import pytest
+
+from app import main as main_mod
+from app import warmup
+from app.warmup import READINESS, warm_up
+
+
+@pytest.fixture(autouse=True)
+def _fresh_readiness() -> Iterator[None]:
+    READINESS.ready, READINESS.error = False, None
+    READINESS.timings_ms.clear()
+    yield
+    READINESS.ready, READINESS.error = False, None
+    READINESS.timings_ms.clear()
+
+
+class FakeStore:
+    def __init__(self, failures: int = 0) -> None:
+        self.failures = failures
+        self.calls = 0
+
+    async def aopen(self, collection: str) -> None:
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("refused")
+
+
+def _fake_backends(monkeypatch: pytest.MonkeyPatch, store: FakeStore) -> List[int]:
+    encoded: List[int] = []
+    monkeypatch.setattr(warmup, "get_embedder", lambda: object())
+    monkeypatch.setattr(warmup, "encode_queries", lambda qs: encoded.append(len(qs)) or [[0.0]] * len(qs))
+    monkeypatch.setattr(warmup, "get_reranker", lambda: object())
+    monkeypatch.setattr(warmup, "score_pairs", lambda pairs: encoded.append(-len(pairs)) or [0.5] * len(pairs))
+    monkeypatch.setattr(warmup, "get_vector_store", lambda: store)
+    monkeypatch.setattr(warmup, "get_llm", lambda: (_ for _ in ()).throw(RuntimeError("no llm")))
+    monkeypatch.setattr(warmup, "_load_lexical", lambda: None)
+    return encoded
+
+
+async def _get_ready() -> httpx.Response:
+    transport = httpx.ASGITransport(app=main_mod.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.get("/ready")
+
+
+@pytest.mark.asyncio
+async def test_ready_flips_after_warm_up(monkeypatch: pytest.MonkeyPatch) -> None:
+    encoded = _fake_backends(monkeypatch, FakeStore())
+
+    assert (await _get_ready()).status_code == 503
+    await warm_up()
+    resp = await _get_ready()
+
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["ready"] is True and body["error"] is None
+    assert {"embedder", "reranker", "vector_store", "llm", "total"} <= set(body["timings_ms"])
+    cfg = main_mod.get_settings()
+    # warm-up ran the real batch shapes: single query and a full micro-batch
+    assert sorted(n for n in encoded if n > 0) == sorted({1, cfg.embed_batch_max_size})
+    assert -cfg.rerank_top_n in encoded
+
+
+@pytest.mark.asyncio
+async def test_model_load_failure_keeps_instance_unready(monkeypatch: pytest.MonkeyPatch) -> None:
+    _fake_backends(monkeypatch, FakeStore())
+
+    def broken() -> Any:
+        raise OSError("model not found")
+
+    monkeypatch.setattr(warmup, "get_embedder", broken)
+    await warm_up()
+    resp = await _get_ready()
+
+    assert resp.status_code == 503
+    assert "model not found" in resp.json()["error"]
+
+
+@pytest.mark.asyncio
+async def test_waits_for_vector_store(monkeypatch: pytest.MonkeyPatch) -> None:
+    store = FakeStore(failures=2)
+    _fake_backends(monkeypatch, store)
+    monkeypatch.setattr(warmup, "STORE_RETRY_S", 0.0)
+
+    await warm_up()
+
+    assert READINESS.ready and store.calls == 3
+
+
+@pytest.mark.asyncio
+async def test_lifespan_without_warm_up_is_ready(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(main_mod.get_settings(), "warmup_enabled", False)
+    async with main_mod.lifespan(main_mod.app):
+        assert (await _get_ready()).status_code == 200
+
+
+def test_import_does_not_load_torch() -> None:
+    code = "import sys, app.main; print('sentence_transformers' in sys.modules, 'torch' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.split() == ["False", "False"]